@@ -75,6 +75,8 @@ with specific groups.
   * ``fun`` - mandatory, execution function to run and parse output for
   * ``arg`` - list of arguments to pass to execution function
   * ``kwarg`` - dictionary of key word arguments to pass to execution function
+  * ``concurrent`` - boolean, if True input function can run in parallel with
+    other concurrent inputs, default is False
 
 TTP variables
 -------------
@@ -84,6 +86,13 @@ by various functions. These template variables are added to parser object automa
 
  * ``_minion_id_`` - contains id of proxy minion from ``__opts__["id"]`` variable
 
+Performance and delivery options
+--------------------------------
+Concurrent inputs, compiled templates, parsing results and commands output
+caches, isolated parsing, ``elasticsearch_bulk`` and ``salt_returner``
+returners, failed deliveries spool, asynchronous delivery, timing and
+profiling described in :doc:`/topics/execution-module` documentation.
+
 TTP Custom functions
 --------------------
 TTP supports capability to add custom function to parser object for the sake
@@ -136,9 +145,22 @@ Sample template:
     </output>
 """
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-import salt.utils.json
+import salt.loader
 from salt.exceptions import CommandExecutionError
+from saltext.ttp.utils import cache as ttp_cache
+from saltext.ttp.utils import delivery as ttp_delivery
+from saltext.ttp.utils import elasticsearch as ttp_elasticsearch
+from saltext.ttp.utils import profile as ttp_profile
+from saltext.ttp.utils import returner as ttp_returner
+from saltext.ttp.utils import spool as ttp_spool
+from saltext.ttp.utils import template_profile as ttp_template_profile
+from saltext.ttp.utils import text as ttp_text
+from saltext.ttp.utils import timing as ttp_timing
+from saltext.ttp.utils.pool import IsolatedParser
+from saltext.ttp.utils.stream import StreamParser
 
 try:
     from ttp import ttp
@@ -152,6 +174,10 @@ log = logging.getLogger(__name__)
 __virtualname__ = "ttp"
 __proxyenabled__ = ["*"]
 
+_TEMPLATE_CACHE = ttp_cache.TemplateCache()
+_RETURNERS = None
+_OUTPUTS_CACHE = None
+
 
 def __virtual__():
     """
@@ -167,37 +193,61 @@ def __virtual__():
 # -----------------------------------------------------------------------------
 
 
+def _get_returners():
+    """
+    Helper function to return SALT returners loader, creating it on first use.
+    """
+    global _RETURNERS  # pylint: disable=global-statement
+    if _RETURNERS is None:
+        _RETURNERS = salt.loader.returners(__opts__, __salt__)
+    return _RETURNERS
+
+
+def _get_outputs_cache():
+    """
+    Helper function to return commands output cache, creating it on first use.
+    """
+    global _OUTPUTS_CACHE  # pylint: disable=global-statement
+    if _OUTPUTS_CACHE is None:
+        _OUTPUTS_CACHE = ttp_cache.OutputsCache(__opts__)
+    return _OUTPUTS_CACHE
+
+
+@ttp_timing.timed("returners")
 def _elasticsearch_return(data, **kwargs):
     """
     Custom TTP returner function to return results to elasticsearch
     using SALT elasticsearch execution module.
     """
+    if ttp_delivery.queue_delivery(__opts__, _elasticsearch_return, data, kwargs):
+        return
+    spool = ttp_spool.get_spool(__opts__) if kwargs.pop("spool", True) else None
+    ttp_elasticsearch.create_documents(data, __salt__, spool=spool, **kwargs)
 
-    def post_to_elk(data):
-        elc_kwargs["body"] = data
-        post_result = __salt__["elasticsearch.document_create"](**elc_kwargs)
-        log.debug("TTP elasticsearch returner, server response: '%s'", post_result)
 
-    elc_kwargs = {
-        "doc_type": kwargs.get("doc_type", "default"),
-        "index": kwargs.get("index", "salt_ttp_mod"),
-    }
-    # handle per_input case
-    if isinstance(data, list):
-        # iterate over template's inputs results
-        for input_res in data:
-            # happens if _anonymous_ group in template
-            if isinstance(input_res, list):
-                # iterate over results within input
-                for i in input_res:
-                    if isinstance(i, dict):
-                        post_to_elk(salt.utils.json.dumps(i))
-            # handle normal named groups case
-            elif isinstance(input_res, dict):
-                post_to_elk(salt.utils.json.dumps(input_res))
-    # handle per_template case
-    elif isinstance(data, dict):
-        post_to_elk(salt.utils.json.dumps(data))
+@ttp_timing.timed("returners")
+def _elasticsearch_bulk_return(data, **kwargs):
+    """
+    Custom TTP returner function to return results to elasticsearch
+    in batches using ``_bulk`` API.
+    """
+    if ttp_delivery.queue_delivery(__opts__, _elasticsearch_bulk_return, data, kwargs):
+        return None
+    spool = ttp_spool.get_spool(__opts__) if kwargs.pop("spool", True) else None
+    return ttp_elasticsearch.bulk_index(
+        data, __salt__["config.get"]("elasticsearch", {}), opts=__opts__, spool=spool, **kwargs
+    )
+
+
+@ttp_timing.timed("returners")
+def _salt_return(data, **kwargs):
+    """
+    Custom TTP returner function to return results to SALT returner
+    in batches of records.
+    """
+    if ttp_delivery.queue_delivery(__opts__, _salt_return, data, kwargs):
+        return None
+    return ttp_returner.batch_return(data, _get_returners(), __opts__["id"], __opts__, **kwargs)
 
 
 # -----------------------------------------------------------------------------
@@ -210,38 +260,243 @@ def _get_text_from_run_result(run_results, function_name=None):
     Helper function to extract text from command run results.
     Returns list of text items, one item per device
     """
-    results_data = []
-    proxytype = __pillar__.get("proxy", {}).get("proxytype", None)
-    if function_name == "net.cli":
-        # run_results structure is:
-        # {"out": {command1: "result1", command2: "result2"}}
-        results_data.append("")
-        for command, output in run_results["out"].items():
-            results_data[-1] += "\n{}#{}\n{}".format(__opts__["id"], command, output)
-    elif function_name == "nr.cli":
-        # run_results structure is: {'hostname': {'command1': 'output1'}}
-        for hostname, commands in run_results.items():
-            results_data.append("")
-            for command, output in commands.items():
-                results_data[-1] += "\n{}#{}\n{}".format(hostname, command, output)
-    elif function_name == "mine.get":
-        if proxytype == "napalm":
-            fun_name = "net.cli"
-        elif proxytype == "nornir":
-            fun_name = "nr.cli"
-        for output in run_results.values():
-            results_data += _get_text_from_run_result(output, function_name=fun_name)
-    elif isinstance(run_results, str):
-        results_data.append(run_results)
-    elif isinstance(run_results, list):
-        # concatenate list of string items if any
-        temp = "\n{}".join([i for i in run_results if isinstance(i, str)])
-        if temp:
-            results_data.append(temp)
-    if results_data:
-        return results_data
-    else:
-        return [run_results]
+    return ttp_text.get_text_from_run_result(
+        run_results,
+        __opts__["id"],
+        function_name=function_name,
+        proxytype=__pillar__.get("proxy", {}).get("proxytype", None),
+    )
+
+
+def _get_compiled_template(template, saltenv, vars_to_share, use_cache, timer=None):
+    """
+    Helper function to load TTP template in parser object, reusing compiled
+    template from in-process cache if template file hash did not change.
+    Returns a tuple of (cache key, CompiledTemplate object), cache key is
+    None if compiled template should not be cached.
+    """
+    timer = timer or ttp_timing.Timer()
+    cache_key = None
+    if use_cache:
+        _TEMPLATE_CACHE.maxsize = __opts__.get("ttp_template_cache_size", 64)
+        _TEMPLATE_CACHE.ttl = __opts__.get("ttp_template_cache_ttl", 3600)
+        with timer.stage("fetch"):
+            file_hash = __salt__["cp.hash_file"](template, saltenv=saltenv)
+        if file_hash and _TEMPLATE_CACHE.maxsize:
+            cache_key = ttp_cache.make_key(template, saltenv, file_hash["hsum"], vars_to_share)
+            compiled = _TEMPLATE_CACHE.checkout(cache_key)
+            if compiled:
+                return cache_key, compiled
+    # create TTP parser
+    parser = ttp(vars=vars_to_share)
+    # add custom functions
+    parser.add_function(_elasticsearch_return, scope="returners", name="elasticsearch")
+    parser.add_function(_elasticsearch_bulk_return, scope="returners", name="elasticsearch_bulk")
+    parser.add_function(_salt_return, scope="returners", name="salt_returner")
+    # get ttp template
+    with timer.stage("fetch"):
+        template_text = __salt__["cp.get_file_str"](template, saltenv=saltenv)
+    if not template_text:
+        raise CommandExecutionError("Failed to get TTP template '{}'".format(template))
+    try:
+        with timer.stage("add_template"):
+            parser.add_template(template_text)
+    except Exception as exc:  # pylint: disable=broad-except
+        raise CommandExecutionError(
+            "Failed to load TTP template '{}': {}".format(template, exc)
+        ) from exc
+    return cache_key, ttp_cache.CompiledTemplate(parser, template_text)
+
+
+def _get_results_cache():
+    """
+    Helper function to create parsing results cache object.
+    """
+    return ttp_cache.ResultsCache(
+        __opts__,
+        maxsize=__opts__.get("ttp_results_cache_size", 1024),
+        ttl=__opts__.get("ttp_results_cache_ttl", 86400),
+    )
+
+
+def _profile_run(function, args, kwargs):
+    """
+    Helper function to run function under profiler, returns function results
+    together with profiling summary.
+    """
+    template = kwargs.get("template") or args[0]
+    ret, profile = ttp_profile.profile_call(
+        function,
+        args,
+        kwargs,
+        ttp_profile.get_profile_path(__opts__, template),
+        top=__opts__.get("ttp_profile_top", 20),
+        keep=__opts__.get("ttp_profile_keep", 10),
+    )
+    isolate = kwargs.get("isolate", __opts__.get("ttp_isolate", False))
+    if kwargs.get("timing") or (isolate and kwargs.get("partial")):
+        return dict(ret, profile=profile)
+    return {"results": ret, "profile": profile}
+
+
+def _fire_timing_event(template, timing):
+    """
+    Helper function to send run timings to master event bus.
+    """
+    try:
+        __salt__["event.send"]("ttp/run/timing", {"template": template, "timing": timing})
+    except Exception as exc:  # pylint: disable=broad-except
+        log.error("TTP failed to send timing event: %s", exc)
+
+
+def _timed_call(function, args, kwargs):
+    """
+    Helper function to call function, returns a tuple of (output, latency).
+    """
+    start = time.perf_counter()
+    output = function(*args, **kwargs)
+    return output, time.perf_counter() - start
+
+
+def _cached_call(function_name, args, kwargs, cache_ttl=0, function=None):
+    """
+    Helper function to call function reusing its output from commands output
+    cache if it was saved within ``cache_ttl`` seconds. Returns a tuple of
+    (output, latency). ``function`` is the function to call, looked up in
+    ``__salt__`` by ``function_name`` if not given.
+    """
+    function = function or __salt__[function_name]
+    if not cache_ttl:
+        return _timed_call(function, args, kwargs)
+    outputs_cache = _get_outputs_cache()
+    key = ttp_cache.make_output_key(function_name, args, kwargs)
+    start = time.perf_counter()
+    output = outputs_cache.fetch(key, float(cache_ttl))
+    if output is not None:
+        return output, time.perf_counter() - start
+    output, latency = _timed_call(function, args, kwargs)
+    if output is not None:
+        outputs_cache.store(key, output)
+    return output, latency
+
+
+def _run_inputs(input_load, max_workers=1, cache_ttl=0, outputs=None):
+    """
+    Helper function to run template inputs' functions. Inputs with ``concurrent``
+    parameter set to True run in a pool of ``max_workers`` threads, after all
+    other inputs ran one after another. Inputs without ``cache_ttl`` parameter
+    use ``cache_ttl`` argument. Inputs that run the same function with the same
+    arguments share single function call output, ``outputs`` is a dictionary of
+    (output, latency) tuples keyed by ``make_output_key`` of functions that
+    already ran. Returns a list of
+    (template_name, input_name, function_name, output, latency) tuples in template order.
+    """
+    inputs = [
+        (template_name, input_name, input_params)
+        for template_name, template_inputs in input_load.items()
+        for input_name, input_params in template_inputs.items()
+        if input_params.get("fun")
+    ]
+    outputs = {} if outputs is None else outputs
+    keys = [
+        ttp_cache.make_output_key(
+            input_params["fun"], input_params.get("arg", []), input_params.get("kwarg", {})
+        )
+        for _, _, input_params in inputs
+    ]
+    # run each function once, as concurrent only if all inputs running it are concurrent,
+    # reusing cached output only if it is fresh enough for all of them
+    to_run = {}
+    for key, (_, _, input_params) in zip(keys, inputs):
+        if key in outputs:
+            continue
+        ttl = input_params.get("cache_ttl", cache_ttl)
+        concurrent = input_params.get("concurrent") is True
+        if key in to_run:
+            params, run_ttl, run_concurrent = to_run[key]
+            to_run[key] = (params, min(run_ttl, ttl), run_concurrent and concurrent)
+        else:
+            to_run[key] = (input_params, ttl, concurrent)
+    if int(max_workers) <= 1 or __opts__.get("ttp_serial_inputs", False):
+        to_run = {key: (params, ttl, False) for key, (params, ttl, _) in to_run.items()}
+    # run serial inputs first, so that they never overlap with other inputs
+    for key, (input_params, ttl, concurrent) in to_run.items():
+        if not concurrent:
+            outputs[key] = _cached_call(
+                input_params["fun"],
+                input_params.get("arg", []),
+                input_params.get("kwarg", {}),
+                ttl,
+            )
+    concurrent = [key for key, item in to_run.items() if item[2]]
+    if concurrent:
+        if any(to_run[key][1] for key in concurrent):
+            # create outputs cache once, before threads race to create it
+            _get_outputs_cache()
+        with ThreadPoolExecutor(max_workers=min(int(max_workers), len(concurrent))) as executor:
+            # executor threads may not see SALT loader context that __salt__
+            # resolved from, look functions up in this thread and pass them over
+            futures = {
+                key: executor.submit(
+                    _cached_call,
+                    to_run[key][0]["fun"],
+                    to_run[key][0].get("arg", []),
+                    to_run[key][0].get("kwarg", {}),
+                    to_run[key][1],
+                    __salt__[to_run[key][0]["fun"]],
+                )
+                for key in concurrent
+            }
+            for key, future in futures.items():
+                outputs[key] = future.result()
+    return [
+        (template_name, input_name, input_params["fun"]) + outputs[key]
+        for key, (template_name, input_name, input_params) in zip(keys, inputs)
+    ]
+
+
+def _collect_inputs_data(
+    input_load,
+    function=None,
+    arguments=(),
+    function_kwargs=None,
+    max_workers=1,
+    timer=None,
+    cache_ttl=0,
+):
+    """
+    Helper function to run inline command, associated with default inputs of
+    all templates, and template inputs' commands. Returns a list of
+    (template_name, input_name, text items) tuples.
+    """
+    timer = timer or ttp_timing.Timer()
+    ret = []
+    outputs = {}
+    # get command output from minion if any
+    if function:
+        with timer.stage("commands"):
+            output, latency = _cached_call(
+                function, list(arguments), function_kwargs or {}, cache_ttl
+            )
+        # inputs running the same command reuse inline command output
+        key = ttp_cache.make_output_key(function, arguments, function_kwargs or {})
+        outputs[key] = (output, latency)
+        with timer.stage("text"):
+            default_input_data = _get_text_from_run_result(output, function_name=function)
+        for template_name in input_load:
+            timer.record_input(
+                template_name, "Default_Input", function, latency, default_input_data
+            )
+            ret.append((template_name, "Default_Input", default_input_data))
+    # run inputs if any
+    with timer.stage("commands"):
+        inputs_outputs = _run_inputs(input_load, max_workers, cache_ttl, outputs)
+    for template_name, input_name, function_name, output, latency in inputs_outputs:
+        with timer.stage("text"):
+            outputs_list = _get_text_from_run_result(output, function_name=function_name)
+        timer.record_input(template_name, input_name, function_name, latency, outputs_list)
+        ret.append((template_name, input_name, outputs_list))
+    return ret
 
 
 # -----------------------------------------------------------------------------
@@ -260,6 +515,27 @@ def run(*args, **kwargs):
     :param vars: dictionary of template variables to pass on to TTP parser
     :param ttp_res_kwargs: arguments to use with
         `TTP result method <https://ttp.readthedocs.io/en/latest/API%20reference.html#ttp.ttp.result>`_
+    :param template_cache: boolean, if True (default) reuse compiled template from
+        in-process cache, refer to :ref:`ttp-module-compiled-templates-cache` for details
+    :param max_workers: number of threads to run inputs marked as ``concurrent`` with,
+        default is 1 - run all inputs one after another, refer to
+        :ref:`ttp-module-concurrent-inputs` for details
+    :param results_cache: boolean, if True reuse parsing results of previously parsed
+        text, refer to :ref:`ttp-module-parsing-results-cache` for details
+    :param timing: boolean, if True return results together with run stages timings,
+        refer to :ref:`ttp-module-timing` for details
+    :param profile: boolean, if True profile the run and return results together with
+        profiling summary, refer to :ref:`ttp-module-profiling` for details
+    :param isolate: boolean, if True parse data in a separate process within
+        ``parse_timeout``, refer to :ref:`ttp-module-isolated-parsing` for details
+    :param parse_timeout: number of seconds isolated parsing should finish within, default is 60
+    :param parse_memory_limit: isolated parsing process memory limit in MBytes, default
+        is 0 - no limit
+    :param partial: boolean, if True return results of data items parsed successfully
+        together with parsing errors instead of failing the run, used with ``isolate``
+    :param cache_ttl: number of seconds to reuse cached output of inline command and of
+        inputs without ``cache_ttl`` parameter for, refer to
+        :ref:`ttp-module-commands-output-cache` for details
 
     Sample TTP template to use with inline command:
 
@@ -306,7 +582,10 @@ def run(*args, **kwargs):
         salt minion-2 ttp.run net.cli "show version" template='salt://ttp/version.txt'
         salt minion-2 ttp.run net.cli "show version" template='salt://ttp/version.txt' vars='{"var1": "val1", "a": "b"}'
     """
+    if kwargs.pop("profile", False):
+        return _profile_run(run, args, kwargs)
     function = None
+    arguments = []
     # get arguments
     if "template" in kwargs:
         template = kwargs.pop("template")
@@ -318,54 +597,243 @@ def run(*args, **kwargs):
     vars_to_share = kwargs.pop("vars", {})
     vars_to_share["_minion_id_"] = __opts__["id"]
     ttp_res_kwargs = kwargs.pop("ttp_res_kwargs", {})
+    use_cache = kwargs.pop("template_cache", True)
+    max_workers = kwargs.pop("max_workers", __opts__.get("ttp_max_workers", 1))
+    use_results_cache = kwargs.pop("results_cache", __opts__.get("ttp_results_cache", False))
+    timer = ttp_timing.Timer(enabled=kwargs.pop("timing", False))
+    isolate = kwargs.pop("isolate", __opts__.get("ttp_isolate", False))
+    parse_timeout = kwargs.pop("parse_timeout", __opts__.get("ttp_parse_timeout", 60))
+    parse_memory_limit = kwargs.pop("parse_memory_limit", __opts__.get("ttp_parse_memory_limit", 0))
+    partial = kwargs.pop("partial", False)
+    cache_ttl = kwargs.pop("cache_ttl", __opts__.get("ttp_outputs_cache_ttl", 0))
     function_kwargs = {k: v for k, v in kwargs.items() if not k.startswith("_")}
-    # create TTP parser
-    parser = ttp(vars=vars_to_share)
-    # add custom functions
-    parser.add_function(_elasticsearch_return, scope="returners", name="elasticsearch")
-    # get ttp template
-    template_text = __salt__["cp.get_file_str"](template, saltenv=kwargs.pop("saltenv", "base"))
-    if not template_text:
-        raise CommandExecutionError("Failed to get TTP template '{}'".format(template))
+    # get TTP parser with template loaded
+    cache_key, compiled = _get_compiled_template(
+        template, kwargs.pop("saltenv", "base"), vars_to_share, use_cache, timer
+    )
+    parser = compiled.parser
+    # parse data items one by one looking up their results in results cache
+    results_cache = None
+    cache_prefix = ""
+    stream_parser = None
+    if use_results_cache:
+        results_cache = _get_results_cache()
+        cache_prefix = ttp_cache.make_results_prefix(compiled.text, vars_to_share)
+        stream_parser = StreamParser(parser, results_cache, cache_prefix)
+    # parse data items in a separate process within the deadline
+    if isolate:
+        stream_parser = IsolatedParser(
+            parser,
+            compiled.text,
+            parse_timeout,
+            parse_memory_limit,
+            partial,
+            results_cache,
+            cache_prefix,
+        )
+    # get inputs load
+    input_load = parser.get_input_load()
+    input_load = input_load if input_load else {"_root_template_": {"Default_Input": {}}}
+    # run inline command and inputs' commands and add their output to parser
+    for template_name, input_name, items in _collect_inputs_data(
+        input_load, function, arguments, function_kwargs, max_workers, timer, cache_ttl
+    ):
+        with timer.stage("add_input"):
+            for item in items:
+                (stream_parser or parser).add_input(
+                    data=item, template_name=template_name, input_name=input_name
+                )
+    # parse data
     try:
-        parser.add_template(template_text)
+        with timer.stage("parse"):
+            if stream_parser:
+                stream_parser.finish()
+            else:
+                parser.parse(one=True)
+            ret = parser.result(**ttp_res_kwargs)
     except Exception as exc:  # pylint: disable=broad-except
         raise CommandExecutionError(
-            "Failed to load TTP template '{}': {}".format(template, exc)
+            "Failed to parse output with TTP template '{}': {}".format(template, exc)
         ) from exc
-    # get inputs load
-    input_load = parser.get_input_load()
-    input_load = (
-        input_load
-        if input_load.get("_root_template_")
-        else {"_root_template_": {"Default_Input": {}}}
+    if results_cache:
+        results_cache.commit()
+    if cache_key:
+        _TEMPLATE_CACHE.checkin(cache_key, compiled)
+    # job processes exit straight after the job without running interpreter
+    # exit handlers, losing deliveries left in the queue
+    if __opts__.get("multiprocessing", True):
+        ttp_delivery.drain()
+    ret = {"results": ret} if timer.enabled or (isolate and partial) else ret
+    if isolate and partial:
+        ret["errors"] = stream_parser.errors
+    if timer.enabled:
+        ret["timing"] = timer.report()
+        _fire_timing_event(template, ret["timing"])
+    return ret
+
+
+def profile_template(*args, **kwargs):
+    """
+    Function to profile TTP template, reporting time spent and number of matches
+    for each group, regular expression and match function, refer to
+    :ref:`ttp-module-template-profiling` for details.
+
+    :param template: path to TTP template
+    :param data: text or list of texts to parse with each of template inputs, if not given,
+        text collected running inline command and inputs' commands same way as ``ttp.run`` does
+    :param saltenv: name of SALT environment
+    :param vars: dictionary of template variables to pass on to TTP parser
+    :param max_workers: number of threads to run inputs marked as ``concurrent`` with
+    :param slow_threshold: number of seconds per MByte of scanned text to flag regex
+        as slow, default is 0.1
+
+    CLI Examples:
+
+    .. code-block: text
+
+        salt minion-2 ttp.profile_template 'salt://ttp/subifs_and_arp.txt'
+        salt minion-2 ttp.profile_template net.cli "show run" template='salt://ttp/interfaces.txt'
+        salt minion-2 ttp.profile_template template='salt://ttp/interfaces.txt' data='interface Gi1'
+    """
+    function = None
+    arguments = []
+    if "template" in kwargs:
+        template = kwargs.pop("template")
+        if args:
+            arguments = list(args)
+            function = arguments.pop(0)
+    else:
+        template = args[0]
+    data = kwargs.pop("data", None)
+    vars_to_share = kwargs.pop("vars", {})
+    vars_to_share["_minion_id_"] = __opts__["id"]
+    max_workers = kwargs.pop("max_workers", __opts__.get("ttp_max_workers", 1))
+    slow_threshold = kwargs.pop("slow_threshold", 0.1)
+    # instrumentation modifies parser, never use cached compiled template
+    _, compiled = _get_compiled_template(
+        template, kwargs.pop("saltenv", "base"), vars_to_share, use_cache=False
     )
-    # get command output from minion if any
-    if function:
-        output = __salt__[function](*arguments, **function_kwargs)
-        default_input_data = _get_text_from_run_result(output, function_name=function)
-        for template_name, template_inputs in input_load.items():
-            for i in default_input_data:
-                parser.add_input(data=i, template_name=template_name)
-    # run inputs if any
-    for template_name, template_inputs in input_load.items():
-        for inpt_name, input_params in template_inputs.items():
-            if not input_params.get("fun"):
-                continue
-            function = input_params["fun"]
-            fun_arg = input_params.get("arg", [])
-            fun_kwarg = input_params.get("kwarg", {})
-            # get output from minion
-            output = __salt__[function](*fun_arg, **fun_kwarg)
-            outputs_list = _get_text_from_run_result(output, function_name=function)
-            for item in outputs_list:
-                parser.add_input(data=item, template_name=template_name, input_name=inpt_name)
-    # parse data
+    parser = compiled.parser
+    profiler = ttp_template_profile.TemplateProfiler(parser, slow_threshold)
+    function_kwargs = {k: v for k, v in kwargs.items() if not k.startswith("_")}
+    input_load = parser.get_input_load()
+    if data is not None:
+        # parse the same text with each input of each template
+        inputs_data = [
+            (template_name, input_name, data if isinstance(data, list) else [data])
+            for template_name, inputs in (input_load or {"_root_template_": {}}).items()
+            for input_name in inputs or ["Default_Input"]
+        ]
+    else:
+        inputs_data = _collect_inputs_data(
+            input_load if input_load else {"_root_template_": {"Default_Input": {}}},
+            function,
+            arguments,
+            function_kwargs,
+            max_workers,
+        )
+    for template_name, input_name, items in inputs_data:
+        for item in items:
+            parser.add_input(data=item, template_name=template_name, input_name=input_name)
     try:
-        parser.parse(one=True)
-        ret = parser.result(**ttp_res_kwargs)
+        return profiler.parse()
     except Exception as exc:  # pylint: disable=broad-except
         raise CommandExecutionError(
             "Failed to parse output with TTP template '{}': {}".format(template, exc)
         ) from exc
+
+
+def clear_cache(template=None, results=False, outputs=False):
+    """
+    Function to remove compiled TTP templates from in-process cache.
+
+    :param template: path to TTP template to remove cached entries for,
+        removes all entries by default
+    :param results: boolean, if True remove all parsing results from results cache as well
+    :param outputs: boolean, if True remove all commands output from outputs cache as well
+
+    CLI Examples:
+
+    .. code-block: text
+
+        salt minion-2 ttp.clear_cache
+        salt minion-2 ttp.clear_cache template='salt://ttp/subifs_and_arp.txt'
+        salt minion-2 ttp.clear_cache results=True
+        salt minion-2 ttp.clear_cache outputs=True
+    """
+    if results:
+        _get_results_cache().flush()
+    if outputs:
+        _get_outputs_cache().flush()
+    return {"removed": _TEMPLATE_CACHE.invalidate(template), "stats": _TEMPLATE_CACHE.stats()}
+
+
+def cache_stats():
+    """
+    Function to return compiled templates, parsing results and commands output
+    caches statistics.
+
+    CLI Examples:
+
+    .. code-block: text
+
+        salt minion-2 ttp.cache_stats
+    """
+    return {
+        "templates": _TEMPLATE_CACHE.stats(),
+        "results": _get_results_cache().stats(),
+        "outputs": _get_outputs_cache().stats(),
+    }
+
+
+def flush_deliveries(timeout=60):
+    """
+    Function to wait for results queued for asynchronous delivery to be delivered.
+
+    :param timeout: number of seconds to wait for, default is 60
+
+    CLI Examples:
+
+    .. code-block: text
+
+        salt minion-2 ttp.flush_deliveries
+        salt minion-2 ttp.flush_deliveries timeout=300
+    """
+    delivery_queue = ttp_delivery.get_queue(__opts__)
+    return {"drained": delivery_queue.flush(timeout), "stats": delivery_queue.stats()}
+
+
+def delivery_stats():
+    """
+    Function to return asynchronous delivery statistics.
+
+    CLI Examples:
+
+    .. code-block: text
+
+        salt minion-2 ttp.delivery_stats
+    """
+    return ttp_delivery.get_queue(__opts__).stats()
+
+
+def flush_spool():
+    """
+    Function to replay results that failed to be delivered to Elasticsearch,
+    posting them using ``_bulk`` API. Results that failed to be delivered
+    again kept in the spool.
+
+    CLI Examples:
+
+    .. code-block: text
+
+        salt minion-2 ttp.flush_spool
+    """
+    spool = ttp_spool.get_spool(__opts__)
+    if spool is None:
+        raise CommandExecutionError("TTP spool is disabled")
+    config = __salt__["config.get"]("elasticsearch", {})
+    ret = spool.replay(
+        lambda records: ttp_elasticsearch.replay_records(records, config, opts=__opts__)
+    )
+    ret["spooled"] = spool.size()
     return ret
@@ -48,6 +48,22 @@ in assumption that mine was collected using ``net.cli`` command as well
 ``nornir``, commands output combined following ``nr.cli`` command logic
 in assumption that mine was collected using ``nr.cli`` command as well
 
+Mine data can also be read straight from master cache without publishing
+``mine.get`` to minions, for that input should have ``source`` parameter set
+to ``mine_cache`` and ``fun`` parameter set to the name of mine function to
+read data for. Mine data of all targeted minions loaded from master cache
+and its text reconstructed following ``mine.get`` logic above. Master must
+have ``minion_data_cache`` or ``enforce_mine_cache`` option enabled.
+
+.. code-block: text
+
+    <input name="config">
+    source = "mine_cache"
+    tgt = "*"
+    fun = "net.cli"
+    tgt_type = "glob"
+    </input>
+
 For all other results, output passed to input as is and custom TTP input macro
 function should to be used within the template to pre-process results and extract
 text data for parsing.
@@ -85,10 +101,20 @@ with specific groups.
  * ``fun`` - mandatory, execution function to run and parse output for
  * ``arg`` - list of arguments to pass to execution function
  * ``kwarg`` - dictionary of key word arguments to pass to execution function
+ * ``source`` - set to ``mine_cache`` to read ``fun`` mine function data from
+   master cache instead of running ``fun`` on minions
 
 Input Parameters unpacked to ``client.cmd_iter(**input_params)`` function, hence
 any arguments supported by that method can be defined within input tag load.
 
+Performance and delivery options
+--------------------------------
+Jobs publishing, proxy types cache, streaming and multi-process parsing,
+batching, deadline, templates and parsing results caches, parsing job cache
+returns, returns deduplication, ``elasticsearch_bulk`` and ``salt_returner``
+returners, failed deliveries spool, asynchronous delivery, timing and
+profiling described in :doc:`/topics/runner-module` documentation.
+
 TTP Custom functions
 --------------------
 TTP supports capability to add custom function to parser object for the sake
@@ -139,10 +165,23 @@ Sample template:
     </output>
 """
 import logging
+import time
 
-import salt.utils.json
+import salt.utils.event
 from salt.client import LocalClient
 from salt.exceptions import CommandExecutionError
+from saltext.ttp.utils import cache as ttp_cache
+from saltext.ttp.utils import delivery as ttp_delivery
+from saltext.ttp.utils import elasticsearch as ttp_elasticsearch
+from saltext.ttp.utils import jobs as ttp_jobs
+from saltext.ttp.utils import profile as ttp_profile
+from saltext.ttp.utils import returner as ttp_returner
+from saltext.ttp.utils import spool as ttp_spool
+from saltext.ttp.utils import template_profile as ttp_template_profile
+from saltext.ttp.utils import text as ttp_text
+from saltext.ttp.utils import timing as ttp_timing
+from saltext.ttp.utils.pool import PoolParser
+from saltext.ttp.utils.stream import StreamParser
 
 
 client = LocalClient()
@@ -158,6 +197,9 @@ log = logging.getLogger(__name__)
 
 __virtualname__ = "ttp"
 
+_TEMPLATE_CACHE = ttp_cache.TemplateCache()
+_PROXYTYPES = ttp_jobs.ProxytypeCache()
+
 
 def __virtual__():
     """
@@ -173,37 +215,43 @@ def __virtual__():
 # -----------------------------------------------------------------------------
 
 
+@ttp_timing.timed("returners")
 def _elasticsearch_return(data, **kwargs):
     """
     Custom TTP returner function to return results to elasticsearch
     using SALT elasticsearch execution module.
     """
+    if ttp_delivery.queue_delivery(__opts__, _elasticsearch_return, data, kwargs):
+        return
+    spool = ttp_spool.get_spool(__opts__) if kwargs.pop("spool", True) else None
+    ttp_elasticsearch.create_documents(data, __salt__, spool=spool, **kwargs)
 
-    def post_to_elk(data):
-        elc_kwargs["body"] = data
-        post_result = __salt__["elasticsearch.document_create"](**elc_kwargs)
-        log.debug("TTP elasticsearch returner, server response: '%s'", post_result)
 
-    elc_kwargs = {
-        "doc_type": kwargs.get("doc_type", "default"),
-        "index": kwargs.get("index", "salt_ttp_mod"),
-    }
-    # handle per_input case
-    if isinstance(data, list):
-        # iterate over template's inputs results
-        for input_res in data:
-            # happens if _anonymous_ group in template
-            if isinstance(input_res, list):
-                # iterate over results within input
-                for i in input_res:
-                    if isinstance(i, dict):
-                        post_to_elk(salt.utils.json.dumps(i))
-            # handle normal named groups case
-            elif isinstance(input_res, dict):
-                post_to_elk(salt.utils.json.dumps(input_res))
-    # handle per_template case
-    elif isinstance(data, dict):
-        post_to_elk(salt.utils.json.dumps(data))
+@ttp_timing.timed("returners")
+def _elasticsearch_bulk_return(data, **kwargs):
+    """
+    Custom TTP returner function to return results to elasticsearch
+    in batches using ``_bulk`` API.
+    """
+    if ttp_delivery.queue_delivery(__opts__, _elasticsearch_bulk_return, data, kwargs):
+        return None
+    spool = ttp_spool.get_spool(__opts__) if kwargs.pop("spool", True) else None
+    return ttp_elasticsearch.bulk_index(
+        data, __opts__.get("elasticsearch", {}), opts=__opts__, spool=spool, **kwargs
+    )
+
+
+@ttp_timing.timed("returners")
+def _salt_return(data, **kwargs):
+    """
+    Custom TTP returner function to return results to SALT returner
+    in batches of records.
+    """
+    if ttp_delivery.queue_delivery(__opts__, _salt_return, data, kwargs):
+        return None
+    return ttp_returner.batch_return(
+        data, ttp_jobs.get_master_minion(__opts__).returners, __opts__["id"], __opts__, **kwargs
+    )
 
 
 # -----------------------------------------------------------------------------
@@ -215,43 +263,301 @@ def _get_text_from_run_result(run_results, minion_name, function_name=None):
     """
     Return the test from the run result
     """
-    results_data = []
-    if function_name == "net.cli":
-        # run_results structure is:
-        # {"out": {command: "result1", command: "result2"}}
-        results_data.append("")
-        for command, output in run_results["out"].items():
-            results_data[-1] += "\n{}#{}\n{}".format(minion_name, command, output)
-    elif function_name == "nr.cli":
-        results_data = []
-        # run_results structure is: {'hostname': {'command1': 'output1'}}
-        for hostname, commands in run_results.items():
-            results_data.append("")
-            for command, output in commands.items():
-                results_data[-1] += "\n{}#{}\n{}".format(hostname, command, output)
-    elif function_name == "mine.get":
-        # get proxytype from minion pillar
-        proxy_config = client.cmd(minion_name, "pillar.item", arg=["proxy"])
-        proxytype = proxy_config[minion_name].get("proxy", {}).get("proxytype", "")
-        if proxytype == "nornir":
-            function_name = "nr.cli"
-        elif proxytype == "napalm":
-            function_name = "net.cli"
-        for output in run_results.values():
-            results_data += _get_text_from_run_result(
-                output, minion_name, function_name=function_name
+    proxytype = (
+        _PROXYTYPES.get(__opts__, client, minion_name) if function_name == "mine.get" else None
+    )
+    return ttp_text.get_text_from_run_result(
+        run_results, minion_name, function_name=function_name, proxytype=proxytype
+    )
+
+
+def _get_compiled_template(template, saltenv, vars_to_share, use_cache, timer=None):
+    """
+    Helper function to load TTP template in parser object. If template file
+    hash did not change, compiled template reused from in-process cache or
+    template text loaded from master cache instead of fetching it again.
+    Returns a tuple of (cache key, CompiledTemplate object), cache key is
+    None if compiled template should not be cached.
+    """
+    timer = timer or ttp_timing.Timer()
+    cache_key = None
+    template_text = None
+    file_hash = None
+    if use_cache:
+        _TEMPLATE_CACHE.maxsize = __opts__.get("ttp_template_cache_size", 64)
+        _TEMPLATE_CACHE.ttl = __opts__.get("ttp_template_cache_ttl", 3600)
+        with timer.stage("fetch"):
+            hash_data = __salt__["salt.cmd"]("cp.hash_file", template, saltenv=saltenv)
+        if isinstance(hash_data, dict) and hash_data.get("hsum"):
+            file_hash = hash_data["hsum"]
+            cache_key = ttp_cache.make_key(template, saltenv, file_hash, vars_to_share)
+            compiled = _TEMPLATE_CACHE.checkout(cache_key)
+            if compiled:
+                return cache_key, compiled
+            with timer.stage("fetch"):
+                template_text = ttp_cache.fetch_template_text(
+                    __opts__, template, saltenv, file_hash
+                )
+    # create TTP parser object
+    parser = ttp(vars=vars_to_share)
+    parser.add_function(_elasticsearch_return, scope="returners", name="elasticsearch")
+    parser.add_function(_elasticsearch_bulk_return, scope="returners", name="elasticsearch_bulk")
+    parser.add_function(_salt_return, scope="returners", name="salt_returner")
+    # get TTP template
+    if template_text is None:
+        with timer.stage("fetch"):
+            template_text = __salt__["salt.cmd"]("cp.get_file_str", template, saltenv=saltenv)
+        if not template_text:
+            raise CommandExecutionError("Failed to get TTP template '{}'".format(template))
+        if file_hash:
+            ttp_cache.store_template_text(__opts__, template, saltenv, file_hash, template_text)
+    try:
+        with timer.stage("add_template"):
+            parser.add_template(template_text)
+    except Exception as exc:  # pylint: disable=broad-except
+        raise CommandExecutionError(
+            "Failed to load TTP template: {}\n{}".format(template, exc)
+        ) from exc
+    return cache_key, ttp_cache.CompiledTemplate(parser, template_text)
+
+
+def _get_results_cache():
+    """
+    Helper function to create parsing results cache object.
+    """
+    return ttp_cache.ResultsCache(
+        __opts__,
+        maxsize=__opts__.get("ttp_results_cache_size", 1024),
+        ttl=__opts__.get("ttp_results_cache_ttl", 86400),
+    )
+
+
+def _profile_run(function, args, kwargs):
+    """
+    Helper function to run function under profiler, returns function results
+    together with profiling summary.
+    """
+    template = kwargs.get("template") or args[0]
+    ret, profile = ttp_profile.profile_call(
+        function,
+        args,
+        kwargs,
+        ttp_profile.get_profile_path(__opts__, template),
+        top=__opts__.get("ttp_profile_top", 20),
+        keep=__opts__.get("ttp_profile_keep", 10),
+    )
+    if kwargs.get("timing") or kwargs.get("deadline"):
+        return dict(ret, profile=profile)
+    return {"results": ret, "profile": profile}
+
+
+def _fire_timing_event(template, timing):
+    """
+    Helper function to fire run timings event on master event bus.
+    """
+    try:
+        with salt.utils.event.get_master_event(
+            __opts__, __opts__["sock_dir"], listen=False
+        ) as event:
+            event.fire_event({"template": template, "timing": timing}, "ttp/run/timing")
+    except Exception as exc:  # pylint: disable=broad-except
+        log.error("TTP failed to fire timing event: %s", exc)
+
+
+def _collect_inputs(
+    parser, stream_parser, batches, template, batch_wait=0, timer=None, deadline=None, report=None
+):
+    """
+    Helper function to run batches of jobs and add their results to parser
+    inputs, or to ``stream_parser`` inputs if given. If ``report`` dictionary
+    given, minions whose output failed to parse added to its ``failed``
+    dictionary instead of failing and results of their outputs discarded,
+    ``stream_parser`` must be given in such a case, and minions that did not
+    return by the ``deadline`` added to its ``slow`` list.
+    """
+    timer = timer or ttp_timing.Timer()
+    for batch_index, jobs in enumerate(batches):
+        if batch_index and batch_wait and not (deadline and time.monotonic() >= deadline):
+            time.sleep(float(batch_wait))
+        if deadline and time.monotonic() >= deadline:
+            if report is not None:
+                report["slow"].extend(ttp_jobs.get_slow_minions(__opts__, jobs, set()))
+            continue
+        functions = [
+            "mine.get" if job[0].get("source") == "mine_cache" else job[0]["fun"] for job in jobs
+        ]
+        # resolve proxy types for mine.get returns in one go
+        for job, function_name in zip(jobs, functions):
+            if function_name == "mine.get":
+                _PROXYTYPES.resolve(__opts__, client, job[0]["tgt"], job[0].get("tgt_type", "glob"))
+        # publish all jobs and map results data text to TTP inputs as it arrives
+        started = timer.elapsed()
+        returned = set()
+        returns = timer.iterate(
+            "commands", ttp_jobs.iter_returns(__opts__, client, [job[0] for job in jobs], deadline)
+        )
+        for index, minion_name, run_results in returns:
+            returned.add((index, minion_name))
+            if report is not None and minion_name in report["failed"]:
+                continue
+            with timer.stage("text"):
+                results_data = _get_text_from_run_result(
+                    run_results["ret"],
+                    minion_name,
+                    function_name=functions[index],
+                )
+            if not results_data:
+                continue
+            latency = timer.elapsed() - started
+            # add data to parser:
+            for template_name, input_name in jobs[index][1]:
+                timer.record_input(
+                    template_name, input_name, functions[index], latency, results_data
+                )
+                for item in results_data:
+                    try:
+                        with timer.stage("add_input"):
+                            if stream_parser:
+                                stream_parser.add_input(
+                                    data=item,
+                                    template_name=template_name,
+                                    input_name=input_name,
+                                    prompt=minion_name,
+                                    source=minion_name if report is not None else None,
+                                )
+                            else:
+                                parser.add_input(
+                                    data=item,
+                                    template_name=template_name,
+                                    input_name=input_name,
+                                )
+                    except Exception as exc:  # pylint: disable=broad-except
+                        if report is None:
+                            raise CommandExecutionError(
+                                "Failed to parse output with TTP template '{}': {}".format(
+                                    template, exc
+                                )
+                            ) from exc
+                        log.error("TTP failed to parse '%s' output: %s", minion_name, exc)
+                        report["failed"][minion_name] = str(exc)
+                        # drop results of minion's outputs parsed so far
+                        stream_parser.discard(minion_name)
+                        break
+                if report is not None and minion_name in report["failed"]:
+                    break
+        if report is not None and deadline:
+            report["slow"].extend(
+                minion
+                for minion in ttp_jobs.get_slow_minions(__opts__, jobs, returned)
+                if minion not in report["slow"]
             )
-    elif isinstance(run_results, str):
-        results_data.append(run_results)
-    elif isinstance(run_results, list):
-        # concatenate list of string items if any
-        temp = "\n{}".join([i for i in run_results if isinstance(i, str)])
-        if temp:
-            results_data.append(temp)
-    if results_data:
-        return results_data
-    else:
-        return [run_results]
+
+
+def _collect_and_parse(
+    parser,
+    stream_parser,
+    batches,
+    template,
+    ttp_res_kwargs,
+    batch_wait=0,
+    timer=None,
+    deadline=None,
+    report=None,
+):
+    """
+    Helper function to run batches of jobs, add their results to parser inputs
+    and return parsing results. If ``stream_parser`` given, results parsed
+    using it as they arrive.
+    """
+    timer = timer or ttp_timing.Timer()
+    _collect_inputs(parser, stream_parser, batches, template, batch_wait, timer, deadline, report)
+    # run ttp parsing
+    try:
+        with timer.stage("parse"):
+            if stream_parser:
+                stream_parser.finish()
+            else:
+                parser.parse(one=True)
+            ret = parser.result(**ttp_res_kwargs)
+    except Exception as exc:  # pylint: disable=broad-except
+        raise CommandExecutionError(
+            "Failed to parse output with TTP template '{}': {}".format(template, exc)
+        ) from exc
+    # minions whose output failed to parse in worker processes
+    if report is not None:
+        for minion_name, error in stream_parser.failed.items():
+            log.error("TTP failed to parse '%s' output: %s", minion_name, error)
+            report["failed"].setdefault(minion_name, error)
+    return ret
+
+
+def _run_jobs(
+    compiled,
+    cache_key,
+    jobs,
+    template,
+    ttp_res_kwargs,
+    stream=False,
+    workers=1,
+    batch_size=None,
+    batch_wait=0,
+    use_results_cache=False,
+    dedup=False,
+    timer=None,
+    deadline=None,
+):
+    """
+    Helper function to run jobs, parse their returns with compiled template
+    and check compiled template back in the cache. Returns parsing results,
+    together with run timings if ``timer`` enabled and with failed and slow
+    minions if ``deadline`` given.
+    """
+    timer = timer or ttp_timing.Timer()
+    parser = compiled.parser
+    batches = [jobs]
+    if batch_size:
+        batches = ttp_jobs.batch_jobs(__opts__, jobs, batch_size)
+    results_cache = None
+    cache_prefix = ""
+    if use_results_cache:
+        results_cache = _get_results_cache()
+        cache_prefix = ttp_cache.make_results_prefix(compiled.text, parser.vars)
+    # in streaming and multi-process modes data parsed as soon as it added to inputs
+    stream_parser = None
+    if int(workers) > 1:
+        stream_parser = PoolParser(
+            parser, compiled.text, int(workers), results_cache, cache_prefix, dedup
+        )
+    elif stream or batch_size or results_cache or dedup or deadline:
+        stream_parser = StreamParser(parser, results_cache, cache_prefix, dedup)
+    report = {"failed": {}, "slow": []} if deadline else None
+    try:
+        ret = _collect_and_parse(
+            parser,
+            stream_parser,
+            batches,
+            template,
+            ttp_res_kwargs,
+            batch_wait,
+            timer,
+            deadline,
+            report,
+        )
+    finally:
+        if isinstance(stream_parser, PoolParser):
+            stream_parser.close()
+        ttp_delivery.drain()
+    if results_cache:
+        results_cache.commit()
+    if cache_key:
+        _TEMPLATE_CACHE.checkin(cache_key, compiled)
+    ret = {"results": ret} if timer.enabled or report is not None else ret
+    if report is not None:
+        ret.update(report)
+    if timer.enabled:
+        ret["timing"] = timer.report()
+        _fire_timing_event(template, ret["timing"])
+    return ret
 
 
 # -----------------------------------------------------------------------------
@@ -269,6 +575,27 @@ def run(*args, **kwargs):
     :param vars: dictionary of template variables to pass on to TTP parser
     :param ttp_res_kwargs: kwargs to pass to TTP result method
     :param tgt_type: targeting type to use with "client.cmd_iter" for inline command
+    :param template_cache: boolean, if True (default) use cached template if its
+        hash did not change, refer to :ref:`ttp-runner-templates-cache` for details
+    :param stream: boolean, if True parse each minion's return as soon as it arrives
+        instead of parsing all returns after collection finished, default is False
+    :param workers: number of processes to parse minions' returns with, default is 1,
+        refer to :ref:`ttp-runner-multi-process-parsing` for details
+    :param batch_size: number of minions or percentage of minions, e.g. ``10%``, to run
+        commands on at a time, refer to :ref:`ttp-runner-batching` for details
+    :param batch_wait: number of seconds to wait after batch completed before starting
+        next batch, default is 0
+    :param results_cache: boolean, if True reuse parsing results of previously parsed
+        text, refer to :ref:`ttp-runner-parsing-results-cache` for details
+    :param dedup: boolean, if True parse identical minions' returns only once,
+        refer to :ref:`ttp-runner-returns-deduplication` for details
+    :param timing: boolean, if True return results together with run stages timings,
+        refer to :ref:`ttp-runner-timing` for details
+    :param profile: boolean, if True profile the run and return results together with
+        profiling summary, refer to :ref:`ttp-runner-profiling` for details
+    :param deadline: number of seconds to collect minions' returns for, return results
+        together with failed and slow minions, refer to :ref:`ttp-runner-deadline`
+        for details
 
     Sample TTP template to use with inline command:
 
@@ -316,6 +643,10 @@ def run(*args, **kwargs):
         salt-run ttp.run salt://ttp/interfaces_summary.txt
         salt-run ttp.run template=salt://ttp/interfaces_summary.txt
     """
+    if kwargs.pop("profile", False):
+        return _profile_run(run, args, kwargs)
+    deadline = kwargs.pop("deadline", None)
+    deadline = time.monotonic() + float(deadline) if deadline else None
     # get arguments
     if "template" in kwargs:
         template = kwargs.pop("template")
@@ -325,84 +656,256 @@ def run(*args, **kwargs):
     vars_to_share = kwargs.pop("vars", {})
     ttp_res_kwargs = kwargs.pop("ttp_res_kwargs", {})
     tgt_type = kwargs.pop("tgt_type", "glob")
+    use_cache = kwargs.pop("template_cache", True)
+    stream = kwargs.pop("stream", False)
+    workers = kwargs.pop("workers", 1)
+    batch_size = kwargs.pop("batch_size", None)
+    batch_wait = kwargs.pop("batch_wait", 0)
+    use_results_cache = kwargs.pop("results_cache", __opts__.get("ttp_results_cache", False))
+    dedup = kwargs.pop("dedup", __opts__.get("ttp_dedup", False))
+    timer = ttp_timing.Timer(enabled=kwargs.pop("timing", False))
     function_kwargs = {k: v for k, v in kwargs.items() if not k.startswith("_")}
-    # create TTP parser object
-    parser = ttp(vars=vars_to_share)
-    parser.add_function(_elasticsearch_return, scope="returners", name="elasticsearch")
-    # get TTP template
-    template_text = __salt__["salt.cmd"](
-        "cp.get_file_str",
-        template,
-        saltenv=kwargs.pop("saltenv", "base"),
+    # get TTP parser object with template loaded
+    cache_key, compiled = _get_compiled_template(
+        template, kwargs.pop("saltenv", "base"), vars_to_share, use_cache, timer
     )
-    if not template_text:
-        raise CommandExecutionError("Failed to get TTP template '{}'".format(template))
-    try:
-        parser.add_template(template_text)
-    except Exception as exc:  # pylint: disable=broad-except
-        raise CommandExecutionError(
-            "Failed to load TTP template: {}\n{}".format(template, exc)
-        ) from exc
+    parser = compiled.parser
     # get template inputs load
     input_load = parser.get_input_load()
-    input_load = (
-        input_load
-        if input_load.get("_root_template_")
-        else {"_root_template_": {"Default_Input": {}}}
+    input_load = input_load if input_load else {"_root_template_": {"Default_Input": {}}}
+    return _run_jobs(
+        compiled,
+        cache_key,
+        ttp_jobs.get_jobs(__opts__, input_load, args, function_kwargs, tgt_type),
+        template,
+        ttp_res_kwargs,
+        stream=stream,
+        workers=workers,
+        batch_size=batch_size,
+        batch_wait=batch_wait,
+        use_results_cache=use_results_cache,
+        dedup=dedup,
+        timer=timer,
+        deadline=deadline,
     )
-    # run inline commands if any
-    if args:
-        inline_cmd_results = client.cmd_iter(
-            tgt=args[0],
-            fun=args[1],
-            arg=args[2:] if len(args) > 2 else [],
-            kwarg=function_kwargs,
-            tgt_type=tgt_type,
-            timeout=__opts__["timeout"],
-        )
-        # sort obtained results across inputs
-        for item in inline_cmd_results:
-            for minion_name, run_results in item.items():
-                # get results data text
-                default_input_data = _get_text_from_run_result(
-                    run_results["ret"], minion_name, function_name=args[1]
-                )
-                if not default_input_data:
-                    continue
-                for template_name, template_inputs in input_load.items():
-                    for i in default_input_data:
-                        parser.add_input(data=i, template_name=template_name)
-    # run inputs
-    for template_name, template_inputs in input_load.items():
-        for input_name, input_params in template_inputs.items():
-            if not input_params.get("fun"):
-                continue
-            input_params.setdefault("timeout", __opts__["timeout"])
-            result = client.cmd_iter(**input_params)
-            # map results data text to TTP inputs
-            for ritem in result:
-                for minion_name, run_results in ritem.items():
-                    # get results data text
-                    results_data = _get_text_from_run_result(
-                        run_results["ret"],
-                        minion_name,
-                        function_name=input_params["fun"],
-                    )
-                    if not results_data:
-                        continue
-                    # add data to parser:
-                    for item in results_data:
-                        parser.add_input(
-                            data=item,
-                            template_name=template_name,
-                            input_name=input_name,
-                        )
-    # run ttp parsing
+
+
+def run_jid(jid, template, **kwargs):
+    """
+    Function to run TTP template against returns of already completed job,
+    loading them from master job cache instead of running commands again.
+    Job returns associated with default inputs of all templates.
+
+    :param jid: job ID to parse returns of
+    :param template: path to TTP template
+    :param saltenv: name of SALT environment
+    :param vars: dictionary of template variables to pass on to TTP parser
+    :param ttp_res_kwargs: kwargs to pass to TTP result method
+    :param ext_source: name of external job cache returner to load job returns from
+    :param template_cache: boolean, if True (default) use cached template if its
+        hash did not change, refer to :ref:`ttp-runner-templates-cache` for details
+    :param stream: boolean, if True parse each minion's return as soon as it loaded,
+        default is False
+    :param workers: number of processes to parse minions' returns with, default is 1,
+        refer to :ref:`ttp-runner-multi-process-parsing` for details
+    :param results_cache: boolean, if True reuse parsing results of previously parsed
+        text, refer to :ref:`ttp-runner-parsing-results-cache` for details
+    :param dedup: boolean, if True parse identical minions' returns only once,
+        refer to :ref:`ttp-runner-returns-deduplication` for details
+    :param timing: boolean, if True return results together with run stages timings,
+        refer to :ref:`ttp-runner-timing` for details
+
+    CLI Examples:
+
+    .. code-block: text
+
+        salt-run ttp.run_jid 20210101123456789012 template="salt://ttp/intf.txt"
+        salt-run ttp.run_jid jid=20210101123456789012 template="salt://ttp/intf.txt"
+    """
+    ext_source = kwargs.pop("ext_source", None)
+    # load job details to know function returns produced by
+    returner = ttp_jobs.get_job_cache_returner(__opts__, ext_source)
+    load = ttp_jobs.get_master_minion(__opts__).returners["{}.get_load".format(returner)](jid)
+    if not load:
+        raise CommandExecutionError("Job '{}' not found in job cache".format(jid))
+    fun = load.get("fun")
+    timer = ttp_timing.Timer(enabled=kwargs.pop("timing", False))
+    cache_key, compiled = _get_compiled_template(
+        template,
+        kwargs.pop("saltenv", "base"),
+        kwargs.pop("vars", {}),
+        kwargs.pop("template_cache", True),
+        timer,
+    )
+    job_params = {
+        "source": "job_cache",
+        "jid": jid,
+        "ext_source": ext_source,
+        # compound commands returns processed as is
+        "fun": fun if isinstance(fun, str) else None,
+        "tgt": load.get("tgt"),
+        "tgt_type": load.get("tgt_type", "glob"),
+    }
+    # job returns associated with default inputs of all templates
+    templates = list(compiled.parser.get_input_load()) or ["_root_template_"]
+    jobs = [(job_params, [(template_name, "Default_Input") for template_name in templates])]
+    return _run_jobs(
+        compiled,
+        cache_key,
+        jobs,
+        template,
+        kwargs.pop("ttp_res_kwargs", {}),
+        stream=kwargs.pop("stream", False),
+        workers=kwargs.pop("workers", 1),
+        use_results_cache=kwargs.pop("results_cache", __opts__.get("ttp_results_cache", False)),
+        dedup=kwargs.pop("dedup", __opts__.get("ttp_dedup", False)),
+        timer=timer,
+    )
+
+
+def profile_template(*args, **kwargs):
+    """
+    Function to profile TTP template, reporting time spent and number of matches
+    for each group, regular expression and match function, refer to
+    :ref:`ttp-runner-template-profiling` for details.
+
+    :param template: path to TTP template
+    :param data: text or list of texts to parse with each of template inputs, if not given,
+        text collected running inline command and inputs' commands same way as ``ttp.run`` does
+    :param saltenv: name of SALT environment
+    :param vars: dictionary of template variables to pass on to TTP parser
+    :param tgt_type: targeting type to use with "client.cmd_iter" for inline command
+    :param slow_threshold: number of seconds per MByte of scanned text to flag regex
+        as slow, default is 0.1
+
+    CLI Examples:
+
+    .. code-block: text
+
+        salt-run ttp.profile_template salt://ttp/interfaces_summary.txt
+        salt-run ttp.profile_template "LAB-R*" net.cli "show run" template="salt://ttp/intf.txt"
+        salt-run ttp.profile_template template="salt://ttp/intf.txt" data="interface Gi1"
+    """
+    if "template" in kwargs:
+        template = kwargs.pop("template")
+    else:
+        template = list(args).pop(0)
+        args = None
+    data = kwargs.pop("data", None)
+    tgt_type = kwargs.pop("tgt_type", "glob")
+    slow_threshold = kwargs.pop("slow_threshold", 0.1)
+    vars_to_share = kwargs.pop("vars", {})
+    # instrumentation modifies parser, never use cached compiled template
+    _, compiled = _get_compiled_template(
+        template, kwargs.pop("saltenv", "base"), vars_to_share, use_cache=False
+    )
+    parser = compiled.parser
+    profiler = ttp_template_profile.TemplateProfiler(parser, slow_threshold)
+    function_kwargs = {k: v for k, v in kwargs.items() if not k.startswith("_")}
+    input_load = parser.get_input_load()
+    if data is not None:
+        # parse the same text with each input of each template
+        for template_name, inputs in (input_load or {"_root_template_": {}}).items():
+            for input_name in inputs or ["Default_Input"]:
+                for item in data if isinstance(data, list) else [data]:
+                    parser.add_input(data=item, template_name=template_name, input_name=input_name)
+    else:
+        input_load = input_load if input_load else {"_root_template_": {"Default_Input": {}}}
+        jobs = ttp_jobs.get_jobs(__opts__, input_load, args, function_kwargs, tgt_type)
+        _collect_inputs(parser, None, [jobs], template)
     try:
-        parser.parse(one=True)
-        ret = parser.result(**ttp_res_kwargs)
+        return profiler.parse()
     except Exception as exc:  # pylint: disable=broad-except
         raise CommandExecutionError(
             "Failed to parse output with TTP template '{}': {}".format(template, exc)
         ) from exc
+
+
+def clear_cache(template=None, saltenv="base", results=False):
+    """
+    Function to remove TTP templates from in-process and master caches.
+
+    :param template: path to TTP template to remove cached entries for,
+        removes all entries by default
+    :param saltenv: name of SALT environment of the template
+    :param results: boolean, if True remove all parsing results from results cache as well
+
+    CLI Examples:
+
+    .. code-block: text
+
+        salt-run ttp.clear_cache
+        salt-run ttp.clear_cache template=salt://ttp/interfaces_summary.txt
+        salt-run ttp.clear_cache results=True
+    """
+    if results:
+        _get_results_cache().flush()
+    removed = _TEMPLATE_CACHE.invalidate(template)
+    ttp_cache.flush_template_text(__opts__, template, saltenv)
+    return {"removed": removed, "stats": _TEMPLATE_CACHE.stats()}
+
+
+def cache_stats():
+    """
+    Function to return compiled templates and parsing results caches statistics.
+
+    CLI Examples:
+
+    .. code-block: text
+
+        salt-run ttp.cache_stats
+    """
+    return {"templates": _TEMPLATE_CACHE.stats(), "results": _get_results_cache().stats()}
+
+
+def flush_deliveries(timeout=60):
+    """
+    Function to wait for results queued for asynchronous delivery to be delivered.
+
+    :param timeout: number of seconds to wait for, default is 60
+
+    CLI Examples:
+
+    .. code-block: text
+
+        salt-run ttp.flush_deliveries
+        salt-run ttp.flush_deliveries timeout=300
+    """
+    delivery_queue = ttp_delivery.get_queue(__opts__)
+    return {"drained": delivery_queue.flush(timeout), "stats": delivery_queue.stats()}
+
+
+def delivery_stats():
+    """
+    Function to return asynchronous delivery statistics.
+
+    CLI Examples:
+
+    .. code-block: text
+
+        salt-run ttp.delivery_stats
+    """
+    return ttp_delivery.get_queue(__opts__).stats()
+
+
+def flush_spool():
+    """
+    Function to replay results that failed to be delivered to Elasticsearch,
+    posting them using ``_bulk`` API. Results that failed to be delivered
+    again kept in the spool.
+
+    CLI Examples:
+
+    .. code-block: text
+
+        salt-run ttp.flush_spool
+    """
+    spool = ttp_spool.get_spool(__opts__)
+    if spool is None:
+        raise CommandExecutionError("TTP spool is disabled")
+    config = __opts__.get("elasticsearch", {})
+    ret = spool.replay(
+        lambda records: ttp_elasticsearch.replay_records(records, config, opts=__opts__)
+    )
+    ret["spooled"] = spool.size()
     return ret
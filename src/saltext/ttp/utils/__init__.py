@@ -0,0 +1,3 @@
+"""
+Helpers shared by TTP execution and runner modules
+"""
@@ -0,0 +1,430 @@
+"""
+TTP templates cache
+===================
+
+Loading a template in TTP parser object involves parsing template XML
+and compiling every group regular expression. For templates that run
+over and over again, for instance on proxy minions polling devices every
+few minutes, that work can be done once and parser object reused,
+resetting only its inputs data and results between runs.
+
+Parser objects are not thread safe, because of that compiled templates
+checked out of the cache for the duration of a run and checked back in
+when run completes. Concurrent runs of the same template compile their
+own parser object, last checked in object wins.
+
+Compiled parser objects cannot be persisted, as template macro functions
+are not serializable, but template text can. ``fetch_template_text`` and
+``store_template_text`` functions keep template text together with its
+hash in SALT cache, so that processes that do not live long enough to
+benefit from in-process cache, e.g. ``salt-run`` invocations, can skip
+template transfer if template did not change.
+
+``ResultsCache`` keeps parsing results of individual input data items in
+SALT cache, keyed by hash of template text, template variables and data item
+text. Devices often return identical output between polls, parsing results
+for such outputs loaded from cache instead of parsing them again.
+
+``OutputsCache`` keeps raw output of commands in SALT cache, keyed by
+function name, arguments and keyword arguments, so that templates running
+the same command within a short period of time, e.g. several templates
+parsing device configuration, reuse its output instead of running the
+command again.
+"""
+import collections
+import hashlib
+import threading
+import time
+
+import salt.cache
+import salt.utils.json
+
+TEMPLATES_BANK = "ttp/templates"
+RESULTS_BANK = "ttp/results"
+RESULTS_STATS_BANK = "ttp/stats"
+OUTPUTS_BANK = "ttp/outputs"
+
+
+def _text_cache_key(template, saltenv):
+    """
+    Return SALT cache key to store template text under.
+    """
+    return hashlib.sha256("{}:{}".format(saltenv, template).encode("utf-8")).hexdigest()
+
+
+def fetch_template_text(opts, template, saltenv, file_hash):
+    """
+    Return template text from SALT cache if cached copy hash matches
+    given file hash, returns None otherwise.
+
+    :param opts: SALT configuration options
+    :param template: path to TTP template
+    :param saltenv: name of SALT environment
+    :param file_hash: current template file hash
+    """
+    data = salt.cache.factory(opts).fetch(TEMPLATES_BANK, _text_cache_key(template, saltenv))
+    if data and data.get("hsum") == file_hash:
+        return data["text"]
+    return None
+
+
+def store_template_text(opts, template, saltenv, file_hash, text):
+    """
+    Save template text and its hash in SALT cache.
+
+    :param opts: SALT configuration options
+    :param template: path to TTP template
+    :param saltenv: name of SALT environment
+    :param file_hash: template file hash
+    :param text: template text
+    """
+    salt.cache.factory(opts).store(
+        TEMPLATES_BANK,
+        _text_cache_key(template, saltenv),
+        {"template": template, "saltenv": saltenv, "hsum": file_hash, "text": text},
+    )
+
+
+def flush_template_text(opts, template=None, saltenv="base"):
+    """
+    Remove template text from SALT cache.
+
+    :param opts: SALT configuration options
+    :param template: path to TTP template to remove, removes all templates by default
+    :param saltenv: name of SALT environment
+    """
+    cache = salt.cache.factory(opts)
+    if template is None:
+        cache.flush(TEMPLATES_BANK)
+    else:
+        cache.flush(TEMPLATES_BANK, _text_cache_key(template, saltenv))
+
+
+def make_key(template, saltenv, file_hash, template_vars=None):
+    """
+    Helper function to form compiled template cache key.
+
+    :param template: path to TTP template
+    :param saltenv: name of SALT environment
+    :param file_hash: template file hash
+    :param template_vars: dictionary of variables parser object created with
+    """
+    return (
+        template,
+        saltenv,
+        file_hash,
+        salt.utils.json.dumps(template_vars or {}, sort_keys=True, default=str),
+    )
+
+
+class CompiledTemplate:
+    """
+    Container for TTP parser object with template loaded in it.
+
+    Keeps a snapshot of template inputs data taken right after template
+    was loaded, snapshot used to reset parser object to pristine state
+    before it can be reused. TTL counted from the time template compiled.
+
+    :param parser: TTP parser object with template added
+    :param text: text of the template added to parser object
+    """
+
+    def __init__(self, parser, text=None):
+        self.parser = parser
+        self.text = text
+        self.timestamp = time.monotonic()
+        self._inputs = [
+            (template_obj, {name: list(obj.data) for name, obj in template_obj.inputs.items()})
+            for template_obj in parser._templates  # pylint: disable=protected-access
+        ]
+
+    def reset(self):
+        """
+        Drop parsing results and remove input data added since template was loaded.
+        """
+        for template_obj, inputs in self._inputs:
+            # results list returned to caller by reference, replace it instead of clearing
+            template_obj.results = []
+            for name in list(template_obj.inputs):
+                if name in inputs:
+                    template_obj.inputs[name].data = list(inputs[name])
+                else:
+                    template_obj.inputs.pop(name)
+
+
+class TemplateCache:
+    """
+    Thread safe LRU cache of compiled templates with TTL eviction.
+
+    :param maxsize: maximum number of compiled templates to keep, 0 disables caching
+    :param ttl: number of seconds to keep compiled template for, 0 means forever
+    """
+
+    def __init__(self, maxsize=64, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expired(self, timestamp):
+        """
+        Return True if entry stored at given timestamp outlived cache ttl.
+        """
+        return bool(self.ttl) and time.monotonic() - timestamp > self.ttl
+
+    def checkout(self, key):
+        """
+        Remove compiled template from cache and return it, returns None
+        if no valid entry found for this key.
+
+        :param key: cache key produced by ``make_key`` function
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or self._expired(entry[1]):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def checkin(self, key, compiled):
+        """
+        Reset compiled template and put it back in the cache, evicting
+        least recently used and expired entries.
+
+        :param key: cache key produced by ``make_key`` function
+        :param compiled: ``CompiledTemplate`` object
+        """
+        if not self.maxsize:
+            return
+        compiled.reset()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (compiled, compiled.timestamp)
+            for cached_key in [k for k, v in self._entries.items() if self._expired(v[1])]:
+                self._entries.pop(cached_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, template=None):
+        """
+        Remove entries from the cache, returns number of entries removed.
+
+        :param template: path to TTP template to remove entries for, removes all entries by default
+        """
+        with self._lock:
+            keys = [k for k in self._entries if template is None or k[0] == template]
+            for key in keys:
+                self._entries.pop(key)
+        return len(keys)
+
+    def stats(self):
+        """
+        Return dictionary of cache statistics.
+        """
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def make_results_prefix(template_text, template_vars=None):
+    """
+    Helper function to form parsing results cache key prefix for template.
+
+    :param template_text: text of TTP template
+    :param template_vars: dictionary of variables parser object created with
+    """
+    return hashlib.sha256(
+        "{}\0{}".format(
+            template_text, salt.utils.json.dumps(template_vars or {}, sort_keys=True, default=str)
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def make_results_key(prefix, index, input_name, text):
+    """
+    Helper function to form parsing results cache key for input data item.
+
+    :param prefix: key prefix produced by ``make_results_prefix`` function
+    :param index: index of template in parser object templates list
+    :param input_name: name of template input data item added to
+    :param text: data item text
+    """
+    digest = hashlib.sha256("{}\0{}\0{}\0".format(prefix, index, input_name).encode("utf-8"))
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultsCache:
+    """
+    Parsing results cache persisted in SALT cache with LRU and TTL eviction.
+
+    Entries accessed since cache object created marked as recently used and
+    least recently used entries above ``maxsize`` evicted on ``commit``. Hits
+    and misses counted in-process and added to persisted counters on ``commit``.
+
+    :param opts: SALT configuration options
+    :param maxsize: maximum number of parsing results to keep
+    :param ttl: number of seconds to keep parsing results for, 0 means forever
+    """
+
+    def __init__(self, opts, maxsize=1024, ttl=86400):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._cache = salt.cache.factory(opts)
+        self._stored = False
+
+    def _expired(self, timestamp):
+        """
+        Return True if results stored at given timestamp outlived cache ttl.
+        """
+        return bool(self.ttl) and time.time() - timestamp > self.ttl
+
+    def fetch(self, key):
+        """
+        Return cached parsing results or None if no valid entry found.
+
+        :param key: cache key produced by ``make_results_key`` function
+        """
+        data = self._cache.fetch(RESULTS_BANK, key)
+        if not data or self._expired(data["timestamp"]):
+            self.misses += 1
+            return None
+        self.hits += 1
+        # store entry again to mark it as recently used
+        self._cache.store(RESULTS_BANK, key, data)
+        return data["results"]
+
+    def store(self, key, results):
+        """
+        Save parsing results in the cache.
+
+        :param key: cache key produced by ``make_results_key`` function
+        :param results: data item parsing results
+        """
+        self._cache.store(RESULTS_BANK, key, {"results": results, "timestamp": time.time()})
+        self._stored = True
+
+    def commit(self):
+        """
+        Evict least recently used entries and save hits and misses counters.
+        """
+        if self._stored:
+            keys = self._cache.list(RESULTS_BANK)
+            if len(keys) > self.maxsize:
+                keys.sort(key=lambda k: self._cache.updated(RESULTS_BANK, k) or 0)
+                for key in keys[: len(keys) - self.maxsize]:
+                    self._cache.flush(RESULTS_BANK, key)
+            self._stored = False
+        if self.hits or self.misses:
+            counters = self._cache.fetch(RESULTS_STATS_BANK, "results") or {}
+            self._cache.store(
+                RESULTS_STATS_BANK,
+                "results",
+                {
+                    "hits": counters.get("hits", 0) + self.hits,
+                    "misses": counters.get("misses", 0) + self.misses,
+                },
+            )
+            self.hits = self.misses = 0
+
+    def flush(self):
+        """
+        Remove all parsing results and counters from the cache.
+        """
+        self._cache.flush(RESULTS_BANK)
+        self._cache.flush(RESULTS_STATS_BANK)
+
+    def stats(self):
+        """
+        Return dictionary of cache statistics.
+        """
+        counters = self._cache.fetch(RESULTS_STATS_BANK, "results") or {}
+        return {
+            "size": len(self._cache.list(RESULTS_BANK)),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": counters.get("hits", 0) + self.hits,
+            "misses": counters.get("misses", 0) + self.misses,
+        }
+
+
+def make_output_key(function, args=None, kwargs=None):
+    """
+    Helper function to form command output cache key.
+
+    :param function: name of the function
+    :param args: list of function arguments
+    :param kwargs: dictionary of function keyword arguments
+    """
+    return hashlib.sha256(
+        salt.utils.json.dumps(
+            [function, list(args or []), kwargs or {}], sort_keys=True, default=str
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+class OutputsCache:
+    """
+    Commands output cache persisted in SALT cache. Entries stored together
+    with the time they were saved at, TTL given on fetch, so that each caller
+    decides how old output it accepts.
+
+    :param opts: SALT configuration options
+    """
+
+    def __init__(self, opts):
+        self.hits = 0
+        self.misses = 0
+        self._cache = salt.cache.factory(opts)
+
+    def fetch(self, key, ttl):
+        """
+        Return cached command output or None if no entry saved within ``ttl``
+        seconds found.
+
+        :param key: cache key produced by ``make_output_key`` function
+        :param ttl: maximum age of cached output in seconds
+        """
+        data = self._cache.fetch(OUTPUTS_BANK, key)
+        if not data or time.time() - data["timestamp"] > ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data["output"]
+
+    def store(self, key, output):
+        """
+        Save command output in the cache.
+
+        :param key: cache key produced by ``make_output_key`` function
+        :param output: command output
+        """
+        self._cache.store(OUTPUTS_BANK, key, {"output": output, "timestamp": time.time()})
+
+    def flush(self):
+        """
+        Remove all commands output from the cache.
+        """
+        self._cache.flush(OUTPUTS_BANK)
+
+    def stats(self):
+        """
+        Return dictionary of cache statistics.
+        """
+        return {
+            "size": len(self._cache.list(OUTPUTS_BANK)),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
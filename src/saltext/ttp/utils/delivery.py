@@ -0,0 +1,203 @@
+"""
+Asynchronous delivery of TTP results
+====================================
+
+TTP returners run as part of parsing, making ``run`` function wait until all
+results delivered. ``DeliveryQueue`` runs deliveries in a background worker
+thread instead, so that ``run`` can return as soon as parsing done.
+
+Queue capacity is bounded, if queue is full, delivery waits for free slot
+for up to ``put_timeout`` seconds and, if no slot freed, runs in the calling
+thread, slowing producer down to the pace of deliveries instead of dropping
+results or growing memory usage without limit.
+
+Deliveries run within a copy of the context they were queued from, so that
+functions relying on SALT loader context, e.g. using ``__salt__`` or
+``__opts__``, work in worker thread as well. Python versions without
+``contextvars`` module run deliveries as plain function calls, SALT loader
+context there is made of module globals visible to all threads.
+
+Worker thread only lives as long as process that started it. On interpreter
+exit queue waits for up to ``put_timeout`` seconds for deliveries to
+complete, deliveries still queued after that are lost, as well as all queued
+deliveries if process exits without running interpreter exit handlers, e.g.
+killed or exited using ``os._exit`` as SALT job processes do. Processes that
+exit once their work done must ``flush`` the queue before exiting.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+try:
+    import contextvars
+
+    HAS_CONTEXTVARS = True
+except ImportError:  # pragma: no cover
+    HAS_CONTEXTVARS = False
+
+log = logging.getLogger(__name__)
+
+# process wide delivery queue, shared by all TTP returners running in the process
+_QUEUE = None
+
+
+class DeliveryQueue:
+    """
+    Bounded queue of deliveries processed by a background worker thread.
+
+    :param maxsize: maximum number of queued deliveries
+    :param put_timeout: number of seconds to wait for free slot in a full queue
+        before running delivery in calling thread, None means wait forever
+    """
+
+    def __init__(self, maxsize=1000, put_timeout=30):
+        self.maxsize = maxsize
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {"queued": 0, "delivered": 0, "failed": 0, "inline": 0}
+        self._totals = {}
+
+    def _start(self):
+        """
+        Start worker thread if it is not running.
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._thread is None:
+                    atexit.register(self.flush, timeout=self.put_timeout)
+                self._thread = threading.Thread(
+                    target=self._worker, name="ttp-delivery", daemon=True
+                )
+                self._thread.start()
+
+    def _deliver(self, context, function, args, kwargs):
+        """
+        Run delivery function within given context and record its outcome.
+        """
+        try:
+            if context is None:
+                result = function(*args, **kwargs)
+            else:
+                result = context.run(function, *args, **kwargs)
+        except Exception:  # pylint: disable=broad-except
+            log.exception("TTP delivery failed, function '%s'", function.__name__)
+            self._count("failed")
+            return
+        self._count("delivered")
+        # add up statistics returned by delivery function, e.g. number of failed documents
+        if isinstance(result, dict):
+            with self._lock:
+                for key, value in result.items():
+                    if isinstance(value, int) and not isinstance(value, bool):
+                        self._totals[key] = self._totals.get(key, 0) + value
+
+    def _count(self, key):
+        """
+        Increment delivery statistics counter.
+        """
+        with self._lock:
+            self._stats[key] += 1
+
+    def _worker(self):
+        """
+        Run queued deliveries one by one.
+        """
+        while True:
+            item = self._queue.get()
+            try:
+                self._deliver(*item)
+            finally:
+                self._queue.task_done()
+
+    def put(self, function, *args, **kwargs):
+        """
+        Queue function call for delivery in worker thread.
+
+        :param function: delivery function
+        :param args: delivery function arguments
+        :param kwargs: delivery function keyword arguments
+        """
+        self._start()
+        context = contextvars.copy_context() if HAS_CONTEXTVARS else None
+        item = (context, function, args, kwargs)
+        try:
+            self._queue.put(item, timeout=self.put_timeout)
+        except queue.Full:
+            log.warning("TTP delivery queue is full, delivering in calling thread")
+            self._count("inline")
+            self._deliver(*item)
+            return
+        self._count("queued")
+
+    def flush(self, timeout=None):
+        """
+        Wait for all queued deliveries to complete, returns True if queue
+        drained or False if timeout expired first.
+
+        :param timeout: number of seconds to wait for, None means wait forever
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self):
+        """
+        Return dictionary of delivery statistics.
+        """
+        with self._lock:
+            return dict(
+                self._stats,
+                pending=self._queue.unfinished_tasks,
+                maxsize=self.maxsize,
+                totals=dict(self._totals),
+            )
+
+
+def get_queue(opts):
+    """
+    Return process wide delivery queue, creating it on first use.
+
+    :param opts: SALT configuration options
+    """
+    global _QUEUE  # pylint: disable=global-statement
+    if _QUEUE is None:
+        _QUEUE = DeliveryQueue(
+            maxsize=opts.get("ttp_delivery_queue_size", 1000),
+            put_timeout=opts.get("ttp_delivery_put_timeout", 30),
+        )
+    return _QUEUE
+
+
+def queue_delivery(opts, returner, data, kwargs):
+    """
+    Queue returner call for asynchronous delivery if enabled by ``async_delivery``
+    returner parameter or ``ttp_async_delivery`` option. Returns True if returner
+    call queued.
+
+    :param opts: SALT configuration options
+    :param returner: TTP returner function
+    :param data: TTP results
+    :param kwargs: TTP returner keyword arguments, ``async_delivery`` key removed
+    """
+    if not kwargs.pop("async_delivery", opts.get("ttp_async_delivery", False)):
+        return False
+    get_queue(opts).put(returner, data, async_delivery=False, **kwargs)
+    return True
+
+
+def drain():
+    """
+    Wait for deliveries queued in this process to complete, processes that
+    exit straight after their work done lose deliveries left in the queue.
+    """
+    if _QUEUE is not None:
+        _QUEUE.flush()
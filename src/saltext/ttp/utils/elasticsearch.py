@@ -0,0 +1,360 @@
+"""
+Elasticsearch bulk indexing
+===========================
+
+Posting parsing results to Elasticsearch one document per request makes
+indexing of large results, e.g. ARP or MAC tables of a big network, take as
+many HTTP requests as there are rows. ``BulkIndexer`` groups documents in
+``_bulk`` API requests limited by number of documents and request body size,
+and reports failures of individual documents returned by Elasticsearch.
+"""
+import logging
+import time
+
+import salt.utils.http
+import salt.utils.json
+
+log = logging.getLogger(__name__)
+
+
+def iter_documents(data):
+    """
+    Yield dictionaries to index out of TTP results.
+
+    * if results is a dictionary, it is yielded as is
+    * if results is a list of dictionaries, each list item yielded individually
+    * if results is a list of lists of dictionaries, each dictionary item yielded individually
+
+    :param data: TTP template results
+    """
+    # handle per_input case
+    if isinstance(data, list):
+        # iterate over template's inputs results
+        for input_res in data:
+            # happens if _anonymous_ group in template
+            if isinstance(input_res, list):
+                for item in input_res:
+                    if isinstance(item, dict):
+                        yield item
+            # handle normal named groups case
+            elif isinstance(input_res, dict):
+                yield input_res
+    # handle per_template case
+    elif isinstance(data, dict):
+        yield data
+
+
+def create_documents(data, functions, spool=None, **kwargs):
+    """
+    Post TTP results to Elasticsearch one document per request using SALT
+    ``elasticsearch.document_create`` execution module function. Documents
+    failed to post appended to spool.
+
+    :param data: TTP template results
+    :param functions: SALT execution modules functions, e.g. ``__salt__``
+    :param spool: ``Spool`` object to save failed documents to
+    :param kwargs: TTP returner arguments - ``index`` and ``doc_type``
+    """
+    elc_kwargs = {
+        "doc_type": kwargs.get("doc_type", "default"),
+        "index": kwargs.get("index", "salt_ttp_mod"),
+    }
+    failed = []
+    for document in iter_documents(data):
+        try:
+            post_result = functions["elasticsearch.document_create"](
+                body=salt.utils.json.dumps(document), **elc_kwargs
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            log.error("TTP elasticsearch returner failed to post document: %s", exc)
+            # spool document type only if given explicitly, default type is rejected by
+            # Elasticsearch 8 that spooled documents replayed to using _bulk API
+            failed.append(
+                {
+                    "index": elc_kwargs["index"],
+                    "doc_type": kwargs.get("doc_type"),
+                    "document": document,
+                }
+            )
+            continue
+        log.debug("TTP elasticsearch returner, server response: '%s'", post_result)
+    if failed and spool is not None:
+        spool.append(failed)
+
+
+def get_url(config):
+    """
+    Return Elasticsearch URL out of SALT elasticsearch module configuration,
+    first host from ``hosts`` list used, ``http://`` prepended if host has no scheme.
+
+    :param config: dictionary with ``hosts`` or ``url`` key
+    """
+    url = config.get("url")
+    if not url:
+        hosts = config.get("hosts") or ["127.0.0.1:9200"]
+        url = hosts if isinstance(hosts, str) else hosts[0]
+    if "://" not in url:
+        url = "{}://{}".format("https" if config.get("use_ssl") else "http", url)
+    return url.rstrip("/")
+
+
+def get_http_kwargs(config):
+    """
+    Return ``salt.utils.http.query`` arguments out of SALT elasticsearch module configuration.
+
+    :param config: dictionary of elasticsearch configuration
+    """
+    http_kwargs = {}
+    if config.get("username"):
+        http_kwargs["username"] = config["username"]
+        http_kwargs["password"] = config.get("password")
+    if "verify_certs" in config:
+        http_kwargs["verify_ssl"] = config["verify_certs"]
+    if config.get("ca_certs"):
+        http_kwargs["ca_bundle"] = config["ca_certs"]
+    return http_kwargs
+
+
+def bulk_index(data, config, opts=None, spool=None, **kwargs):
+    """
+    Index TTP results using ``_bulk`` API, returns indexing statistics.
+
+    :param data: TTP template results
+    :param config: dictionary of elasticsearch configuration
+    :param opts: SALT configuration options to make HTTP requests with
+    :param spool: ``Spool`` object to save documents failed for transient reasons to
+    :param kwargs: TTP returner arguments - ``url``, ``index``, ``doc_type``,
+        ``batch_size``, ``max_bytes``, ``retries`` and ``backoff``
+    """
+    indexer = BulkIndexer(
+        kwargs.get("url") or get_url(config),
+        kwargs.get("index", "salt_ttp_mod"),
+        doc_type=kwargs.get("doc_type"),
+        batch_size=kwargs.get("batch_size", 500),
+        max_bytes=kwargs.get("max_bytes", 5242880),
+        opts=opts,
+        http_kwargs=get_http_kwargs(config),
+        retries=kwargs.get("retries", 3),
+        backoff=kwargs.get("backoff", 1),
+    )
+    for document in iter_documents(data):
+        indexer.add(document)
+    stats = indexer.close()
+    if spool is not None and indexer.retriable:
+        stats["spooled"] = spool.append(
+            [
+                {
+                    "url": indexer.url,
+                    "index": kwargs.get("index", "salt_ttp_mod"),
+                    "doc_type": kwargs.get("doc_type"),
+                    "document": document,
+                }
+                for document in indexer.retriable
+            ]
+        )
+    log.debug("TTP elasticsearch bulk returner, indexing statistics: %s", stats)
+    return stats
+
+
+def replay_records(records, config, opts=None):
+    """
+    Index spooled records using ``_bulk`` API, returns list of records
+    failed to index. Records that Elasticsearch rejected, e.g. because of
+    mapping error, returned with ``error`` key added, so that they are kept
+    in the spool rather than lost.
+
+    :param records: list of spool records with ``url``, ``index``, ``doc_type``
+        and ``document`` keys, records without ``url`` posted to configured URL
+    :param config: dictionary of elasticsearch configuration
+    :param opts: SALT configuration options to make HTTP requests with
+    """
+    groups = {}
+    for record in records:
+        # "default" is legacy document type of elasticsearch returner, that
+        # Elasticsearch 8 rejects, documents are indexed without type instead
+        doc_type = record.get("doc_type")
+        doc_type = None if doc_type == "default" else doc_type
+        key = (record.get("url") or get_url(config), record["index"], doc_type)
+        groups.setdefault(key, []).append(record)
+    failed = []
+    unavailable = set()
+    for (url, index, doc_type), group in groups.items():
+        # do not wait for retries of the next groups once Elasticsearch is down
+        if url in unavailable:
+            failed.extend(group)
+            continue
+        indexer = BulkIndexer(
+            url, index, doc_type=doc_type, opts=opts, http_kwargs=get_http_kwargs(config)
+        )
+        for record in group:
+            indexer.add(record["document"])
+        indexer.close()
+        if indexer.unavailable:
+            unavailable.add(url)
+        retriable = {id(document) for document in indexer.retriable}
+        errors = {id(document): error for document, error in indexer.failed}
+        for record in group:
+            if id(record["document"]) in retriable:
+                failed.append(record)
+            elif id(record["document"]) in errors:
+                failed.append(dict(record, error=errors[id(record["document"])]))
+    return failed
+
+
+def _retriable(status):
+    """
+    Return True if request or document failed with transient error, e.g.
+    connection error, server error or throttling.
+    """
+    return not status or status == 429 or status >= 500
+
+
+class BulkIndexer:
+    """
+    Buffer documents and post them to Elasticsearch using ``_bulk`` API.
+
+    Documents posted once ``batch_size`` documents buffered or buffered request
+    body would exceed ``max_bytes``. Requests that failed because of connection
+    error, server error or throttling retried with exponential backoff. Once
+    request failed for such reason after all retries, Elasticsearch considered
+    unavailable and remaining documents failed without posting them, so that
+    indexing does not wait for retries of every batch. Documents that failed to
+    index, either because request failed or because Elasticsearch
+    rejected them, collected in ``failed`` list as (document, error) tuples, and
+    documents that failed for transient reasons in ``retriable`` list as well.
+
+    :param url: Elasticsearch URL, e.g. ``http://127.0.0.1:9200``
+    :param index: name of index to post documents to
+    :param doc_type: type of documents, omitted by default as not supported by Elasticsearch 8
+    :param batch_size: maximum number of documents per request
+    :param max_bytes: maximum size of request body in bytes
+    :param opts: SALT configuration options to make HTTP requests with
+    :param http_kwargs: additional ``salt.utils.http.query`` arguments, e.g. ``username``
+    :param retries: number of times to retry failed request
+    :param backoff: number of seconds to wait before first retry, doubled for each next retry
+    """
+
+    def __init__(
+        self,
+        url,
+        index,
+        doc_type=None,
+        batch_size=500,
+        max_bytes=5242880,
+        opts=None,
+        http_kwargs=None,
+        retries=3,
+        backoff=1,
+    ):
+        self.url = url.rstrip("/")
+        self.retries = int(retries)
+        self.backoff = float(backoff)
+        self.batch_size = int(batch_size)
+        self.max_bytes = int(max_bytes)
+        self.opts = opts
+        self.http_kwargs = http_kwargs or {}
+        action = {"_index": index}
+        if doc_type:
+            action["_type"] = doc_type
+        self._action = salt.utils.json.dumps({"index": action}) + "\n"
+        self._documents = []
+        self._lines = []
+        self._size = 0
+        self.failed = []
+        self.retriable = []
+        self.unavailable = None
+        self.stats = {"indexed": 0, "failed": 0, "requests": 0}
+
+    def add(self, document):
+        """
+        Buffer document, posting buffered documents if limits reached.
+
+        :param document: dictionary to index
+        """
+        line = self._action + salt.utils.json.dumps(document) + "\n"
+        size = len(line.encode("utf-8"))
+        if self._documents and self._size + size > self.max_bytes:
+            self.flush()
+        self._documents.append(document)
+        self._lines.append(line)
+        self._size += size
+        if len(self._documents) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Post buffered documents to Elasticsearch.
+        """
+        if not self._documents:
+            return
+        documents, body = self._documents, "".join(self._lines)
+        self._documents, self._lines, self._size = [], [], 0
+        if self.unavailable:
+            self._add_failed([(document, self.unavailable) for document in documents], True)
+            return
+        response, status, error = self._post(body)
+        if error:
+            log.error(
+                "TTP elasticsearch bulk request of %s documents failed: %s", len(documents), error
+            )
+            self._add_failed([(document, error) for document in documents], _retriable(status))
+            if _retriable(status):
+                self.unavailable = error
+            return
+        result = response.get("dict") or {}
+        failed = []
+        if result.get("errors"):
+            for document, item in zip(documents, result.get("items", [])):
+                item = next(iter(item.values()), {})
+                if item.get("error"):
+                    log.error("TTP elasticsearch bulk failed to index document: %s", item["error"])
+                    self._add_failed([(document, item["error"])], _retriable(item.get("status")))
+                    failed.append(document)
+        self.stats["indexed"] += len(documents) - len(failed)
+
+    def _post(self, body):
+        """
+        Post request body to ``_bulk`` API, retrying failed requests with
+        exponential backoff. Returns (response, status, error) tuple.
+        """
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self.backoff * 2 ** (attempt - 1)
+                log.warning("TTP elasticsearch bulk request failed, retrying in %ss", delay)
+                time.sleep(delay)
+            self.stats["requests"] += 1
+            response = salt.utils.http.query(
+                "{}/_bulk".format(self.url),
+                method="POST",
+                data=body,
+                header_dict={"Content-Type": "application/x-ndjson"},
+                status=True,
+                decode=True,
+                decode_type="json",
+                raise_error=False,
+                opts=self.opts,
+                **self.http_kwargs
+            )
+            status = response.get("status") or 0
+            if "error" not in response and 200 <= status < 300:
+                return response, status, None
+            error = response.get("error") or "HTTP status {}".format(status)
+            if not _retriable(status):
+                break
+        return response, status, error
+
+    def _add_failed(self, failed, retriable=False):
+        """
+        Record failed documents, adding them to ``retriable`` list if failed for transient reasons.
+        """
+        self.failed.extend(failed)
+        self.stats["failed"] += len(failed)
+        if retriable:
+            self.retriable.extend(document for document, _ in failed)
+
+    def close(self):
+        """
+        Post remaining documents and return indexing statistics.
+        """
+        self.flush()
+        return dict(self.stats)
@@ -0,0 +1,380 @@
+"""
+Publishing TTP runner jobs and collecting their returns
+=======================================================
+
+TTP runner turns inline command and template inputs in a list of jobs, each
+job is a tuple of ``client.cmd_iter`` keyword arguments and a list of
+(template name, input name) tuples job returns added to. Inputs that run the
+same command against the same targets merged in a single job.
+
+All jobs published at once and their returns collected in a single loop, so
+that run takes about as long as the slowest job. Jobs can be split in batches
+of minions and returns collection stopped at a deadline, minions that did not
+return by then reported as slow. Jobs with ``mine_cache`` or ``job_cache``
+source read their returns from master cache instead of publishing.
+
+Proxy types of minions, needed to extract text out of ``mine.get`` returns,
+resolved in bulk and kept in ``ProxytypeCache`` for ``ttp_proxytype_cache_ttl``
+seconds.
+"""
+import logging
+import math
+import time
+
+import salt.minion
+import salt.utils.json
+import salt.utils.master
+import salt.utils.mine
+import salt.utils.minions
+
+log = logging.getLogger(__name__)
+
+# process wide MasterMinion object, creating it loads all of its modules and returners
+_MASTER_MINION = None
+
+
+def get_master_minion(opts):
+    """
+    Return process wide ``MasterMinion`` object, creating it on first use.
+
+    :param opts: SALT master configuration options
+    """
+    global _MASTER_MINION  # pylint: disable=global-statement
+    if _MASTER_MINION is None:
+        _MASTER_MINION = salt.minion.MasterMinion(opts)
+    return _MASTER_MINION
+
+
+def get_job_cache_returner(opts, ext_source=None):
+    """
+    Return name of the returner to load jobs data with.
+
+    :param opts: SALT master configuration options
+    :param ext_source: name of external job cache returner
+    """
+    return opts.get("ext_job_cache") or ext_source or opts["master_job_cache"]
+
+
+def get_job_cache(opts, params):
+    """
+    Load returns of a job from master job cache. Returns dictionary keyed by
+    minion name with minion returns as values.
+
+    :param opts: SALT master configuration options
+    :param params: dictionary with ``jid`` and optional ``ext_source`` keys
+    """
+    returner = get_job_cache_returner(opts, params.get("ext_source"))
+    get_jid = get_master_minion(opts).returners["{}.get_jid".format(returner)]
+    returns = get_jid(params["jid"]) or {}
+    return {
+        minion_name: data["return"]
+        for minion_name, data in returns.items()
+        if isinstance(data, dict) and "return" in data
+    }
+
+
+def get_mine_cache(opts, params):
+    """
+    Read mine function data of targeted minions from master cache. Returns
+    dictionary keyed by minion name with mine data as values.
+
+    :param opts: SALT master configuration options
+    :param params: input parameters dictionary with ``tgt``, ``tgt_type`` and ``fun`` keys
+    """
+    mine_data = salt.utils.master.MasterPillarUtil(
+        params["tgt"],
+        params.get("tgt_type", "glob"),
+        use_cached_grains=True,
+        use_cached_pillar=True,
+        grains_fallback=False,
+        pillar_fallback=False,
+        opts=opts,
+    ).get_cached_mine_data()
+    ret = {}
+    for minion_name, minion_mine in mine_data.items():
+        if not isinstance(minion_mine, dict) or params["fun"] not in minion_mine:
+            continue
+        data = minion_mine[params["fun"]]
+        # mine entries stored with ACL wrapped in a dictionary
+        if isinstance(data, dict) and salt.utils.mine.MINE_ITEM_ACL_ID in data:
+            data = data[salt.utils.mine.MINE_ITEM_ACL_DATA]
+        ret[minion_name] = data
+    return ret
+
+
+def get_jobs(opts, input_load, args=None, function_kwargs=None, tgt_type="glob"):
+    """
+    Collect jobs to run out of inline command arguments and template inputs.
+    Returns list of (cmd_iter kwargs, [(template, input), ...]) tuples. Inputs
+    that run the same command against the same targets merged in a single job,
+    its returns added to all of them.
+
+    :param opts: SALT master configuration options
+    :param input_load: TTP parser inputs load
+    :param args: inline command target, function and its arguments
+    :param function_kwargs: inline command keyword arguments
+    :param tgt_type: inline command targeting type
+    """
+    jobs = []
+    if args:
+        # inline command results associated with default inputs of all templates
+        inline_params = {
+            "tgt": args[0],
+            "fun": args[1],
+            "arg": args[2:] if len(args) > 2 else [],
+            "kwarg": function_kwargs or {},
+            "tgt_type": tgt_type,
+            "timeout": opts["timeout"],
+        }
+        jobs.append(
+            (inline_params, [(template_name, "Default_Input") for template_name in input_load])
+        )
+    for template_name, template_inputs in input_load.items():
+        for input_name, input_params in template_inputs.items():
+            if not input_params.get("fun"):
+                continue
+            # copy input parameters to not modify cached template inputs
+            input_params = dict(input_params)
+            input_params.setdefault("timeout", opts["timeout"])
+            jobs.append((input_params, [(template_name, input_name)]))
+    merged = {}
+    for params, inputs in jobs:
+        key = salt.utils.json.dumps(
+            dict(
+                params,
+                arg=list(params.get("arg") or []),
+                kwarg=params.get("kwarg") or {},
+                tgt_type=params.get("tgt_type", "glob"),
+                timeout=None,
+            ),
+            sort_keys=True,
+            default=str,
+        )
+        if key in merged:
+            merged[key][0]["timeout"] = max(merged[key][0]["timeout"], params["timeout"])
+            merged[key][1].extend(inputs)
+        else:
+            merged[key] = (params, list(inputs))
+    return list(merged.values())
+
+
+def get_batch_size(batch_size, minions_count):
+    """
+    Convert batch size given as a number or percentage of all minions to a
+    number of minions.
+
+    :param batch_size: number of minions or percentage string, e.g. ``10%``
+    :param minions_count: number of all targeted minions
+    """
+    if isinstance(batch_size, str) and batch_size.endswith("%"):
+        return max(1, int(float(batch_size[:-1]) / 100 * minions_count))
+    return max(1, int(batch_size))
+
+
+def batch_jobs(opts, jobs, batch_size):
+    """
+    Split jobs targets in batches of minions. Returns a list of batches, each
+    batch is a list of jobs with targets replaced by the list of minions within
+    that batch.
+
+    :param opts: SALT master configuration options
+    :param jobs: list of jobs produced by ``get_jobs`` function
+    :param batch_size: number of minions or percentage of minions in a batch
+    """
+    ckminions = salt.utils.minions.CkMinions(opts)
+    jobs_minions = [
+        set(ckminions.check_minions(job[0]["tgt"], job[0].get("tgt_type", "glob"))["minions"])
+        for job in jobs
+    ]
+    minions = sorted(set().union(*jobs_minions))
+    size = get_batch_size(batch_size, len(minions))
+    batches = []
+    for start in range(0, len(minions), size):
+        batch_minions = set(minions[start : start + size])
+        batch = []
+        for job, job_minions in zip(jobs, jobs_minions):
+            targets = sorted(batch_minions & job_minions)
+            if targets:
+                batch.append((dict(job[0], tgt=targets, tgt_type="list"), job[1]))
+        batches.append(batch)
+    return batches
+
+
+def get_slow_minions(opts, jobs, returned):
+    """
+    Return sorted list of minions targeted by published jobs that did not
+    return for at least one of them.
+
+    :param opts: SALT master configuration options
+    :param jobs: list of jobs produced by ``get_jobs`` function
+    :param returned: set of (job index, minion name) tuples of received returns
+    """
+    ckminions = salt.utils.minions.CkMinions(opts)
+    slow = set()
+    for index, job in enumerate(jobs):
+        if job[0].get("source") in ("mine_cache", "job_cache"):
+            continue
+        targeted = ckminions.check_minions(job[0]["tgt"], job[0].get("tgt_type", "glob"))
+        slow.update(minion for minion in targeted["minions"] if (index, minion) not in returned)
+    return sorted(slow)
+
+
+def iter_returns(opts, client, jobs, deadline=None):
+    """
+    Publish all jobs at once and collect their returns in a single loop.
+    Yields (job index, minion name, minion return) tuples in order of arrival.
+    Jobs with ``mine_cache`` source read from master cache instead, their
+    returns structured as ``mine.get`` returns, jobs with ``job_cache`` source
+    load returns of already completed job from master job cache.
+
+    :param opts: SALT master configuration options
+    :param client: SALT ``LocalClient`` object to publish jobs with
+    :param jobs: list of ``client.cmd_iter`` keyword arguments dictionaries
+    :param deadline: ``time.monotonic`` time to stop collecting returns at
+    """
+    to_publish = []
+    for index, job in enumerate(jobs):
+        if job.get("source") == "mine_cache":
+            for minion_name, data in get_mine_cache(opts, job).items():
+                yield index, minion_name, {"ret": {minion_name: data}}
+        elif job.get("source") == "job_cache":
+            for minion_name, data in get_job_cache(opts, job).items():
+                yield index, minion_name, {"ret": data}
+        else:
+            if deadline:
+                # do not wait for minions beyond the deadline
+                remaining = max(int(math.ceil(deadline - time.monotonic())), 1)
+                job = dict(job, timeout=min(job.get("timeout") or remaining, remaining))
+            to_publish.append((index, job))
+    if len(to_publish) == 1:
+        index, job = to_publish[0]
+        for item in client.cmd_iter(**job):
+            for minion_name, run_results in item.items():
+                yield index, minion_name, run_results
+            if deadline and time.monotonic() >= deadline:
+                return
+        return
+    # non blocking iterators publish their job on first iteration
+    iterators = {index: client.cmd_iter_no_block(**job) for index, job in to_publish}
+    while iterators:
+        received = False
+        for index in list(iterators):
+            try:
+                item = next(iterators[index])
+            except StopIteration:
+                iterators.pop(index)
+                continue
+            if item:
+                received = True
+                for minion_name, run_results in item.items():
+                    yield index, minion_name, run_results
+            # minions of jobs that did not finish reported as slow by caller
+            if deadline and time.monotonic() >= deadline:
+                return
+        if not received:
+            time.sleep(0.01)
+
+
+def _proxytype_from_pillar(pillar):
+    """
+    Return proxy type from minion's pillar, empty string if none.
+    """
+    return (pillar.get("proxy") or {}).get("proxytype", "")
+
+
+class ProxytypeCache:
+    """
+    In-process cache of minions' proxy types with TTL eviction. Minions that
+    did not return their pillar cached as having no proxy type, so that they
+    are not queried again until their entries expire.
+    """
+
+    def __init__(self):
+        # minion id to (proxytype, timestamp) mapping
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _fresh(self, opts, minion_name, timestamp):
+        """
+        Return True if minion has proxy type cached within ttl before timestamp.
+        """
+        entry = self._entries.get(minion_name)
+        ttl = opts.get("ttp_proxytype_cache_ttl", 300)
+        return entry is not None and timestamp - entry[1] <= ttl
+
+    def resolve(self, opts, client, tgt, tgt_type="glob"):
+        """
+        Resolve proxy types of all targeted minions in bulk. Proxy types looked
+        up in master minions' pillar cache first, minions not found in pillar
+        cache and with no fresh entry queried using single publish.
+
+        :param opts: SALT master configuration options
+        :param client: SALT ``LocalClient`` object to query minions with
+        :param tgt: target to resolve proxy types for
+        :param tgt_type: targeting type
+        """
+        timestamp = time.monotonic()
+        pillars = {}
+        try:
+            pillars = salt.utils.master.MasterPillarUtil(
+                tgt,
+                tgt_type,
+                use_cached_grains=True,
+                use_cached_pillar=True,
+                grains_fallback=False,
+                pillar_fallback=False,
+                opts=opts,
+            ).get_minion_pillar()
+        except Exception as exc:  # pylint: disable=broad-except
+            log.debug("TTP failed to get minions pillar from master cache: %s", exc)
+        for minion_name, pillar in pillars.items():
+            if pillar:
+                self._entries[minion_name] = (_proxytype_from_pillar(pillar), timestamp)
+        if pillars:
+            targets = [minion_name for minion_name, pillar in pillars.items() if not pillar]
+        else:
+            try:
+                ckminions = salt.utils.minions.CkMinions(opts)
+                targets = ckminions.check_minions(tgt, tgt_type)["minions"]
+            except Exception as exc:  # pylint: disable=broad-except
+                log.debug("TTP failed to resolve targeted minions: %s", exc)
+                # query all targeted minions
+                proxy_config = client.cmd(tgt, "pillar.item", arg=["proxy"], tgt_type=tgt_type)
+                for minion_name, pillar in proxy_config.items():
+                    if isinstance(pillar, dict):
+                        self._entries[minion_name] = (_proxytype_from_pillar(pillar), timestamp)
+                return
+        missing = [
+            minion_name for minion_name in targets if not self._fresh(opts, minion_name, timestamp)
+        ]
+        if not missing:
+            return
+        # query minions that have no cached pillar data
+        proxy_config = client.cmd(missing, "pillar.item", arg=["proxy"], tgt_type="list")
+        for minion_name in missing:
+            pillar = proxy_config.get(minion_name)
+            proxytype = _proxytype_from_pillar(pillar) if isinstance(pillar, dict) else ""
+            self._entries[minion_name] = (proxytype, timestamp)
+
+    def get(self, opts, client, minion_name):
+        """
+        Return minion proxy type, querying minion's pillar if minion not in
+        cache or its entry expired.
+
+        :param opts: SALT master configuration options
+        :param client: SALT ``LocalClient`` object to query minion with
+        :param minion_name: minion ID
+        """
+        if not self._fresh(opts, minion_name, time.monotonic()):
+            pillar = client.cmd(minion_name, "pillar.item", arg=["proxy"]).get(minion_name)
+            proxytype = _proxytype_from_pillar(pillar) if isinstance(pillar, dict) else ""
+            self._entries[minion_name] = (proxytype, time.monotonic())
+        return self._entries[minion_name][0]
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        self._entries.clear()
@@ -0,0 +1,313 @@
+"""
+Multi-process parsing of TTP inputs data
+========================================
+
+``PoolParser`` spreads inputs data items across a pool of worker processes.
+Each worker compiles template once, when worker starts, and reuses it to
+parse all data items sent to it. Workers return parsing results for each
+data item, results combined in parent process in the same order
+``parse(one=True)`` would produce and template outputs run in parent
+process only.
+
+Templates with ``per_template`` results method join results across all
+data items, such templates parsed in parent process.
+
+``IsolatedParser`` parses all data items one by one in a separate worker
+process, so that runaway regular expression or huge input can not pin
+calling process CPU or exhaust its memory. Parsing that did not finish by
+the deadline stopped by terminating worker process, worker address space
+can be limited as well.
+"""
+import multiprocessing.pool
+import time
+
+from saltext.ttp.utils.stream import StreamParser
+
+try:
+    import resource
+
+    HAS_RESOURCE = True
+except ImportError:  # pragma: no cover
+    HAS_RESOURCE = False
+
+try:
+    from ttp import ttp
+
+    HAS_TTP = True
+except ImportError:  # pragma: no cover
+    HAS_TTP = False
+
+# worker process StreamParser object
+_WORKER = None
+
+
+def _init_worker(template_text, template_vars, memory_limit=0):
+    """
+    Pool initializer to compile template within worker process, limiting
+    worker address space to ``memory_limit`` MBytes if given.
+    """
+    global _WORKER  # pylint: disable=global-statement
+    if memory_limit and HAS_RESOURCE:
+        limit = int(memory_limit) * 1048576
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    parser = ttp(vars=template_vars)
+    parser.add_template(template_text)
+    _WORKER = StreamParser(parser)
+
+
+def _parse_in_worker(index, input_name, datum, main_results=None):
+    """
+    Parse data item in pool worker process using worker's stream parser.
+    """
+    return _WORKER.parse_datum(index, input_name, datum, main_results)
+
+
+def _isolated_worker(conn, template_text, template_vars, memory_limit):
+    """
+    Isolated worker process loop to parse data items received over connection
+    until connection closed.
+    """
+    _init_worker(template_text, template_vars, memory_limit)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        try:
+            conn.send((True, _parse_in_worker(*task)))
+        except Exception as exc:  # pylint: disable=broad-except
+            conn.send((False, "{}: {}".format(exc.__class__.__name__, exc)))
+
+
+class PoolParser(StreamParser):
+    """
+    Parse data added to TTP parser object inputs using a pool of processes.
+
+    Errors of parsing data items added with ``source`` collected in ``failed``
+    dictionary and results of their sources discarded, errors of other data
+    items raised by ``finish``.
+
+    :param parser: TTP parser object with template added
+    :param template_text: text of the template added to parser object
+    :param workers: number of worker processes to start
+    :param results_cache: ``ResultsCache`` object to use for parsing results lookup
+    :param cache_prefix: results cache key prefix produced by ``make_results_prefix`` function
+    :param dedup: boolean, if True parse identical text data items only once
+    """
+
+    def __init__(
+        self, parser, template_text, workers, results_cache=None, cache_prefix="", dedup=False
+    ):
+        super().__init__(parser, results_cache, cache_prefix, dedup)
+        self._pool = multiprocessing.Pool(
+            processes=workers,
+            initializer=_init_worker,
+            initargs=(template_text, parser.vars),
+        )
+
+    def _parse_per_input(self, index, input_name, datum):
+        return self._pool.apply_async(_parse_in_worker, (index, input_name, datum))
+
+    def finish(self):
+        """
+        Wait for workers to parse all data items, combine results and run
+        templates outputs.
+        """
+        failed = {}
+        try:
+            for (index, input_name), results in self._results.items():
+                for position, result in enumerate(results):
+                    # results loaded from results cache are not async results
+                    if not isinstance(result, multiprocessing.pool.AsyncResult):
+                        continue
+                    try:
+                        results[position] = result.get()
+                    except Exception as exc:  # pylint: disable=broad-except
+                        source = self._sources.get((index, input_name, position))
+                        # without source error can not be isolated, fail parsing
+                        if source is None:
+                            raise
+                        results[position] = None
+                        failed[(index, input_name, position)] = "{}: {}".format(
+                            exc.__class__.__name__, exc
+                        )
+        finally:
+            self.close()
+        # sources of failed data items and of their duplicates failed as well
+        for index, input_name, position, source_position, _ in self._fanout:
+            if (index, input_name, source_position) in failed:
+                failed[(index, input_name, position)] = failed[(index, input_name, source_position)]
+        for key, error in failed.items():
+            source = self._sources.get(key)
+            if source is not None:
+                self.failed.setdefault(source, error)
+                self.discard(source)
+        super().finish()
+
+    def close(self):
+        """
+        Stop worker processes.
+        """
+        self._pool.terminate()
+        self._pool.join()
+
+
+class ParseError(Exception):
+    """
+    Raised when isolated parsing of data item failed.
+    """
+
+
+class ParseTimeoutError(ParseError):
+    """
+    Raised when isolated parsing did not finish by the deadline.
+    """
+
+
+class IsolatedParser(StreamParser):
+    """
+    Parse data added to TTP parser object inputs in a separate worker process
+    within a deadline.
+
+    Data items parsed one after another once ``finish`` called. If worker did
+    not finish parsing by the deadline, it is terminated, if worker exited,
+    e.g. on exceeding memory limit, new worker started to parse the rest of
+    data items. If ``partial`` is False, the first data item that failed to
+    parse raises ``ParseError``, otherwise results of such data items skipped,
+    failures collected in ``errors`` list and results of the rest of data
+    items returned as usual.
+
+    :param parser: TTP parser object with template added
+    :param template_text: text of the template added to parser object
+    :param timeout: number of seconds to finish parsing of all data items within
+    :param memory_limit: worker process address space limit in MBytes, 0 means no limit
+    :param partial: boolean, if True return results of data items parsed by the deadline
+    :param results_cache: ``ResultsCache`` object to use for parsing results lookup
+    :param cache_prefix: results cache key prefix produced by ``make_results_prefix`` function
+    :param dedup: boolean, if True parse identical text data items only once
+    """
+
+    def __init__(
+        self,
+        parser,
+        template_text,
+        timeout=60,
+        memory_limit=0,
+        partial=False,
+        results_cache=None,
+        cache_prefix="",
+        dedup=False,
+    ):
+        super().__init__(parser, results_cache, cache_prefix, dedup)
+        self.template_text = template_text
+        self.timeout = float(timeout)
+        self.memory_limit = memory_limit
+        self.partial = partial
+        self.errors = []
+        # list of (template index, input name, data item, results position) to parse,
+        # position is None for templates with per_template results method
+        self._pending = []
+        self._process = None
+        self._conn = None
+
+    def _parse_per_input(self, index, input_name, datum):
+        self._pending.append((index, input_name, datum, len(self._results[(index, input_name)])))
+
+    def parse_datum(self, index, input_name, datum, main_results=None):
+        """
+        Queue data item of template with ``per_template`` results method to
+        parse in worker process, results joined across data items once parsed.
+        """
+        self._pending.append((index, input_name, datum, None))
+        return main_results
+
+    def _start_worker(self):
+        """
+        Start isolated worker process and connection to send it data items.
+        """
+        self._conn, worker_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_isolated_worker,
+            args=(worker_conn, self.template_text, self.parser.vars, self.memory_limit),
+            daemon=True,
+        )
+        self._process.start()
+        worker_conn.close()
+
+    def _parse_isolated(self, deadline, index, input_name, datum, main_results):
+        """
+        Parse data item in worker process, returns parsing results or None if
+        parsing failed and partial results allowed.
+        """
+        try:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ParseTimeoutError(
+                    "parsing did not finish within {}s deadline".format(self.timeout)
+                )
+            if self._process is None:
+                self._start_worker()
+            try:
+                self._conn.send((index, input_name, datum, main_results))
+                if not self._conn.poll(remaining):
+                    # stop runaway parsing straight away
+                    self.close()
+                    raise ParseTimeoutError(
+                        "parsing did not finish within {}s deadline".format(self.timeout)
+                    )
+                success, result = self._conn.recv()
+            except (EOFError, OSError) as exc:
+                self._process.join(1)
+                exitcode = self._process.exitcode
+                self.close()
+                raise ParseError("worker process exited with code {}".format(exitcode)) from exc
+            if not success:
+                raise ParseError(result)
+            return result
+        except ParseError as exc:
+            if not self.partial:
+                raise
+            self.errors.append(
+                {"template": self._templates[index].name, "input": input_name, "error": str(exc)}
+            )
+            return None
+
+    def finish(self):
+        """
+        Parse all data items in worker process within the deadline, combine
+        results and run templates outputs.
+        """
+        deadline = time.monotonic() + self.timeout
+        try:
+            for index, input_name, datum, position in self._pending:
+                if position is None:
+                    result = self._parse_isolated(
+                        deadline, index, input_name, datum, self._joined_results.get(index)
+                    )
+                    if result is not None:
+                        self._joined_results[index] = result
+                else:
+                    self._results[(index, input_name)][position] = self._parse_isolated(
+                        deadline, index, input_name, datum, None
+                    )
+        finally:
+            self._pending = []
+            self.close()
+        # templates with per_template results method that failed to parse any data item
+        self._joined_results = {
+            index: result for index, result in self._joined_results.items() if result is not None
+        }
+        super().finish()
+
+    def close(self):
+        """
+        Stop worker process.
+        """
+        if self._process is None:
+            return
+        self._conn.close()
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process.join()
+        self._process = None
+        self._conn = None
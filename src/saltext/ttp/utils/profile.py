@@ -0,0 +1,110 @@
+"""
+Profiling of TTP runs
+=====================
+
+Slow templates are easiest to fix knowing which regexes and match functions
+cost the most on production-sized input. ``profile_call`` runs function
+under ``cProfile``, saves profiling statistics to a file, that can be loaded
+with ``pstats`` or visualised with tools like ``snakeviz``, and returns a
+short summary of hot spots - functions that took the most time themselves,
+excluding time of functions they called.
+
+Only the calling process profiled, time spent by parsing worker processes
+shows up as time spent waiting for their results.
+"""
+import cProfile
+import glob
+import hashlib
+import logging
+import os
+import pstats
+import time
+
+log = logging.getLogger(__name__)
+
+
+def get_profile_path(opts, template):
+    """
+    Return path to new profiling statistics file within SALT ``cachedir``.
+
+    :param opts: SALT configuration options
+    :param template: path to TTP template being profiled
+    """
+    return os.path.join(
+        opts["cachedir"],
+        "ttp",
+        "profiles",
+        "{}-{}-{}.prof".format(
+            time.strftime("%Y%m%dT%H%M%S"),
+            hashlib.sha256(template.encode("utf-8")).hexdigest()[:8],
+            os.getpid(),
+        ),
+    )
+
+
+def prune_profiles(path, keep=10):
+    """
+    Remove the oldest profiling statistics files from the directory of
+    ``path``, keeping ``keep`` most recent files.
+
+    :param path: path to profiling statistics file
+    :param keep: number of files to keep, 0 means keep all files
+    """
+    if not keep:
+        return
+    files = sorted(glob.glob(os.path.join(os.path.dirname(path), "*.prof")), key=os.path.getmtime)
+    for file_path in files[: -int(keep)]:
+        try:
+            os.remove(file_path)
+        except OSError as exc:
+            log.debug("TTP failed to remove profile '%s': %s", file_path, exc)
+
+
+def get_hotspots(stats, top=20):
+    """
+    Return list of ``top`` functions with the largest own time.
+
+    :param stats: ``pstats.Stats`` object
+    :param top: number of functions to return
+    """
+    hotspots = []
+    for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        hotspots.append(
+            {
+                "function": "{}:{}({})".format(filename, line, name),
+                "calls": calls,
+                "tottime": round(tottime, 6),
+                "cumtime": round(cumtime, 6),
+            }
+        )
+    hotspots.sort(key=lambda item: item["tottime"], reverse=True)
+    return hotspots[: int(top)]
+
+
+def profile_call(function, args, kwargs, path, top=20, keep=10):
+    """
+    Call function under ``cProfile``, returns a tuple of (function result,
+    profiling summary). Profiling statistics saved to ``path`` even if function
+    raised an exception.
+
+    :param function: function to profile
+    :param args: function arguments
+    :param kwargs: function keyword arguments
+    :param path: path to file to save profiling statistics to
+    :param top: number of hot spots to include in summary
+    :param keep: number of profiling statistics files to keep in ``path`` directory
+    """
+    profiler = cProfile.Profile()
+    try:
+        result = profiler.runcall(function, *args, **kwargs)
+    finally:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        profiler.dump_stats(path)
+        prune_profiles(path, keep)
+    stats = pstats.Stats(profiler)
+    return result, {
+        "path": path,
+        "total_time": round(stats.total_tt, 6),
+        "calls": stats.total_calls,
+        "hotspots": get_hotspots(stats, top),
+    }
@@ -0,0 +1,136 @@
+"""
+Batched delivery of TTP results to SALT returners
+=================================================
+
+SALT returners take one job return per call, calling returner for every
+parsing results record makes returning large results, e.g. ARP or MAC tables
+of a big network, take as many returner calls, and as many database inserts
+or messages, as there are rows. ``BatchReturner`` buffers records and passes
+them to ``<returner>.returner`` function as a list within a single job return
+once ``batch_size`` records buffered.
+
+Each batch returned as a separate job, with job ID prepared by returner's
+``prep_jid`` function if returner has it, so that returners that store one
+return per job and minion, e.g. ``local_cache``, keep all batches.
+"""
+import logging
+
+import salt.utils.jid
+from saltext.ttp.utils.elasticsearch import iter_documents
+
+log = logging.getLogger(__name__)
+
+
+def batch_return(data, returners, minion_id, opts, **kwargs):
+    """
+    Return TTP results to SALT returner in batches, returns delivery statistics.
+
+    :param data: TTP template results
+    :param returners: SALT returners loader object
+    :param minion_id: ID to return results as
+    :param opts: SALT configuration options to generate job IDs with
+    :param kwargs: TTP returner arguments - ``name``, ``batch_size`` and ``fun``
+    """
+    name = kwargs.get("name", "local_cache")
+    returner = BatchReturner(
+        returners,
+        name,
+        minion_id,
+        opts,
+        batch_size=kwargs.get("batch_size", 100),
+        fun=kwargs.get("fun", "ttp.run"),
+    )
+    for record in iter_documents(data):
+        returner.add(record)
+    stats = returner.close()
+    log.debug("TTP salt returner '%s', delivery statistics: %s", name, stats)
+    return stats
+
+
+class BatchReturner:
+    """
+    Buffer records and pass them to SALT returner in batches.
+
+    Records of batches that returner failed to return, or of all batches if
+    returner not found, counted as failed and logged, but not raised, so that
+    one failed batch does not stop the rest from being returned.
+
+    :param returners: SALT returners loader object
+    :param name: name of SALT returner, e.g. ``local_cache``
+    :param minion_id: ID to return results as
+    :param opts: SALT configuration options to generate job IDs with
+    :param batch_size: maximum number of records per returner call
+    :param fun: function name to return results as
+    """
+
+    def __init__(self, returners, name, minion_id, opts, batch_size=100, fun="ttp.run"):
+        self.name = name
+        self.minion_id = minion_id
+        self.opts = opts
+        self.batch_size = max(int(batch_size), 1)
+        self.fun = fun
+        self._returner = returners.get("{}.returner".format(name))
+        self._prep_jid = returners.get("{}.prep_jid".format(name))
+        if self._returner is None:
+            log.error("TTP salt returner, returner '%s' not found", name)
+        self._records = []
+        self.stats = {"returned": 0, "failed": 0, "batches": 0}
+
+    def add(self, record):
+        """
+        Buffer record, returning buffered records if ``batch_size`` reached.
+
+        :param record: dictionary to return
+        """
+        self._records.append(record)
+        if len(self._records) >= self.batch_size:
+            self.flush()
+
+    def _get_jid(self):
+        """
+        Return job id for batch, generated by returner's ``prep_jid`` if it has one.
+        """
+        if self._prep_jid is not None:
+            return self._prep_jid(nocache=False)
+        return salt.utils.jid.gen_jid(self.opts)
+
+    def flush(self):
+        """
+        Pass buffered records to returner.
+        """
+        if not self._records:
+            return
+        records, self._records = self._records, []
+        if self._returner is None:
+            self.stats["failed"] += len(records)
+            return
+        try:
+            self._returner(
+                {
+                    "id": self.minion_id,
+                    "jid": self._get_jid(),
+                    "fun": self.fun,
+                    "fun_args": [],
+                    "return": records,
+                    "retcode": 0,
+                    "success": True,
+                }
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            log.error(
+                "TTP salt returner '%s' failed to return %s records: %s",
+                self.name,
+                len(records),
+                exc,
+            )
+            self.stats["failed"] += len(records)
+            return
+        self.stats["returned"] += len(records)
+        self.stats["batches"] += 1
+
+    def close(self):
+        """
+        Return remaining records and return delivery statistics.
+        """
+        self.flush()
+        return dict(self.stats)
@@ -0,0 +1,132 @@
+"""
+Spool of failed TTP results deliveries
+======================================
+
+Results that failed to be delivered, e.g. because Elasticsearch was down,
+appended to a spool file in SALT ``cachedir`` as JSON lines instead of being
+dropped, and can be replayed later without running commands and parsing their
+output again.
+
+Spool file size capped by ``max_bytes``, records that do not fit dropped,
+records older than ``max_age`` seconds dropped on replay. Spool file locked
+while records appended or replayed, so that several processes can share it.
+Records are only removed from spool file once replay completed, records that
+failed to be delivered again kept in the spool.
+"""
+import logging
+import os
+import time
+
+import salt.utils.files
+import salt.utils.json
+
+log = logging.getLogger(__name__)
+
+
+def get_spool_path(opts):
+    """
+    Return path to TTP spool file within SALT ``cachedir``.
+
+    :param opts: SALT configuration options
+    """
+    return os.path.join(opts["cachedir"], "ttp", "spool.jsonl")
+
+
+def get_spool(opts):
+    """
+    Return failed deliveries spool, returns None if spool disabled.
+
+    :param opts: SALT configuration options
+    """
+    if not opts.get("ttp_spool", True) or not opts.get("cachedir"):
+        return None
+    return Spool(
+        get_spool_path(opts),
+        max_bytes=opts.get("ttp_spool_max_bytes", 104857600),
+        max_age=opts.get("ttp_spool_max_age", 604800),
+    )
+
+
+class Spool:
+    """
+    Append only spool file of failed deliveries records.
+
+    :param path: path to spool file
+    :param max_bytes: maximum size of spool file in bytes
+    :param max_age: number of seconds to keep records for, 0 means forever
+    """
+
+    def __init__(self, path, max_bytes=104857600, max_age=604800):
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.max_age = int(max_age)
+
+    def append(self, records):
+        """
+        Append records to spool file, returns number of records appended.
+
+        :param records: list of dictionaries to save, ``timestamp`` key added to
+            records that do not have it
+        """
+        if not records:
+            return 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        timestamp = time.time()
+        appended = 0
+        with salt.utils.files.flopen(self.path, "a") as spool_file:
+            size = os.fstat(spool_file.fileno()).st_size
+            for record in records:
+                line = salt.utils.json.dumps(dict({"timestamp": timestamp}, **record)) + "\n"
+                if size + len(line) > self.max_bytes:
+                    continue
+                spool_file.write(line)
+                size += len(line)
+                appended += 1
+        if appended < len(records):
+            log.error(
+                "TTP spool '%s' is full, dropped %s records", self.path, len(records) - appended
+            )
+        return appended
+
+    def replay(self, deliver):
+        """
+        Replay spooled records, returns replay statistics.
+
+        Spool file stays locked until replay completes, records that ``deliver``
+        failed to deliver written back to the spool.
+
+        :param deliver: function that takes a list of records and returns a list
+            of records failed to deliver
+        """
+        stats = {"replayed": 0, "failed": 0, "expired": 0}
+        if not os.path.exists(self.path):
+            return stats
+        with salt.utils.files.flopen(self.path, "r+") as spool_file:
+            records = []
+            for line in spool_file:
+                try:
+                    record = salt.utils.json.loads(line)
+                except ValueError:
+                    log.error("TTP spool '%s' has malformed record, skipping it", self.path)
+                    continue
+                if self.max_age and time.time() - record["timestamp"] > self.max_age:
+                    stats["expired"] += 1
+                    continue
+                records.append(record)
+            failed = deliver(records) if records else []
+            spool_file.seek(0)
+            spool_file.truncate()
+            for record in failed:
+                spool_file.write(salt.utils.json.dumps(record) + "\n")
+        stats["replayed"] = len(records) - len(failed)
+        stats["failed"] = len(failed)
+        return stats
+
+    def size(self):
+        """
+        Return number of records in spool file.
+        """
+        if not os.path.exists(self.path):
+            return 0
+        with salt.utils.files.fopen(self.path, "r") as spool_file:
+            return sum(1 for _ in spool_file)
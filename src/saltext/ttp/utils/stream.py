@@ -0,0 +1,264 @@
+"""
+Streaming parsing of TTP inputs data
+====================================
+
+TTP parser object parses data only after all of it was added to template
+inputs, holding all raw text in memory until ``parse`` method called.
+``StreamParser`` parses each data item as soon as it is added and drops it
+straight away, keeping only parsing results. Once all data added, results
+combined in the same order ``parse(one=True)`` would produce and template
+outputs run, after that ``parser.result`` method can be used as usual.
+
+TTP does not provide public API to parse data item by item, this class
+reproduces TTP single process parsing logic using its internal classes.
+
+If ``ResultsCache`` object given, parsing results of text data items looked
+up in it before parsing and saved in it after parsing. Templates that use
+``per_template`` results method join results across all data items, their
+results never cached.
+
+With ``dedup`` enabled, text data items identical to previously added ones
+not parsed again, results of the first such data item copied instead. If
+data item added together with device ``prompt``, ``\nprompt#`` occurrences
+replaced with a placeholder before looking for duplicates and placeholder
+replaced back with the prompt in parsing results, so that outputs of devices
+that differ only by prompt parsed once as well.
+
+Data items can be added together with their ``source``, e.g. minion name, so
+that results of all data items of a source can be discarded, e.g. once one
+of its data items failed to parse. Templates with ``per_template`` results
+method join results as data items parsed, their results can not be discarded.
+"""
+import copy
+
+from saltext.ttp.utils.cache import make_results_key
+
+PROMPT_PLACEHOLDER = "TTP_DEDUP_PROMPT"
+
+try:
+    from ttp.ttp import _parser_class
+
+    HAS_TTP = True
+except ImportError:  # pragma: no cover
+    HAS_TTP = False
+
+
+def _replace_placeholder(data, prompt):
+    """
+    Replace prompt placeholder with prompt in parsing results.
+    """
+    if isinstance(data, str):
+        return data.replace(PROMPT_PLACEHOLDER, prompt)
+    if isinstance(data, dict):
+        return {
+            _replace_placeholder(key, prompt): _replace_placeholder(value, prompt)
+            for key, value in data.items()
+        }
+    if isinstance(data, list):
+        return [_replace_placeholder(item, prompt) for item in data]
+    return data
+
+
+class StreamParser:
+    """
+    Parse data added to TTP parser object inputs item by item.
+
+    :param parser: TTP parser object with template added
+    :param results_cache: ``ResultsCache`` object to use for parsing results lookup
+    :param cache_prefix: results cache key prefix produced by ``make_results_prefix`` function
+    :param dedup: boolean, if True parse identical text data items only once
+    """
+
+    def __init__(self, parser, results_cache=None, cache_prefix="", dedup=False):
+        self.parser = parser
+        self._ttp_ = parser._ttp_  # pylint: disable=protected-access
+        self._templates = parser._templates  # pylint: disable=protected-access
+        self._parsers = {}
+        # per_input results keyed by template index and input name
+        self._results = {}
+        # per_template results keyed by template index
+        self._joined_results = {}
+        self.results_cache = results_cache
+        self.cache_prefix = cache_prefix
+        # list of (cache key, template index, input name, results position) to store
+        self._to_store = []
+        self.dedup = dedup
+        # results position of first data item keyed by data item key
+        self._seen = {}
+        # list of (template index, input name, results position, source position, prompt)
+        self._fanout = []
+        # data items source keyed by (template index, input name, results position)
+        self._sources = {}
+        # sources to discard results of
+        self._discarded = set()
+        # error messages of data items that failed to parse keyed by their source
+        self.failed = {}
+
+    def _get_parser(self, index):
+        """
+        Return parser object for template at given index, creating it on first use.
+        """
+        if index not in self._parsers:
+            template = self._templates[index]
+            self._parsers[index] = _parser_class(
+                lookups=template.lookups,
+                vars=template.vars,
+                groups=template.groups,
+                _ttp_=self._ttp_,
+            )
+        return self._parsers[index]
+
+    def _get_input(self, template, input_name):
+        """
+        Return template's input object, creating empty input if template has none.
+        """
+        if input_name not in template.inputs:
+            template.update_input(data=[], input_name=input_name)
+        return template.inputs[input_name]
+
+    def parse_datum(self, index, input_name, datum, main_results=None):
+        """
+        Parse single data item with template and return parsing results.
+
+        :param index: index of template in parser object templates list
+        :param input_name: name of template input to use groups and functions of
+        :param datum: tuple of (data type, data) as produced by TTP ``load_files`` function
+        :param main_results: dictionary of results to merge data item results with
+        """
+        template = self._templates[index]
+        input_obj = self._get_input(template, input_name)
+        parser_obj = self._get_parser(index)
+        self._ttp_["macro"] = template.macro
+        self._ttp_["template_obj"] = template
+        parser_obj.set_data(datum, main_results=main_results, input_functions=input_obj.functions)
+        parser_obj.parse(groups_indexes=input_obj.groups_indexes)
+        return parser_obj.main_results
+
+    def _get_results_key(self, index, input_name, datum):
+        """
+        Return results cache key for data item, None if results not cached or deduplicated.
+        """
+        if (self.results_cache is None and not self.dedup) or datum[0] != "text_data":
+            return None
+        return make_results_key(self.cache_prefix, index, input_name, datum[1])
+
+    def _parse_per_input(self, index, input_name, datum):
+        """
+        Parse per_input template data item, overridden by parallel parsers.
+        """
+        return self.parse_datum(index, input_name, datum)
+
+    def add_input(
+        self,
+        data,
+        input_name="Default_Input",
+        template_name="_root_template_",
+        prompt=None,
+        source=None,
+    ):
+        """
+        Parse data with template input groups, arguments have the same meaning
+        as for TTP parser object ``add_input`` method.
+
+        :param prompt: device prompt to replace with placeholder when looking for duplicates
+        :param source: name of data source, e.g. minion name, to discard results by
+        """
+        datums = self._ttp_["utils"]["load_files"](path=data, read=False)
+        for index, template in enumerate(self._templates):
+            if template.name != template_name and template_name != "_all_":
+                continue
+            self._get_input(template, input_name)
+            for datum in datums:
+                if template.results_method.lower() == "per_template":
+                    self._joined_results[index] = self.parse_datum(
+                        index, input_name, datum, self._joined_results.get(index)
+                    )
+                    continue
+                self._add_datum(index, input_name, datum, prompt, source)
+
+    def _add_datum(self, index, input_name, datum, prompt=None, source=None):
+        """
+        Add single data item to template's input, parsing it unless its results
+        cached or deduplicated, ``source`` is the name to discard results by.
+        """
+        if not (self.dedup and prompt and datum[0] == "text_data"):
+            prompt = None
+        if prompt:
+            datum = (
+                datum[0],
+                datum[1].replace("\n{}#".format(prompt), "\n{}#".format(PROMPT_PLACEHOLDER)),
+            )
+        results = self._results.setdefault((index, input_name), [])
+        position = len(results)
+        if source is not None:
+            self._sources[(index, input_name, position)] = source
+        key = self._get_results_key(index, input_name, datum)
+        if self.dedup and key in self._seen:
+            # results copied from the first identical data item when parsing finished
+            results.append(None)
+            self._fanout.append((index, input_name, position, self._seen[key], prompt))
+            return
+        cached = self.results_cache.fetch(key) if key and self.results_cache else None
+        if cached is not None:
+            results.append(cached)
+        else:
+            if key and self.results_cache:
+                self._to_store.append((key, index, input_name, position))
+            results.append(self._parse_per_input(index, input_name, datum))
+        if self.dedup and key:
+            self._seen[key] = position
+        if prompt:
+            self._fanout.append((index, input_name, position, position, prompt))
+
+    def discard(self, source):
+        """
+        Discard results of all data items of given source, including data
+        items added after this call.
+
+        :param source: name of data source
+        """
+        self._discarded.add(source)
+
+    def _fan_out(self):
+        """
+        Copy results of first identical data items and replace prompt placeholder.
+        """
+        copies = []
+        for index, input_name, position, source, prompt in self._fanout:
+            result = self._results[(index, input_name)][source]
+            if position != source:
+                result = copy.deepcopy(result)
+            if prompt:
+                result = _replace_placeholder(result, prompt)
+            copies.append((index, input_name, position, result))
+        for index, input_name, position, result in copies:
+            self._results[(index, input_name)][position] = result
+        self._fanout = []
+        self._seen = {}
+
+    def finish(self):
+        """
+        Combine parsing results in templates' inputs order and run templates outputs.
+        """
+        for key, index, input_name, position in self._to_store:
+            result = self._results[(index, input_name)][position]
+            if result is not None:
+                self.results_cache.store(key, result)
+        self._to_store = []
+        self._fan_out()
+        for index, template in enumerate(self._templates):
+            if template.results_method.lower() == "per_template":
+                template.form_results(self._joined_results.pop(index, {}))
+            else:
+                for input_name in template.inputs:
+                    results = self._results.pop((index, input_name), [])
+                    for position, result in enumerate(results):
+                        # None is the result of data item that failed to parse
+                        if result is None:
+                            continue
+                        if self._sources.get((index, input_name, position)) in self._discarded:
+                            continue
+                        template.form_results(result)
+            template.run_outputs()
+        self._sources = {}
+        self._discarded = set()
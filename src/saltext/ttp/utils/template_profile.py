@@ -0,0 +1,308 @@
+"""
+Per-group and per-regex profiling of TTP templates
+==================================================
+
+Function level profiling tells that time spent in ``re`` module, but not
+which of template's lines is expensive. ``TemplateProfiler`` instruments
+parser with template loaded - each group's regular expression and each match
+variable function used by template - to collect time spent and number of
+matches per group, per regular expression and per match function while
+parsing given text.
+
+Regular expressions also checked for nested quantifiers, e.g. ``(\\S+\\s*)+``,
+that make regex engine try exponential number of ways to match text that
+almost matches, known as catastrophic backtracking, and regexes that scan
+text slower than ``slow_threshold`` seconds per MByte flagged as slow.
+
+Instrumented parser must only be used for profiling, as instrumentation not
+removed once profiling done.
+"""
+import time
+
+# standard library has no public API to parse regular expression, regex parser
+# used by ``re`` itself is used instead, it is only used to flag nested
+# quantifiers, any failure to use it reported as no nested quantifiers found
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:  # pragma: no cover
+    import sre_parse  # pylint: disable=deprecated-module
+
+# opcodes created at import time, pylint can not infer them
+# pylint: disable=no-member
+REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+SUBPATTERN = sre_parse.SUBPATTERN
+BRANCH = sre_parse.BRANCH
+# pylint: enable=no-member
+
+
+def _flatten(items):
+    """
+    Return list of regex items unwrapping groups, e.g. ``(a)(b)`` to ``ab``.
+    """
+    flat = []
+    for opcode, args in items:
+        if opcode is SUBPATTERN:
+            flat.extend(_flatten(args[-1]))
+        else:
+            flat.append((opcode, args))
+    return flat
+
+
+def _is_ambiguous(items):
+    """
+    Return True if sequence of regex items has a repeated item and every item
+    in it is either repeated or optional, meaning that text can be split
+    between items in many ways.
+    """
+    items = _flatten(items)
+    repeated = False
+    for opcode, args in items:
+        if opcode not in REPEATS:
+            return False
+        low, high, _ = args
+        if high > 1:
+            repeated = True
+        elif low > 0:
+            return False
+    return repeated
+
+
+def has_nested_quantifiers(pattern):
+    """
+    Return True if regular expression has repeated group made of repeated or
+    optional items only, e.g. ``(a+)+`` or ``(\\S+\\s*)*``.
+
+    :param pattern: regular expression string
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:  # pylint: disable=broad-except
+        return False
+
+    def walk(items):
+        for opcode, args in items:
+            if opcode in REPEATS:
+                if args[1] > 1 and _is_ambiguous(args[2]):
+                    return True
+                if walk(args[2]):
+                    return True
+            elif opcode is SUBPATTERN:
+                if walk(args[-1]):
+                    return True
+            elif opcode is BRANCH:
+                if any(walk(branch) for branch in args[1]):
+                    return True
+        return False
+
+    return walk(parsed)
+
+
+def _iter_groups(groups):
+    """
+    Iterate over groups and all their child groups.
+    """
+    for group in groups:
+        yield group
+        yield from _iter_groups(group.children)
+
+
+def _iter_templates(templates):
+    """
+    Iterate over templates and all their child templates.
+    """
+    for template in templates:
+        yield template
+        yield from _iter_templates(getattr(template, "templates", []))
+
+
+class _TimedPattern:
+    """
+    Compiled regex proxy that records time spent finding matches and number
+    of matches found.
+    """
+
+    def __init__(self, pattern, stats, profiler):
+        self._pattern = pattern
+        self._stats = stats
+        self._profiler = profiler
+
+    def finditer(self, string, *args):
+        """
+        Find regex matches in string recording time spent and matches found.
+        """
+        # match variable functions called next are called for this regex matches
+        self._profiler.current = self._stats
+        start = time.perf_counter()
+        matches = list(self._pattern.finditer(string, *args))
+        self._stats["time"] += time.perf_counter() - start
+        self._stats["calls"] += 1
+        self._stats["matches"] += len(matches)
+        self._stats["bytes_scanned"] += len(string)
+        return iter(matches)
+
+    def __getattr__(self, name):
+        return getattr(self._pattern, name)
+
+
+class TemplateProfiler:
+    """
+    Instrument TTP parser to profile its templates' groups, regular
+    expressions and match functions.
+
+    :param parser: TTP parser object with template loaded
+    :param slow_threshold: number of seconds per MByte of scanned text to
+        flag regex as slow
+    """
+
+    def __init__(self, parser, slow_threshold=0.1):
+        self.parser = parser
+        self.slow_threshold = slow_threshold
+        self.current = None
+        self._groups = []
+        self._functions = {}
+        self._wrap_regexes()
+        self._wrap_functions()
+
+    def _wrap_regexes(self):
+        """
+        Replace groups' regexes with timed proxies and collect match functions they use.
+        """
+        for template in _iter_templates(self.parser._templates):  # pylint: disable=protected-access
+            for group in _iter_groups(template.groups):
+                regexes = []
+                for regex in group.start_re + group.end_re + group.re:
+                    stats = {
+                        "regex": regex["REGEX"].pattern,
+                        "action": regex["ACTION"],
+                        "variables": sorted(
+                            variable.var_name_original for variable in regex["VARIABLES"].values()
+                        ),
+                        "calls": 0,
+                        "time": 0.0,
+                        "matches": 0,
+                        "bytes_scanned": 0,
+                        "functions": {},
+                    }
+                    regex["REGEX"] = _TimedPattern(regex["REGEX"], stats, self)
+                    regexes.append(stats)
+                    for variable in regex["VARIABLES"].values():
+                        self._functions.update(
+                            (function["name"], None) for function in variable.functions
+                        )
+                self._groups.append(
+                    {
+                        "template": template.name,
+                        "group": ".".join(group.path) or group.name,
+                        "regexes": regexes,
+                    }
+                )
+
+    def _wrap_functions(self):
+        """
+        Replace match functions used by template with timed wrappers.
+        """
+        match_functions = self.parser._ttp_["match"]  # pylint: disable=protected-access
+        for name in list(self._functions):
+            function = match_functions.get(name)
+            if function is None:
+                # not a match function, e.g. string method, timed as part of parsing
+                continue
+            # lazily imported functions replace themselves once loaded, load them first
+            if hasattr(function, "load"):
+                function.load()
+                function = match_functions[name]
+            match_functions[name] = self._timed_function(name, function)
+
+    def _timed_function(self, name, function):
+        """
+        Return function wrapper that records its calls against regex being matched.
+        """
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if self.current is not None:
+                    stats = self.current["functions"].setdefault(name, {"calls": 0, "time": 0.0})
+                    stats["calls"] += 1
+                    stats["time"] += time.perf_counter() - start
+
+        return wrapper
+
+    def _regex_warnings(self, regex):
+        """
+        Return list of warnings for regex statistics.
+        """
+        warnings = []
+        if has_nested_quantifiers(regex["regex"]):
+            warnings.append("nested quantifiers, catastrophic backtracking possible")
+        # ignore regexes that took too little time to measure reliably
+        if regex["bytes_scanned"] and regex["time"] > 0.001:
+            seconds_per_mb = regex["time"] / regex["bytes_scanned"] * 1048576
+            if seconds_per_mb > self.slow_threshold:
+                warnings.append("slow, {:.3f}s per MByte scanned".format(seconds_per_mb))
+        return warnings
+
+    def parse(self):
+        """
+        Parse inputs added to parser, returns profiling report.
+        """
+        start = time.perf_counter()
+        self.parser.parse(one=True)
+        total_time = time.perf_counter() - start
+        return self.report(total_time)
+
+    def report(self, total_time):
+        """
+        Return profiling report, groups and regexes sorted by time spent.
+
+        :param total_time: overall parsing time in seconds
+        """
+        groups = []
+        warnings = []
+        regex_time = 0.0
+        functions_time = 0.0
+        for group in self._groups:
+            regexes = []
+            for regex in group["regexes"]:
+                functions = {
+                    name: {"calls": stats["calls"], "time": round(stats["time"], 6)}
+                    for name, stats in regex["functions"].items()
+                }
+                function_time = sum((stats["time"] for stats in regex["functions"].values()), 0.0)
+                regex_time += regex["time"]
+                functions_time += function_time
+                regex_warnings = self._regex_warnings(regex)
+                warnings.extend(
+                    {"group": group["group"], "regex": regex["regex"], "warning": warning}
+                    for warning in regex_warnings
+                )
+                regexes.append(
+                    dict(
+                        regex,
+                        time=round(regex["time"], 6),
+                        functions_time=round(function_time, 6),
+                        functions=functions,
+                        warnings=regex_warnings,
+                    )
+                )
+            regexes.sort(key=lambda item: item["time"] + item["functions_time"], reverse=True)
+            groups.append(
+                {
+                    "template": group["template"],
+                    "group": group["group"],
+                    "time": round(sum(i["time"] + i["functions_time"] for i in regexes), 6),
+                    "matches": sum(regex["matches"] for regex in regexes),
+                    "regexes": regexes,
+                }
+            )
+        groups.sort(key=lambda item: item["time"], reverse=True)
+        return {
+            "total_time": round(total_time, 6),
+            "regex_time": round(regex_time, 6),
+            "functions_time": round(functions_time, 6),
+            "results_time": round(max(total_time - regex_time - functions_time, 0.0), 6),
+            "groups": groups,
+            "warnings": warnings,
+        }
@@ -0,0 +1,70 @@
+"""
+Text extraction from SALT functions returns
+===========================================
+
+Network devices commands output returned by ``net.cli`` and ``nr.cli``
+functions combined in a single blob of text per device, reconstructing
+device's prompt by placing ``name#command`` line in front of each command
+output. Text assembled from a stream of chunks joined once, so that it takes
+linear time regardless of the number and size of commands outputs.
+"""
+
+
+def _iter_chunks(prompt, commands):
+    """
+    Yield chunks of text made of commands and their outputs preceded by prompt.
+    """
+    for command, output in commands.items():
+        yield "\n"
+        yield prompt
+        yield "#"
+        yield str(command)
+        yield "\n"
+        yield str(output)
+
+
+def join_commands_output(prompt, commands):
+    """
+    Return text of commands output with ``prompt#command`` line in front
+    of each command output.
+
+    :param prompt: device prompt, e.g. minion ID or host name
+    :param commands: dictionary keyed by command with command output as values
+    """
+    return "".join(_iter_chunks(prompt, commands))
+
+
+def get_text_from_run_result(run_results, prompt, function_name=None, proxytype=None):
+    """
+    Extract text from SALT function return. Returns list of text items,
+    one item per device, or list with return itself if no text extracted.
+
+    :param run_results: SALT function return
+    :param prompt: device prompt to use for ``net.cli`` returns, normally minion ID
+    :param function_name: name of SALT function that produced the return
+    :param proxytype: proxy minion type, used to process ``mine.get`` returns
+    """
+    results_data = []
+    if function_name == "net.cli":
+        # run_results structure is:
+        # {"out": {command1: "result1", command2: "result2"}}
+        results_data.append(join_commands_output(prompt, run_results["out"]))
+    elif function_name == "nr.cli":
+        # run_results structure is: {'hostname': {'command1': 'output1'}}
+        for hostname, commands in run_results.items():
+            results_data.append(join_commands_output(hostname, commands))
+    elif function_name == "mine.get":
+        # mine assumed to be collected with the function proxy minion type uses
+        function_name = {"napalm": "net.cli", "nornir": "nr.cli"}.get(proxytype)
+        for output in run_results.values():
+            results_data += get_text_from_run_result(output, prompt, function_name=function_name)
+    elif isinstance(run_results, str):
+        results_data.append(run_results)
+    elif isinstance(run_results, list):
+        # concatenate list of string items if any
+        temp = "\n{}".join([i for i in run_results if isinstance(i, str)])
+        if temp:
+            results_data.append(temp)
+    if results_data:
+        return results_data
+    return [run_results]
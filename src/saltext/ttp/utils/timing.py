@@ -0,0 +1,172 @@
+"""
+Timing of TTP run stages
+========================
+
+``Timer`` collects wall-clock and CPU time spent in each stage of a run,
+e.g. template fetch, commands execution, text extraction, parsing or results
+delivery, together with per-input command latencies and sizes of text
+produced by each input, so that it is possible to tell which stage makes a
+run slow before tuning anything.
+
+CPU time measured for the thread that runs the stage, time spent by other
+threads or processes, e.g. by concurrent inputs, parsing workers or
+asynchronous deliveries, shows up as wall-clock time only. Python versions
+before 3.7 have no per-thread CPU clock, process CPU time used instead.
+Stages can be nested, e.g. returners run as part of parsing, in which case
+time of inner stage counted in outer stage as well.
+
+Timer disabled by default, disabled timer records nothing, its methods cost
+next to nothing, so that instrumented code does not need to check if timing
+enabled.
+"""
+import contextlib
+import functools
+import threading
+import time
+
+# timer whose stage is running in current thread
+_CURRENT = threading.local()
+# per-thread CPU clock is only available starting with Python 3.7
+_thread_time = getattr(time, "thread_time", time.process_time)
+
+
+def timed(stage):
+    """
+    Decorator to record time spent in function as a stage of the timer
+    whose stage function called within, e.g. to time TTP returners called by
+    parser.
+
+    :param stage: name of the stage
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            timer = getattr(_CURRENT, "timer", None)
+            if timer is None:
+                return function(*args, **kwargs)
+            with timer.stage(stage):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class Timer:
+    """
+    Collect per-stage and per-input timings of a run.
+
+    :param enabled: boolean, if False timer records nothing
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._wall = time.perf_counter()
+        self._cpu = _thread_time()
+        self._stages = {}
+        self._inputs = {}
+
+    def _add(self, name, wall, cpu):
+        """
+        Add time spent in stage to stage statistics.
+        """
+        stats = self._stages.setdefault(name, {"wall": 0.0, "cpu": 0.0, "calls": 0})
+        stats["wall"] += wall
+        stats["cpu"] += cpu
+        stats["calls"] += 1
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Context manager to record time spent within it as a stage.
+
+        :param name: name of the stage
+        """
+        if not self.enabled:
+            yield
+            return
+        previous = getattr(_CURRENT, "timer", None)
+        _CURRENT.timer = self
+        wall, cpu = time.perf_counter(), _thread_time()
+        try:
+            yield
+        finally:
+            self._add(name, time.perf_counter() - wall, _thread_time() - cpu)
+            _CURRENT.timer = previous
+
+    def iterate(self, name, iterable):
+        """
+        Iterate over iterable recording time spent waiting for its items as a stage,
+        e.g. to time collection of minions' returns.
+
+        :param name: name of the stage
+        :param iterable: iterable to iterate over
+        """
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def elapsed(self):
+        """
+        Return number of seconds elapsed since timer created.
+        """
+        return time.perf_counter() - self._wall
+
+    def record_input(self, template_name, input_name, function, latency=None, items=()):
+        """
+        Record input's command latency and size of text it produced.
+
+        :param template_name: name of the template input belongs to
+        :param input_name: name of the input
+        :param function: name of the function input ran
+        :param latency: number of seconds command took, the largest latency kept
+        :param items: list of text items produced out of command output
+        """
+        if not self.enabled:
+            return
+        stats = self._inputs.setdefault(
+            (template_name, input_name),
+            {"function": function, "returns": 0, "latency": 0.0, "bytes": 0},
+        )
+        stats["returns"] += 1
+        if latency is not None:
+            stats["latency"] = max(stats["latency"], latency)
+        stats["bytes"] += sum(len(item.encode("utf-8")) for item in items if isinstance(item, str))
+
+    def report(self):
+        """
+        Return dictionary of timings, times are in seconds.
+        """
+        return {
+            "total": {
+                "wall": round(time.perf_counter() - self._wall, 6),
+                "cpu": round(_thread_time() - self._cpu, 6),
+            },
+            "stages": {
+                name: {
+                    "wall": round(stats["wall"], 6),
+                    "cpu": round(stats["cpu"], 6),
+                    "calls": stats["calls"],
+                }
+                for name, stats in self._stages.items()
+            },
+            "inputs": [
+                dict(
+                    stats,
+                    template=template_name,
+                    input=input_name,
+                    latency=round(stats["latency"], 6),
+                )
+                for (template_name, input_name), stats in self._inputs.items()
+            ],
+            "input_bytes": sum(stats["bytes"] for stats in self._inputs.values()),
+        }
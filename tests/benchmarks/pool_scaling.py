@@ -0,0 +1,106 @@
+"""
+Benchmark multi-process parsing scaling with number of worker processes.
+
+Parses synthetic interfaces configuration of ``--minions`` devices with
+single process TTP parsing and with ``PoolParser`` using each number of
+workers from ``--workers`` list, printing one JSON document per run::
+
+    python tests/benchmarks/pool_scaling.py --minions 500 --interfaces 200 --workers 1,2,4,8
+"""
+import argparse
+import json
+import os
+import time
+
+from saltext.ttp.utils.pool import PoolParser
+from ttp import ttp
+
+TEMPLATE = """
+<group name="interfaces">
+interface {{ interface }}
+ description {{ description | ORPHRASE }}
+ encapsulation dot1Q {{ dot1q }}
+ vrf forwarding {{ vrf }}
+ ip address {{ ip }} {{ mask }}
+ shutdown {{ disabled | set(True) }}
+</group>
+"""
+
+INTERFACE = """
+interface GigabitEthernet1/{index}.{index}
+ description Link to device {minion} port {index}
+ encapsulation dot1Q {index}
+ vrf forwarding VRF{index}
+ ip address 10.{minion}.{index}.1 255.255.255.0
+!"""
+
+
+def make_data(minions, interfaces):
+    return [
+        "\n".join(INTERFACE.format(minion=m % 250, index=i) for i in range(interfaces))
+        for m in range(minions)
+    ]
+
+
+def run_single_process(data):
+    parser = ttp(template=TEMPLATE)
+    for item in data:
+        parser.add_input(data=item)
+    parser.parse(one=True)
+    return parser.result()
+
+
+def run_pool(data, workers):
+    parser = ttp()
+    parser.add_template(TEMPLATE)
+    pool_parser = PoolParser(parser, TEMPLATE, workers)
+    for item in data:
+        pool_parser.add_input(data=item)
+    pool_parser.finish()
+    return parser.result()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--minions", type=int, default=200)
+    arg_parser.add_argument("--interfaces", type=int, default=100)
+    arg_parser.add_argument("--workers", default="1,2,4,{}".format(os.cpu_count() or 1))
+    args = arg_parser.parse_args()
+    data = make_data(args.minions, args.interfaces)
+    start = time.perf_counter()
+    expected = run_single_process(data)
+    baseline = time.perf_counter() - start
+    print(
+        json.dumps(
+            {
+                "mode": "single_process",
+                "workers": 1,
+                "cpu_count": os.cpu_count(),
+                "minions": args.minions,
+                "bytes": sum(len(i) for i in data),
+                "seconds": round(baseline, 3),
+            }
+        )
+    )
+    for workers in sorted({int(i) for i in args.workers.split(",")}):
+        start = time.perf_counter()
+        result = run_pool(data, workers)
+        elapsed = time.perf_counter() - start
+        assert result == expected, "pool results differ from single process results"
+        print(
+            json.dumps(
+                {
+                    "mode": "pool",
+                    "workers": workers,
+                    "cpu_count": os.cpu_count(),
+                    "minions": args.minions,
+                    "bytes": sum(len(i) for i in data),
+                    "seconds": round(elapsed, 3),
+                    "speedup": round(baseline / elapsed, 2),
+                }
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
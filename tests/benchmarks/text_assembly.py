@@ -0,0 +1,70 @@
+"""
+Benchmark text assembly of ``nr.cli`` returns.
+
+Compares repeated string concatenation previously used to combine commands
+output with ``join_commands_output`` on ``--hosts`` hosts, each returning
+``--commands`` commands output of ``--size`` bytes, printing one JSON document
+per implementation::
+
+    python tests/benchmarks/text_assembly.py --hosts 20 --commands 10 --size 2000000
+"""
+import argparse
+import json
+import time
+
+from saltext.ttp.utils.text import get_text_from_run_result
+
+
+def concat_text(run_results):
+    results_data = []
+    for hostname, commands in run_results.items():
+        results_data.append("")
+        for command, output in commands.items():
+            results_data[-1] += "\n{}#{}\n{}".format(hostname, command, output)
+    return results_data
+
+
+def join_text(run_results):
+    return get_text_from_run_result(run_results, "minion_1", function_name="nr.cli")
+
+
+def make_data(hosts, commands, size):
+    line = "interface GigabitEthernet1/1 is up, line protocol is up\n"
+    output = line * (size // len(line))
+    return {
+        "RT-{}".format(host): {"show command {}".format(i): output for i in range(commands)}
+        for host in range(hosts)
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--hosts", type=int, default=20)
+    arg_parser.add_argument("--commands", type=int, default=10)
+    arg_parser.add_argument("--size", type=int, default=2000000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+    data = make_data(args.hosts, args.commands, args.size)
+    expected = concat_text(data)
+    for name, function in [("concat", concat_text), ("join", join_text)]:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = function(data)
+            timings.append(time.perf_counter() - start)
+        assert result == expected, "{} results differ".format(name)
+        print(
+            json.dumps(
+                {
+                    "mode": name,
+                    "hosts": args.hosts,
+                    "commands": args.commands,
+                    "bytes": sum(len(i) for i in result),
+                    "seconds": round(min(timings), 3),
+                }
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Benchmark ``ttp.run`` execution module and runner functions.
+
+Drives execution module ``run`` with stubbed ``__salt__`` and runner ``run``
+with a fake ``LocalClient`` returning synthetic interfaces configuration of
+``--sizes`` bytes per minion for each fleet width from ``--minions`` list,
+running each scenario with every set of ``run`` arguments from ``--modes``
+list. Prints one JSON document per scenario with throughput, latency
+percentiles and peak memory, appending them to ``--output`` file as well
+if given::
+
+    python tests/benchmarks/ttp_run.py --target module --sizes 1KB,1MB,50MB
+    python tests/benchmarks/ttp_run.py --target runner --minions 1,100,1000,5000 --sizes 1KB
+    python tests/benchmarks/ttp_run.py --target runner --modes default,stream,workers=4,stream+dedup
+
+Modes are comma separated, each mode is a set of ``run`` arguments joined
+with ``+``, ``name`` means ``name=True``, ``default`` means no arguments.
+Modes with arguments that target's ``run`` does not support skipped, e.g.
+``workers`` for execution module. Minions return ``--variants`` distinct
+outputs, so that ``dedup`` and ``results_cache`` modes have something to
+reuse. Peak memory measured with ``tracemalloc`` in a separate run, it does
+not include memory of parsing worker processes.
+"""
+import argparse
+import hashlib
+import importlib.metadata
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import salt.config
+import salt.version
+import saltext.ttp.modules.ttpmod as ttp_module
+import saltext.ttp.runners.ttpmod as ttp_runner
+
+TEMPLATE_PATH = "salt://ttp/benchmark_interfaces.txt"
+
+TEMPLATE = """
+<group name="interfaces">
+interface {{ interface }}
+ description {{ description | ORPHRASE }}
+ encapsulation dot1Q {{ dot1q }}
+ vrf forwarding {{ vrf }}
+ ip address {{ ip }} {{ mask }}
+ shutdown {{ disabled | set(True) }}
+</group>
+"""
+
+INTERFACE = """
+interface GigabitEthernet1/{index}.{index}
+ description Link to device {variant} port {index}
+ encapsulation dot1Q {index}
+ vrf forwarding VRF{index}
+ ip address 10.{variant}.{octet}.1 255.255.255.0
+!"""
+
+SUPPORTED_ARGS = {
+    "module": {"template_cache", "max_workers", "results_cache", "timing", "isolate", "cache_ttl"},
+    "runner": {
+        "template_cache",
+        "stream",
+        "workers",
+        "results_cache",
+        "dedup",
+        "timing",
+        "deadline",
+    },
+}
+
+UNITS = {"KB": 1024, "MB": 1024**2, "GB": 1024**3}
+
+
+def parse_size(size):
+    size = size.strip().upper()
+    for unit, multiplier in UNITS.items():
+        if size.endswith(unit):
+            return int(float(size[: -len(unit)]) * multiplier)
+    return int(size)
+
+
+def parse_mode(mode):
+    kwargs = {}
+    for item in mode.split("+"):
+        if item == "default":
+            continue
+        name, _, value = item.partition("=")
+        if not value:
+            kwargs[name] = True
+        elif value.isdigit():
+            kwargs[name] = int(value)
+        else:
+            kwargs[name] = {"true": True, "false": False}.get(value.lower(), value)
+    return kwargs
+
+
+def make_output(size, variant):
+    interfaces = []
+    length = 0
+    index = 0
+    while length < size:
+        interface = INTERFACE.format(index=index, variant=variant % 250, octet=index % 250)
+        interfaces.append(interface)
+        length += len(interface)
+        index += 1
+    return "".join(interfaces)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+class FakeLocalClient:
+    """
+    LocalClient returning synthetic command output of each minion.
+    """
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+
+    def cmd_iter(self, tgt=None, fun=None, **kwargs):
+        for index in range(len(self.outputs)):
+            yield {"minion_{}".format(index): {"ret": self.outputs[index], "retcode": 0}}
+
+    def cmd_iter_no_block(self, tgt=None, fun=None, **kwargs):
+        yield from self.cmd_iter(tgt, fun, **kwargs)
+
+    def cmd(self, tgt, fun, **kwargs):
+        return {"minion_{}".format(index): {} for index in range(len(self.outputs))}
+
+
+def file_hash():
+    return {"hsum": hashlib.sha256(TEMPLATE.encode()).hexdigest(), "hash_type": "sha256"}
+
+
+def setup_module(cachedir, output):
+    opts = salt.config.minion_config(None)
+    opts.update({"id": "minion_0", "cachedir": cachedir})
+    ttp_module.__opts__ = opts
+    ttp_module.__pillar__ = {}
+    ttp_module.__salt__ = {
+        "cp.hash_file": lambda path, saltenv="base": file_hash(),
+        "cp.get_file_str": lambda path, saltenv="base": TEMPLATE,
+        "cmd.run": lambda *args, **kwargs: output,
+        "event.send": lambda tag, data: True,
+    }
+    ttp_module._TEMPLATE_CACHE.invalidate()
+
+    def run(**kwargs):
+        return ttp_module.run("cmd.run", "show running-config", template=TEMPLATE_PATH, **kwargs)
+
+    return run
+
+
+def setup_runner(cachedir, outputs):
+    opts = salt.config.master_config(None)
+    opts.update({"id": "master", "cachedir": cachedir, "timeout": 60})
+
+    def salt_cmd(function, *args, **kwargs):
+        if function == "cp.hash_file":
+            return file_hash()
+        return TEMPLATE
+
+    ttp_runner.__opts__ = opts
+    ttp_runner.__salt__ = {"salt.cmd": salt_cmd}
+    ttp_runner.client = FakeLocalClient(outputs)
+    ttp_runner._TEMPLATE_CACHE.invalidate()
+
+    def run(**kwargs):
+        return ttp_runner.run(
+            "minion_*", "cmd.run", "show running-config", template=TEMPLATE_PATH, **kwargs
+        )
+
+    return run
+
+
+def benchmark(run, kwargs, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run(**kwargs)
+        latencies.append(time.perf_counter() - start)
+    assert result, "run returned no results"
+    tracemalloc.start()
+    try:
+        run(**kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return latencies, peak
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--target", choices=["module", "runner", "all"], default="all")
+    arg_parser.add_argument("--minions", default="1,10,100,1000")
+    arg_parser.add_argument("--sizes", default="1KB,100KB,1MB")
+    arg_parser.add_argument("--modes", default="default")
+    arg_parser.add_argument("--variants", type=int, default=10)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--output", help="file to append JSON results to")
+    args = arg_parser.parse_args()
+    environment = {
+        "python": platform.python_version(),
+        "salt": salt.version.__version__,
+        "ttp": importlib.metadata.version("ttp"),
+        "cpu_count": os.cpu_count(),
+    }
+    scenarios = []
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    if args.target in ("module", "all"):
+        scenarios.extend(("module", 1, size) for size in sizes)
+    if args.target in ("runner", "all"):
+        scenarios.extend(
+            ("runner", int(minions), size) for minions in args.minions.split(",") for size in sizes
+        )
+    for target, minions, size in scenarios:
+        variants = [make_output(size, variant) for variant in range(min(args.variants, minions))]
+        outputs = [variants[index % len(variants)] for index in range(minions)]
+        for mode in args.modes.split(","):
+            kwargs = parse_mode(mode)
+            if not set(kwargs) <= SUPPORTED_ARGS[target]:
+                continue
+            with tempfile.TemporaryDirectory() as cachedir:
+                if target == "module":
+                    run = setup_module(cachedir, outputs[0])
+                else:
+                    run = setup_runner(cachedir, outputs)
+                latencies, peak = benchmark(run, kwargs, args.repeat)
+            total_bytes = sum(len(output) for output in outputs)
+            median = statistics.median(latencies)
+            result = dict(
+                environment,
+                target=target,
+                mode=mode,
+                minions=minions,
+                bytes_per_minion=size,
+                total_bytes=total_bytes,
+                repeat=args.repeat,
+                latency={
+                    "min": round(min(latencies), 4),
+                    "p50": round(median, 4),
+                    "p90": round(percentile(latencies, 90), 4),
+                    "p99": round(percentile(latencies, 99), 4),
+                    "max": round(max(latencies), 4),
+                },
+                throughput={
+                    "bytes_per_second": round(total_bytes / median),
+                    "minions_per_second": round(minions / median, 2),
+                },
+                peak_memory_bytes=peak,
+            )
+            print(json.dumps(result))
+            if args.output:
+                with open(args.output, "a") as output_file:
+                    output_file.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
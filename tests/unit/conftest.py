@@ -0,0 +1,53 @@
+import http.server
+import json
+import threading
+
+import pytest
+
+
+class ElasticsearchStub(http.server.HTTPServer):
+    """
+    Stub of Elasticsearch ``_bulk`` API, records posted documents, rejects
+    documents that have ``fail`` key and responds with ``status`` to all
+    requests if it is set.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ElasticsearchStubHandler)
+        self.url = "http://127.0.0.1:{}".format(self.server_port)
+        self.requests = []
+        self.status = 200
+
+
+class ElasticsearchStubHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):  # pylint: disable=invalid-name
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+        lines = [json.loads(line) for line in body.splitlines()]
+        documents = lines[1::2]
+        self.server.requests.append({"path": self.path, "actions": lines[::2], "docs": documents})
+        items = [
+            {"index": {"status": 400, "error": {"type": "mapper_parsing_exception"}}}
+            if "fail" in document
+            else {"index": {"status": 201}}
+            for document in documents
+        ]
+        response = json.dumps(
+            {"errors": any("error" in item["index"] for item in items), "items": items}
+        )
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(response.encode("utf-8"))
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def elasticsearch_stub():
+    server = ElasticsearchStub()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -2,11 +2,16 @@
     :codeauthor: Denis Mulyalin <d.mulyalin@gmail.com>
 """
 import sys
+import threading
+import time
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import pytest
+import salt.config
+import salt.loader
 import saltext.ttp.modules.ttpmod as ttp_module
+import saltext.ttp.utils.delivery as ttp_delivery
 from salt.exceptions import CommandExecutionError
 
 pytestmark = pytest.mark.skipif(
@@ -16,10 +21,23 @@ pytestmark = pytest.mark.skipif(
 
 @pytest.fixture
 def configure_loader_modules():
-    module_globals = {"__salt__": {}, "__opts__": {"id": "test_minion_id"}}
+    module_globals = {
+        # no template hash by default, compiled templates are not cached
+        "__salt__": {"cp.hash_file": MagicMock(return_value={})},
+        "__opts__": {"id": "test_minion_id"},
+    }
     return {ttp_module: module_globals}
 
 
+@pytest.fixture(autouse=True)
+def clear_template_cache():
+    yield
+    ttp_module._TEMPLATE_CACHE.invalidate()
+    ttp_delivery._QUEUE = None
+    ttp_module._RETURNERS = None
+    ttp_module._OUTPUTS_CACHE = None
+
+
 def test_ttp_run_minion_inline_command():
     ttp_template = """
  Static hostname: {{ hostname }}
@@ -512,6 +530,333 @@ Operating System: CentOS Linux 7 (Core)
         ]
 
 
+def test_ttp_run_elasticsearch_bulk_returner(elasticsearch_stub):
+    ttp_template = """
+<group name="arp">
+Internet  {{ ip }}  {{ age }}   {{ mac }}  ARPA   {{ intf }}
+</group>
+<output>
+returner = "elasticsearch_bulk"
+index = "arp"
+batch_size = 2
+</output>
+    """
+    data_to_parse = "\n".join(
+        "Internet  10.0.0.{0}  1   0000.0000.000{0}  ARPA   Vlan1".format(i) for i in range(5)
+    )
+    mock_cp_get_file_str = MagicMock(return_value=ttp_template)
+    mock_cmd_run = MagicMock(return_value=data_to_parse)
+    with patch.dict(
+        ttp_module.__salt__,
+        {
+            "cmd.run": mock_cmd_run,
+            "cp.get_file_str": mock_cp_get_file_str,
+            "config.get": MagicMock(return_value={"hosts": [elasticsearch_stub.url]}),
+        },
+    ):
+        ttp_module.run("cmd.run", "show ip arp", template="salt://ttp/test_template_1.txt")
+    assert [len(request["docs"]) for request in elasticsearch_stub.requests] == [1]
+    assert len(elasticsearch_stub.requests[0]["docs"][0]["arp"]) == 5
+
+
+def test_ttp_run_salt_returner():
+    ttp_template = """
+<group>
+Internet  {{ ip }}  {{ age }}   {{ mac }}  ARPA   {{ intf }}
+</group>
+<output>
+returner = "salt_returner"
+name = "test"
+batch_size = 2
+</output>
+    """
+    data_to_parse = "\n".join(
+        "Internet  10.0.0.{0}  1   0000.0000.000{0}  ARPA   Vlan1".format(i) for i in range(5)
+    )
+    mock_returner = MagicMock()
+    mock_returners = MagicMock(return_value={"test.returner": mock_returner})
+    with patch.dict(
+        ttp_module.__salt__,
+        {
+            "cmd.run": MagicMock(return_value=data_to_parse),
+            "cp.get_file_str": MagicMock(return_value=ttp_template),
+        },
+    ), patch("salt.loader.returners", mock_returners):
+        ttp_module.run("cmd.run", "show ip arp", template="salt://ttp/test_template_1.txt")
+        ttp_module.run("cmd.run", "show ip arp", template="salt://ttp/test_template_1.txt")
+    # returners loaded once and reused by subsequent runs
+    mock_returners.assert_called_once()
+    returns = [call.args[0] for call in mock_returner.call_args_list]
+    assert [len(ret["return"]) for ret in returns] == [2, 2, 1, 2, 2, 1]
+    assert returns[0]["id"] == "test_minion_id"
+    assert returns[0]["return"][0]["ip"] == "10.0.0.0"
+
+
+def test_ttp_run_timing():
+    ttp_template = """
+<input name="in_1">
+fun = "cmd.run"
+arg = ["hostname"]
+</input>
+<group name="system" input="in_1">
+hostname {{ hostname }}
+</group>
+    """
+    mock_event_send = MagicMock(return_value=True)
+    with patch.dict(
+        ttp_module.__salt__,
+        {
+            "cmd.run": MagicMock(return_value="hostname RT-1"),
+            "cp.get_file_str": MagicMock(return_value=ttp_template),
+            "event.send": mock_event_send,
+        },
+    ):
+        res = ttp_module.run("salt://ttp/test_template_1.txt", timing=True)
+    assert res["results"] == [[{"system": {"hostname": "RT-1"}}]]
+    timing = res["timing"]
+    assert {"fetch", "add_template", "commands", "text", "add_input", "parse"} <= set(
+        timing["stages"]
+    )
+    assert timing["inputs"][0]["input"] == "in_1"
+    assert timing["inputs"][0]["function"] == "cmd.run"
+    assert timing["input_bytes"] == len("hostname RT-1")
+    mock_event_send.assert_called_once_with(
+        "ttp/run/timing", {"template": "salt://ttp/test_template_1.txt", "timing": timing}
+    )
+
+
+def test_ttp_run_profile(tmp_path):
+    ttp_template = """
+<group name="system">
+hostname {{ hostname }}
+</group>
+    """
+    with patch.dict(
+        ttp_module.__salt__,
+        {
+            "cmd.run": MagicMock(return_value="hostname RT-1"),
+            "cp.get_file_str": MagicMock(return_value=ttp_template),
+        },
+    ), patch.dict(ttp_module.__opts__, {"cachedir": str(tmp_path), "ttp_profile_top": 5}):
+        res = ttp_module.run(
+            "cmd.run", "hostname", template="salt://ttp/test_template_1.txt", profile=True
+        )
+    assert res["results"] == [[{"system": {"hostname": "RT-1"}}]]
+    assert len(res["profile"]["hotspots"]) == 5
+    assert res["profile"]["path"].startswith(str(tmp_path / "ttp" / "profiles"))
+    assert len(list((tmp_path / "ttp" / "profiles").glob("*.prof"))) == 1
+
+
+def test_ttp_run_isolate():
+    ttp_template = """
+<group name="interfaces">
+interface {{ interface | re("(a+)+c") }}
+</group>
+<group name="system">
+hostname {{ hostname }}
+</group>
+    """
+    with patch.dict(
+        ttp_module.__salt__,
+        {
+            "cmd.run": MagicMock(return_value="hostname RT-1\n"),
+            "cp.get_file_str": MagicMock(return_value=ttp_template),
+        },
+    ):
+        res = ttp_module.run(
+            "cmd.run", "hostname", template="salt://ttp/test_template_1.txt", isolate=True
+        )
+        assert res == [[{"system": {"hostname": "RT-1"}}]]
+        # runaway regex stopped by the deadline
+        ttp_module.__salt__["cmd.run"].return_value = "interface {}\n".format("a" * 40)
+        with pytest.raises(CommandExecutionError, match="did not finish within 0.5s deadline"):
+            ttp_module.run(
+                "cmd.run",
+                "show run",
+                template="salt://ttp/test_template_1.txt",
+                isolate=True,
+                parse_timeout=0.5,
+            )
+        res = ttp_module.run(
+            "cmd.run",
+            "show run",
+            template="salt://ttp/test_template_1.txt",
+            isolate=True,
+            parse_timeout=0.5,
+            partial=True,
+        )
+    assert res["results"] == [[]]
+    assert res["errors"] == [
+        {
+            "template": "_root_template_",
+            "input": "Default_Input",
+            "error": "parsing did not finish within 0.5s deadline",
+        }
+    ]
+
+
+def test_ttp_profile_template():
+    ttp_template = """
+<group name="interfaces">
+interface {{ interface }}
+ description {{ description | ORPHRASE }}
+ vlan {{ vlan | to_int }}
+</group>
+    """
+    data_to_parse = """
+interface Gi1
+ description uplink to core
+ vlan 10
+interface Gi2
+ vlan 20
+    """
+    mock_cmd_run = MagicMock(return_value=data_to_parse)
+    with patch.dict(
+        ttp_module.__salt__,
+        {"cmd.run": mock_cmd_run, "cp.get_file_str": MagicMock(return_value=ttp_template)},
+    ):
+        res = ttp_module.profile_template(
+            "cmd.run", "show run", template="salt://ttp/test_template_1.txt"
+        )
+    mock_cmd_run.assert_called_once_with("show run")
+    assert [group["group"] for group in res["groups"]] == ["interfaces"]
+    regexes = {regex["variables"][0]: regex for regex in res["groups"][0]["regexes"]}
+    assert regexes["interface"]["action"] == "start"
+    assert regexes["interface"]["matches"] == 2
+    assert regexes["description"]["matches"] == 1
+    assert regexes["vlan"]["functions"]["to_int"]["calls"] == 2
+    assert res["groups"][0]["matches"] == 5
+    assert res["warnings"] == []
+    # instrumented template is never cached
+    assert ttp_module._TEMPLATE_CACHE.stats()["size"] == 0
+
+
+def test_ttp_profile_template_data():
+    ttp_template = """
+<input name="in_1">
+fun = "cmd.run"
+arg = ["show run"]
+</input>
+<group name="interfaces" input="in_1">
+interface {{ interface | re("([a-zA-Z0-9]+ ?)+") }}
+</group>
+    """
+    mock_cmd_run = MagicMock()
+    with patch.dict(
+        ttp_module.__salt__,
+        {"cmd.run": mock_cmd_run, "cp.get_file_str": MagicMock(return_value=ttp_template)},
+    ):
+        res = ttp_module.profile_template(
+            template="salt://ttp/test_template_1.txt", data=["interface Gi1", "interface Gi2"]
+        )
+    mock_cmd_run.assert_not_called()
+    assert res["groups"][0]["matches"] == 2
+    assert res["groups"][0]["regexes"][0]["calls"] == 2
+    assert [warning["warning"] for warning in res["warnings"]] == [
+        "nested quantifiers, catastrophic backtracking possible"
+    ]
+
+
+def test_ttp_run_async_delivery():
+    ttp_template = """
+<group name="system">
+hostname {{ hostname }}
+</group>
+<output>
+returner = "elasticsearch"
+index = "hosts"
+async_delivery = True
+</output>
+    """
+    release = threading.Event()
+
+    def document_create(**kwargs):
+        release.wait(10)
+        return True
+
+    mock_document_create = MagicMock(side_effect=document_create)
+    with patch.dict(
+        ttp_module.__salt__,
+        {
+            "cmd.run": MagicMock(return_value="hostname RT-1"),
+            "cp.get_file_str": MagicMock(return_value=ttp_template),
+            "elasticsearch.document_create": mock_document_create,
+        },
+    ), patch.dict(ttp_module.__opts__, {"multiprocessing": False}):
+        # run returns while delivery still in progress
+        res = ttp_module.run("cmd.run", "hostname", template="salt://ttp/test_template_1.txt")
+        assert ttp_module.flush_deliveries(timeout=0.1)["drained"] is False
+        release.set()
+        flushed = ttp_module.flush_deliveries()
+    assert res == [[{"system": {"hostname": "RT-1"}}]]
+    assert flushed["drained"] is True
+    assert flushed["stats"]["delivered"] == 1
+    mock_document_create.assert_called_once_with(
+        doc_type="default", index="hosts", body='{"system": {"hostname": "RT-1"}}'
+    )
+
+
+def test_ttp_run_async_delivery_job_process():
+    ttp_template = """
+<group name="system">
+hostname {{ hostname }}
+</group>
+<output>
+returner = "elasticsearch"
+index = "hosts"
+async_delivery = True
+</output>
+    """
+    with patch.dict(
+        ttp_module.__salt__,
+        {
+            "cmd.run": MagicMock(return_value="hostname RT-1"),
+            "cp.get_file_str": MagicMock(return_value=ttp_template),
+            # slow delivery still in progress when parsing done
+            "elasticsearch.document_create": MagicMock(
+                side_effect=lambda **kwargs: time.sleep(0.2) or True
+            ),
+        },
+    ):
+        ttp_module.run("cmd.run", "hostname", template="salt://ttp/test_template_1.txt")
+        stats = ttp_module.delivery_stats()
+    # job process exits once run returns, run waits for queued deliveries
+    assert stats["queued"] == 1
+    assert stats["delivered"] == 1
+    assert stats["pending"] == 0
+
+
+def test_ttp_run_elasticsearch_bulk_spool_and_flush_spool(elasticsearch_stub, tmp_path):
+    ttp_template = """
+<group name="system">
+hostname {{ hostname }}
+</group>
+<output>
+returner = "elasticsearch_bulk"
+index = "hosts"
+</output>
+    """
+    elasticsearch_stub.status = 503
+    with patch.dict(
+        ttp_module.__salt__,
+        {
+            "cmd.run": MagicMock(return_value="hostname RT-1"),
+            "cp.get_file_str": MagicMock(return_value=ttp_template),
+            "config.get": MagicMock(return_value={"hosts": [elasticsearch_stub.url]}),
+        },
+    ), patch.dict(ttp_module.__opts__, {"cachedir": str(tmp_path)}):
+        with patch("time.sleep"):
+            ttp_module.run("cmd.run", "hostname", template="salt://ttp/test_template_1.txt")
+        # initial request and 3 retries failed, document spooled
+        assert len(elasticsearch_stub.requests) == 4
+        assert (tmp_path / "ttp" / "spool.jsonl").exists()
+        elasticsearch_stub.status = 200
+        res = ttp_module.flush_spool()
+    assert res == {"replayed": 1, "failed": 0, "expired": 0, "spooled": 0}
+    assert elasticsearch_stub.requests[-1]["docs"] == [{"system": {"hostname": "RT-1"}}]
+    assert elasticsearch_stub.requests[-1]["actions"] == [{"index": {"_index": "hosts"}}]
+
+
 def test_ttp_run_minion_id_injection_in_ttp_vars():
     ttp_template = """
  Static hostname: {{ hostname }}
@@ -585,3 +930,406 @@ Operating System: CentOS Linux 7 (Core)
                 }
             ]
         ]
+
+
+def test_ttp_run_template_cache_reuses_compiled_template():
+    ttp_template = """
+<input>
+fun = "cmd.run"
+arg = ['hostnamectl']
+kwarg = {}
+</input>
+<group name="system">
+ Static hostname: {{ hostname }}
+         Chassis: {{ chassis }}
+</group>
+    """
+    outputs = [
+        """
+ Static hostname: host-1
+         Chassis: vm
+        """,
+        """
+ Static hostname: host-2
+         Chassis: vm
+        """,
+    ]
+    mock_cp_get_file_str = MagicMock(return_value=ttp_template)
+    mock_cp_hash_file = MagicMock(return_value={"hsum": "abc", "hash_type": "sha256"})
+    mock_cmd_run = MagicMock(side_effect=outputs)
+    with patch.dict(
+        ttp_module.__salt__,
+        {
+            "cmd.run": mock_cmd_run,
+            "cp.get_file_str": mock_cp_get_file_str,
+            "cp.hash_file": mock_cp_hash_file,
+        },
+    ):
+        res_1 = ttp_module.run(template="salt://ttp/test_template_1.txt")
+        res_2 = ttp_module.run(template="salt://ttp/test_template_1.txt")
+    # template fetched and compiled only once
+    assert mock_cp_get_file_str.call_count == 1
+    assert mock_cp_hash_file.call_count == 2
+    # inputs and results reset between runs
+    assert res_1 == [[{"system": {"chassis": "vm", "hostname": "host-1"}}]]
+    assert res_2 == [[{"system": {"chassis": "vm", "hostname": "host-2"}}]]
+    assert ttp_module._TEMPLATE_CACHE.stats()["hits"] == 1
+
+
+def test_ttp_run_template_cache_file_hash_change():
+    ttp_template = """
+ Static hostname: {{ hostname }}
+    """
+    mock_cp_get_file_str = MagicMock(return_value=ttp_template)
+    mock_cp_hash_file = MagicMock(side_effect=[{"hsum": "abc"}, {"hsum": "def"}])
+    mock_cmd_run = MagicMock(return_value=" Static hostname: host-1")
+    with patch.dict(
+        ttp_module.__salt__,
+        {
+            "cmd.run": mock_cmd_run,
+            "cp.get_file_str": mock_cp_get_file_str,
+            "cp.hash_file": mock_cp_hash_file,
+        },
+    ):
+        ttp_module.run("cmd.run", "hostnamectl", template="salt://ttp/test_template_1.txt")
+        res = ttp_module.run("cmd.run", "hostnamectl", template="salt://ttp/test_template_1.txt")
+    assert mock_cp_get_file_str.call_count == 2
+    assert res == [[{"hostname": "host-1"}]]
+
+
+def test_ttp_run_template_cache_disabled_and_clear_cache():
+    ttp_template = """
+ Static hostname: {{ hostname }}
+    """
+    mock_cp_get_file_str = MagicMock(return_value=ttp_template)
+    mock_cp_hash_file = MagicMock(return_value={"hsum": "abc"})
+    mock_cmd_run = MagicMock(return_value=" Static hostname: host-1")
+    with patch.dict(
+        ttp_module.__salt__,
+        {
+            "cmd.run": mock_cmd_run,
+            "cp.get_file_str": mock_cp_get_file_str,
+            "cp.hash_file": mock_cp_hash_file,
+        },
+    ):
+        ttp_module.run(
+            "cmd.run",
+            "hostnamectl",
+            template="salt://ttp/test_template_1.txt",
+            template_cache=False,
+        )
+        assert len(ttp_module._TEMPLATE_CACHE) == 0
+        assert "template_cache" not in mock_cmd_run.call_args[1]
+        ttp_module.run("cmd.run", "hostnamectl", template="salt://ttp/test_template_1.txt")
+        assert len(ttp_module._TEMPLATE_CACHE) == 1
+        assert ttp_module.clear_cache(template="salt://ttp/other.txt")["removed"] == 0
+        assert ttp_module.clear_cache(template="salt://ttp/test_template_1.txt")["removed"] == 1
+        assert len(ttp_module._TEMPLATE_CACHE) == 0
+
+
+def test_ttp_run_outputs_cache(tmp_path):
+    interfaces_template = """
+<input name="config">
+fun = "cmd.run"
+arg = ['show run']
+cache_ttl = 300
+</input>
+<group name="interfaces" input="config">
+interface {{ interface }}
+</group>
+    """
+    hostname_template = """
+<input name="config">
+fun = "cmd.run"
+arg = ['show run']
+cache_ttl = 300
+</input>
+<input name="version">
+fun = "cmd.run"
+arg = ['show version']
+</input>
+<group name="system" input="config">
+hostname {{ hostname }}
+</group>
+    """
+    templates = {
+        "salt://ttp/interfaces.txt": interfaces_template,
+        "salt://ttp/hostname.txt": hostname_template,
+    }
+    mock_cmd_run = MagicMock(return_value="hostname RT-1\ninterface Gi1\n")
+    with patch.dict(
+        ttp_module.__salt__,
+        {
+            "cmd.run": mock_cmd_run,
+            "cp.get_file_str": MagicMock(side_effect=lambda path, saltenv: templates[path]),
+        },
+    ), patch.dict(ttp_module.__opts__, {"cachedir": str(tmp_path)}):
+        res = [
+            ttp_module.run("salt://ttp/interfaces.txt"),
+            ttp_module.run("salt://ttp/hostname.txt"),
+            ttp_module.run("cmd.run", "show run", template="salt://ttp/hostname.txt", cache_ttl=60),
+        ]
+        stats = ttp_module.cache_stats()["outputs"]
+        ttp_module.clear_cache(outputs=True)
+        assert ttp_module.cache_stats()["outputs"]["size"] == 0
+    assert res[0] == [[{"interfaces": {"interface": "Gi1"}}]]
+    assert res[1][0][0] == {"system": {"hostname": "RT-1"}}
+    # "show run" ran once and reused by the second template and inline command,
+    # "show version" input has no cache_ttl and cached only with cache_ttl argument
+    assert [call.args for call in mock_cmd_run.call_args_list] == [
+        ("show run",),
+        ("show version",),
+        ("show version",),
+    ]
+    # "config" input of the third run reuses inline command output without cache lookup
+    assert stats == {"size": 2, "hits": 2, "misses": 2}
+
+
+def test_ttp_run_results_cache(tmp_path):
+    ttp_template = """
+<input>
+fun = "cmd.run"
+arg = ['hostnamectl']
+</input>
+<group name="system">
+ Static hostname: {{ hostname }}
+</group>
+    """
+    outputs = [" Static hostname: host-1", " Static hostname: host-1", " Static hostname: host-2"]
+    mock_cp_get_file_str = MagicMock(return_value=ttp_template)
+    mock_cmd_run = MagicMock(side_effect=outputs)
+    with patch.dict(
+        ttp_module.__salt__, {"cmd.run": mock_cmd_run, "cp.get_file_str": mock_cp_get_file_str}
+    ), patch.dict(ttp_module.__opts__, {"cachedir": str(tmp_path)}):
+        res = [
+            ttp_module.run(template="salt://ttp/test_template_1.txt", results_cache=True)
+            for _ in outputs
+        ]
+        stats = ttp_module.cache_stats()["results"]
+        ttp_module.clear_cache(results=True)
+        assert ttp_module.cache_stats()["results"]["size"] == 0
+    assert res == [
+        [[{"system": {"hostname": "host-1"}}]],
+        [[{"system": {"hostname": "host-1"}}]],
+        [[{"system": {"hostname": "host-2"}}]],
+    ]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["size"] == 2
+    assert "results_cache" not in mock_cmd_run.call_args[1]
+
+
+def test_ttp_run_concurrent_inputs():
+    ttp_template = """
+<input name="host_1">
+fun = "net.cli"
+arg = ['show run | inc hostname']
+concurrent = True
+</input>
+<input name="host_2">
+fun = "cmd.run"
+arg = ['show run | inc hostname 2']
+concurrent = True
+</input>
+<input name="serial">
+fun = "test.arg"
+arg = ['show version']
+</input>
+<group name="hostname" input="host_1">
+hostname {{ hostname }}
+</group>
+<group name="hostname_2" input="host_2">
+hostname {{ hostname }}
+</group>
+<group name="version" input="serial">
+version {{ version }}
+</group>
+    """
+    # both concurrent inputs must be running at the same time to pass the barrier
+    barrier = threading.Barrier(2, timeout=5)
+    calls = []
+
+    def net_cli(command):
+        calls.append(command)
+        barrier.wait()
+        return {"out": {command: "hostname RT-1"}}
+
+    def cmd_run(command):
+        calls.append(command)
+        barrier.wait()
+        return "hostname RT-2"
+
+    def test_arg(command):
+        calls.append(command)
+        return "version 1.2.3"
+
+    mock_cp_get_file_str = MagicMock(return_value=ttp_template)
+    with patch.dict(
+        ttp_module.__salt__,
+        {
+            "net.cli": net_cli,
+            "cmd.run": cmd_run,
+            "test.arg": test_arg,
+            "cp.get_file_str": mock_cp_get_file_str,
+        },
+    ):
+        res = ttp_module.run(template="salt://ttp/test_template_1.txt", max_workers=4)
+    assert res == [
+        [
+            {"hostname": {"hostname": "RT-1"}},
+            {"hostname_2": {"hostname": "RT-2"}},
+            {"version": {"version": "1.2.3"}},
+        ]
+    ]
+    # serial input runs before concurrent inputs
+    assert calls[0] == "show version"
+
+
+def test_ttp_run_dedup_inputs():
+    ttp_template = """
+<input name="config">
+fun = "cmd.run"
+arg = ['show run']
+</input>
+<input name="running">
+fun = "cmd.run"
+arg = ['show run']
+kwarg = {}
+concurrent = True
+</input>
+<input name="version">
+fun = "cmd.run"
+arg = ['show version']
+</input>
+<group name="interfaces" input="config">
+interface {{ interface }}
+</group>
+<group name="hostname" input="running">
+hostname {{ hostname }}
+</group>
+    """
+    mock_cmd_run = MagicMock(return_value="hostname RT-1\ninterface Gi1\n")
+    with patch.dict(
+        ttp_module.__salt__,
+        {"cmd.run": mock_cmd_run, "cp.get_file_str": MagicMock(return_value=ttp_template)},
+    ):
+        res = ttp_module.run(
+            "cmd.run", "show run", template="salt://ttp/test_template_1.txt", max_workers=4
+        )
+    # inline command and identical inputs share single command run
+    assert [call.args for call in mock_cmd_run.call_args_list] == [
+        ("show run",),
+        ("show version",),
+    ]
+    assert res == [
+        [{"interfaces": {"interface": "Gi1"}}, {"hostname": {"hostname": "RT-1"}}, {}, {}]
+    ]
+
+
+def test_ttp_run_nested_templates_inputs():
+    ttp_template = """
+<template name="interfaces">
+<input name="config">
+fun = "cmd.run"
+arg = ['show run']
+</input>
+<group name="interfaces" input="config">
+interface {{ interface }}
+</group>
+</template>
+
+<template name="system">
+<input name="version">
+fun = "cmd.run"
+arg = ['show version']
+</input>
+<input name="config">
+fun = "cmd.run"
+arg = ['show run']
+</input>
+<group name="hostname" input="config">
+hostname {{ hostname }}
+</group>
+</template>
+    """
+    mock_cmd_run = MagicMock(return_value="hostname RT-1\ninterface Gi1\n")
+    with patch.dict(
+        ttp_module.__salt__,
+        {"cmd.run": mock_cmd_run, "cp.get_file_str": MagicMock(return_value=ttp_template)},
+    ):
+        res = ttp_module.run(template="salt://ttp/test_template_1.txt")
+    # inputs of nested templates run even though top template has no inputs,
+    # identical inputs of different templates share single command run
+    assert [call.args for call in mock_cmd_run.call_args_list] == [
+        ("show run",),
+        ("show version",),
+    ]
+    assert res == [
+        [{"interfaces": {"interface": "Gi1"}}],
+        [{}, {"hostname": {"hostname": "RT-1"}}],
+    ]
+
+
+def test_ttp_run_concurrent_inputs_salt_loader(tmp_path):
+    ttp_template = """
+<input name="in_1">
+fun = "test.echo"
+arg = ['hostname RT-1']
+concurrent = True
+</input>
+<input name="in_2">
+fun = "test.echo"
+arg = ['hostname RT-2']
+concurrent = True
+cache_ttl = 60
+</input>
+<group name="system">
+hostname {{ hostname }}
+</group>
+    """
+    (tmp_path / "roots" / "ttp").mkdir(parents=True)
+    (tmp_path / "roots" / "ttp" / "test_template_1.txt").write_text(ttp_template)
+    opts = salt.config.minion_config(None)
+    opts.update(
+        {
+            "id": "test_minion_id",
+            "cachedir": str(tmp_path / "cache"),
+            "file_client": "local",
+            "file_roots": {"base": [str(tmp_path / "roots")]},
+            "grains": {},
+        }
+    )
+    # real loader, __salt__ and __opts__ only resolve within loader context
+    loader = salt.loader.minion_mods(opts, utils=salt.loader.utils(opts))
+    res = loader["ttp.run"](template="salt://ttp/test_template_1.txt", max_workers=2)
+    assert res == [[{"system": {"hostname": "RT-1"}}, {"system": {"hostname": "RT-2"}}]]
+
+
+def test_ttp_run_serial_inputs_option():
+    ttp_template = """
+<input name="in_1">
+fun = "cmd.run"
+arg = ['cmd 1']
+concurrent = True
+</input>
+<input name="in_2">
+fun = "cmd.run"
+arg = ['cmd 2']
+concurrent = True
+</input>
+<group name="hostname">
+hostname {{ hostname }}
+</group>
+    """
+
+    def cmd_run(command):
+        return "hostname {}".format(command.replace(" ", "-"))
+
+    mock_cp_get_file_str = MagicMock(return_value=ttp_template)
+    with patch.dict(ttp_module.__opts__, {"ttp_serial_inputs": True}), patch.dict(
+        ttp_module.__salt__, {"cmd.run": cmd_run, "cp.get_file_str": mock_cp_get_file_str}
+    ):
+        with patch.object(ttp_module, "ThreadPoolExecutor") as mock_executor:
+            res = ttp_module.run(template="salt://ttp/test_template_1.txt", max_workers=4)
+            mock_executor.assert_not_called()
+    assert res == [[{"hostname": {"hostname": "cmd-1"}}, {"hostname": {"hostname": "cmd-2"}}]]
@@ -3,11 +3,15 @@
 """
 # pylint: disable=unused-argument
 import sys
+import time
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import pytest
+import salt.config
 import saltext.ttp.runners.ttpmod as ttp_runner
+import saltext.ttp.utils.delivery as ttp_delivery
+import saltext.ttp.utils.jobs as ttp_jobs
 from salt.exceptions import CommandExecutionError
 
 pytestmark = pytest.mark.skipif(
@@ -25,6 +29,35 @@ def configure_loader_modules():
     return {ttp_runner: module_globals}
 
 
+@pytest.fixture(autouse=True)
+def clear_template_cache():
+    yield
+    ttp_runner._TEMPLATE_CACHE.invalidate()
+    ttp_runner._PROXYTYPES.clear()
+    ttp_delivery._QUEUE = None
+    ttp_jobs._MASTER_MINION = None
+
+
+@pytest.fixture
+def master_opts(tmp_path):
+    opts = salt.config.master_config(None)
+    opts.update({"id": "master", "timeout": 100, "cachedir": str(tmp_path)})
+    return opts
+
+
+def mock_salt_cmd(ttp_template, hsum):
+    """
+    Create "salt.cmd" mock that returns template hash and text
+    """
+
+    def salt_cmd(fun, *args, **kwargs):
+        if fun == "cp.hash_file":
+            return {"hsum": hsum, "hash_type": "sha256"}
+        return ttp_template
+
+    return MagicMock(side_effect=salt_cmd)
+
+
 def test_ttp_run_minion_inline_command():
     ttp_template = """
  Static hostname: {{ hostname }}
@@ -668,6 +701,163 @@ Operating System: CentOS Linux 7 (Core)
             ]
 
 
+def test_ttp_run_elasticsearch_bulk_returner(elasticsearch_stub):
+    ttp_template = """
+<group>
+hostname {{ hostname }}
+</group>
+<output>
+returner = "elasticsearch_bulk"
+index = "hosts"
+batch_size = 2
+</output>
+    """
+    returns = [{"minion_{}".format(i): {"ret": "hostname RT-{}".format(i)}} for i in range(3)]
+    mock_salt_cmd = MagicMock(return_value=ttp_template)
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": mock_salt_cmd}), patch.dict(
+        ttp_runner.__opts__, {"elasticsearch": {"hosts": [elasticsearch_stub.url]}}
+    ):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client:
+            mock_client.cmd_iter = MagicMock(return_value=iter(returns))
+            ttp_runner.run("minion_*", "cmd.run", "hostname", template="salt://ttp/test.txt")
+    # anonymous group results of each minion indexed as individual documents
+    assert [request["docs"] for request in elasticsearch_stub.requests] == [
+        [{"hostname": "RT-0"}, {"hostname": "RT-1"}],
+        [{"hostname": "RT-2"}],
+    ]
+
+
+def test_ttp_run_salt_returner():
+    ttp_template = """
+<group>
+hostname {{ hostname }}
+</group>
+<output>
+returner = "salt_returner"
+name = "test"
+batch_size = 2
+</output>
+    """
+    returns = [{"minion_{}".format(i): {"ret": "hostname RT-{}".format(i)}} for i in range(3)]
+    mock_returner = MagicMock()
+    mock_mminion = MagicMock()
+    mock_mminion.returners = {"test.returner": mock_returner}
+    mock_master_minion = MagicMock(return_value=mock_mminion)
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": MagicMock(return_value=ttp_template)}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client, patch(
+            "salt.minion.MasterMinion", mock_master_minion
+        ):
+            mock_client.cmd_iter = MagicMock(side_effect=lambda *a, **kw: iter(returns))
+            ttp_runner.run("minion_*", "cmd.run", "hostname", template="salt://ttp/test.txt")
+            ttp_runner.run("minion_*", "cmd.run", "hostname", template="salt://ttp/test.txt")
+    # MasterMinion created once and reused by subsequent runs
+    mock_master_minion.assert_called_once()
+    assert [call.args[0]["return"] for call in mock_returner.call_args_list] == [
+        [{"hostname": "RT-0"}, {"hostname": "RT-1"}],
+        [{"hostname": "RT-2"}],
+    ] * 2
+    assert mock_returner.call_args.args[0]["id"] == "master"
+
+
+def test_ttp_run_timing():
+    ttp_template = """
+<group>
+hostname {{ hostname }}
+</group>
+    """
+    returns = [{"minion_{}".format(i): {"ret": "hostname RT-{}".format(i)}} for i in range(3)]
+    mock_event = MagicMock()
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": MagicMock(return_value=ttp_template)}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client, patch(
+            "salt.utils.event.get_master_event", MagicMock(return_value=mock_event)
+        ), patch.dict(ttp_runner.__opts__, {"sock_dir": "/tmp"}):
+            mock_client.cmd_iter = MagicMock(return_value=iter(returns))
+            res = ttp_runner.run(
+                "minion_*", "cmd.run", "hostname", template="salt://ttp/test.txt", timing=True
+            )
+    assert res["results"] == [
+        [[{"hostname": "RT-0"}], [{"hostname": "RT-1"}], [{"hostname": "RT-2"}]]
+    ]
+    timing = res["timing"]
+    assert timing["stages"]["commands"]["calls"] == 4
+    assert timing["inputs"][0]["returns"] == 3
+    assert timing["input_bytes"] == 3 * len("hostname RT-0")
+    mock_event.__enter__.return_value.fire_event.assert_called_once_with(
+        {"template": "salt://ttp/test.txt", "timing": timing}, "ttp/run/timing"
+    )
+
+
+def test_ttp_run_profile_and_timing(tmp_path):
+    ttp_template = """
+<group>
+hostname {{ hostname }}
+</group>
+    """
+    returns = [{"minion_1": {"ret": "hostname RT-1"}}]
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": MagicMock(return_value=ttp_template)}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client, patch(
+            "salt.utils.event.get_master_event", MagicMock()
+        ), patch.dict(ttp_runner.__opts__, {"sock_dir": "/tmp", "cachedir": str(tmp_path)}):
+            mock_client.cmd_iter = MagicMock(return_value=iter(returns))
+            res = ttp_runner.run(
+                "minion_*",
+                "cmd.run",
+                "hostname",
+                template="salt://ttp/test.txt",
+                timing=True,
+                profile=True,
+            )
+    assert res["results"] == [[[{"hostname": "RT-1"}]]]
+    assert set(res) == {"results", "timing", "profile"}
+    assert res["profile"]["hotspots"]
+    assert (tmp_path / "ttp" / "profiles").is_dir()
+
+
+def test_ttp_profile_template():
+    ttp_template = """
+<group name="interfaces">
+interface {{ interface }}
+ vlan {{ vlan | to_int }}
+</group>
+    """
+    returns = [
+        {"minion_1": {"ret": "interface Gi1\n vlan 10\n"}},
+        {"minion_2": {"ret": "interface Gi1\n vlan 20\ninterface Gi2\n"}},
+    ]
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": mock_salt_cmd(ttp_template, "abc")}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client:
+            mock_client.cmd_iter = MagicMock(return_value=iter(returns))
+            res = ttp_runner.profile_template(
+                "minion_*", "cmd.run", "show run", template="salt://ttp/test.txt"
+            )
+    mock_client.cmd_iter.assert_called_once()
+    assert [group["group"] for group in res["groups"]] == ["interfaces"]
+    regexes = {regex["variables"][0]: regex for regex in res["groups"][0]["regexes"]}
+    assert regexes["interface"]["matches"] == 3
+    assert regexes["interface"]["calls"] == 2
+    assert regexes["vlan"]["functions"]["to_int"]["calls"] == 2
+    # instrumented template is never cached
+    assert ttp_runner._TEMPLATE_CACHE.stats()["size"] == 0
+
+
+def test_ttp_profile_template_data():
+    ttp_template = """
+<group name="interfaces">
+interface {{ interface }}
+ description {{ description | re("([a-z]+ ?)*") }}
+</group>
+    """
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": mock_salt_cmd(ttp_template, "abc")}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client:
+            res = ttp_runner.profile_template(
+                template="salt://ttp/test.txt", data="interface Gi1\n description to core\n"
+            )
+    mock_client.cmd_iter.assert_not_called()
+    assert res["groups"][0]["matches"] == 2
+    assert res["warnings"][0]["group"] == "interfaces"
+    assert "nested quantifiers" in res["warnings"][0]["warning"]
+
+
 def test_ttp_run_custom_vars_injection_in_ttp_vars():
     ttp_template = """
  Static hostname: {{ hostname }}
@@ -783,3 +973,789 @@ Operating System: CentOS Linux 7 (Core)
                     }
                 ]
             ]
+
+
+def test_ttp_run_template_cache(master_opts):
+    ttp_template = """
+ Static hostname: {{ hostname }}
+         Chassis: {{ chassis }}
+    """
+    data_to_parse = [{"minion_1": {"ret": " Static hostname: host-1\n         Chassis: vm"}}]
+    mock_cmd = mock_salt_cmd(ttp_template, "abc")
+    with patch.dict(ttp_runner.__opts__, master_opts), patch.dict(
+        ttp_runner.__salt__, {"salt.cmd": mock_cmd}
+    ):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client:
+            mock_client.cmd_iter = MagicMock(side_effect=lambda *a, **kw: iter(data_to_parse))
+            for _ in range(2):
+                res = ttp_runner.run(
+                    "minion_1", "cmd.run", "hostnamectl", template="salt://ttp/test_template_1.txt"
+                )
+                assert res == [[{"chassis": "vm", "hostname": "host-1"}]]
+            # second run reuses compiled template, checking only template hash
+            assert [c[0][0] for c in mock_cmd.call_args_list] == [
+                "cp.hash_file",
+                "cp.get_file_str",
+                "cp.hash_file",
+            ]
+            # template text loaded from master cache if no compiled template in-process
+            ttp_runner._TEMPLATE_CACHE.invalidate()
+            mock_cmd.reset_mock()
+            res = ttp_runner.run(
+                "minion_1", "cmd.run", "hostnamectl", template="salt://ttp/test_template_1.txt"
+            )
+            assert res == [[{"chassis": "vm", "hostname": "host-1"}]]
+            assert [c[0][0] for c in mock_cmd.call_args_list] == ["cp.hash_file"]
+
+
+def test_ttp_run_template_cache_hash_changed(master_opts):
+    data_to_parse = [{"minion_1": {"ret": " Static hostname: host-1\n         Chassis: vm"}}]
+    with patch.dict(ttp_runner.__opts__, master_opts):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client:
+            mock_client.cmd_iter = MagicMock(side_effect=lambda *a, **kw: iter(data_to_parse))
+            with patch.dict(
+                ttp_runner.__salt__,
+                {"salt.cmd": mock_salt_cmd(" Static hostname: {{ hostname }}", "abc")},
+            ):
+                res = ttp_runner.run(
+                    "minion_1", "cmd.run", "hostnamectl", template="salt://ttp/test_template_1.txt"
+                )
+                assert res == [[{"hostname": "host-1"}]]
+            mock_cmd = mock_salt_cmd("         Chassis: {{ chassis }}", "def")
+            with patch.dict(ttp_runner.__salt__, {"salt.cmd": mock_cmd}):
+                res = ttp_runner.run(
+                    "minion_1", "cmd.run", "hostnamectl", template="salt://ttp/test_template_1.txt"
+                )
+                assert res == [[{"chassis": "vm"}]]
+                assert mock_cmd.call_args_list[-1][0][0] == "cp.get_file_str"
+
+
+def test_ttp_clear_cache(master_opts):
+    data_to_parse = [{"minion_1": {"ret": " Static hostname: host-1"}}]
+    mock_cmd = mock_salt_cmd(" Static hostname: {{ hostname }}", "abc")
+    with patch.dict(ttp_runner.__opts__, master_opts), patch.dict(
+        ttp_runner.__salt__, {"salt.cmd": mock_cmd}
+    ):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client:
+            mock_client.cmd_iter = MagicMock(side_effect=lambda *a, **kw: iter(data_to_parse))
+            ttp_runner.run(
+                "minion_1", "cmd.run", "hostnamectl", template="salt://ttp/test_template_1.txt"
+            )
+            ret = ttp_runner.clear_cache(template="salt://ttp/test_template_1.txt")
+            assert ret["removed"] == 1
+            mock_cmd.reset_mock()
+            ttp_runner.run(
+                "minion_1", "cmd.run", "hostnamectl", template="salt://ttp/test_template_1.txt"
+            )
+            assert [c[0][0] for c in mock_cmd.call_args_list] == [
+                "cp.hash_file",
+                "cp.get_file_str",
+            ]
+
+
+def test_ttp_run_results_cache(master_opts):
+    ttp_template = """
+<group name="system">
+hostname {{ hostname }}
+</group>
+    """
+    returns = [
+        {"minion_1": {"ret": "hostname minion_1"}},
+        {"minion_2": {"ret": "hostname minion_2"}},
+    ]
+    mock_salt_cmd = MagicMock(return_value=ttp_template)
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": mock_salt_cmd}), patch.dict(
+        ttp_runner.__opts__, master_opts
+    ):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client:
+            mock_client.cmd_iter = MagicMock(side_effect=lambda **kwargs: iter(returns))
+            res = [
+                ttp_runner.run("minion_*", "cmd.run", "hostname", template="salt://ttp/test.txt"),
+                ttp_runner.run(
+                    "minion_*",
+                    "cmd.run",
+                    "hostname",
+                    template="salt://ttp/test.txt",
+                    results_cache=True,
+                ),
+            ]
+            # parsing results of the same text loaded from cache
+            with patch("saltext.ttp.utils.stream.StreamParser.parse_datum") as mock_parse:
+                res.append(
+                    ttp_runner.run(
+                        "minion_*",
+                        "cmd.run",
+                        "hostname",
+                        template="salt://ttp/test.txt",
+                        results_cache=True,
+                    )
+                )
+                mock_parse.assert_not_called()
+        stats = ttp_runner.cache_stats()["results"]
+    assert res[0] == res[1] == res[2]
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+
+
+def test_ttp_run_dedup():
+    ttp_template = """
+<vars>
+hostname = "gethostname"
+</vars>
+<group name="version">
+Cisco IOS Software, Version {{ version }}
+{{ hostname | set(hostname) }}
+</group>
+    """
+    minions = ["minion_1", "minion_2", "minion_3"]
+    returns = [
+        {
+            minion: {
+                "ret": {"out": {"show version": "Cisco IOS Software, Version 15.1"}},
+            }
+        }
+        for minion in minions
+    ]
+    mock_salt_cmd = MagicMock(return_value=ttp_template)
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": mock_salt_cmd}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client, patch(
+            "saltext.ttp.utils.stream.StreamParser.parse_datum",
+            autospec=True,
+            side_effect=ttp_runner.StreamParser.parse_datum,
+        ) as mock_parse:
+            mock_client.cmd_iter = MagicMock(return_value=iter(returns))
+            res = ttp_runner.run(
+                "minion_*", "net.cli", "show version", template="salt://ttp/test.txt", dedup=True
+            )
+    assert mock_parse.call_count == 1
+    assert res == [[{"version": {"hostname": minion, "version": "15.1"}} for minion in minions]]
+
+
+def test_ttp_run_template_with_several_inputs_published_at_once():
+    ttp_template = """
+<input name="sys_host">
+tgt = "minion_*"
+fun = "cmd.run"
+arg = ['hostnamectl']
+</input>
+<input name="version">
+tgt = "minion_*"
+fun = "test.version"
+</input>
+<group name="system" input="sys_host">
+ Static hostname: {{ hostname }}
+</group>
+<group name="version" input="version">
+{{ version }}
+</group>
+    """
+    returns = {
+        "cmd.run": [
+            {"minion_1": {"ret": " Static hostname: host-1"}},
+            {"minion_2": {"ret": " Static hostname: host-2"}},
+        ],
+        "test.version": [{"minion_1": {"ret": "3002"}}],
+    }
+    events = []
+
+    def cmd_iter_no_block(**kwargs):
+        events.append("publish {}".format(kwargs["fun"]))
+        yield None
+        for item in returns[kwargs["fun"]]:
+            events.append("return {}".format(kwargs["fun"]))
+            yield item
+            yield None
+
+    mock_cp_get_file_str = MagicMock(return_value=ttp_template)
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": mock_cp_get_file_str}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client:
+            mock_client.cmd_iter_no_block = cmd_iter_no_block
+            res = ttp_runner.run("salt://ttp/test_template_1.txt")
+            mock_client.cmd_iter.assert_not_called()
+    # all jobs published before any return collected
+    assert events[:2] == ["publish cmd.run", "publish test.version"]
+    assert events.count("return cmd.run") == 2
+    assert res == [
+        [
+            {"system": {"hostname": "host-1"}},
+            {"system": {"hostname": "host-2"}},
+            {"version": {"version": "3002"}},
+        ]
+    ]
+
+
+def test_ttp_run_stream_parsing():
+    ttp_template = """
+<input name="sys_host">
+tgt = "minion_*"
+fun = "cmd.run"
+arg = ['hostnamectl']
+</input>
+<group name="system" input="sys_host">
+ Static hostname: {{ hostname }}
+         Chassis: {{ chassis }}
+</group>
+<output>
+returner = "elasticsearch"
+index = "hosts"
+</output>
+    """
+    data_to_parse = [
+        {"minion_1": {"ret": " Static hostname: host-1\n         Chassis: vm"}},
+        {"minion_2": {"ret": " Static hostname: host-2\n         Chassis: vm"}},
+    ]
+    mock_cp_get_file_str = MagicMock(return_value=ttp_template)
+    # slow delivery still in progress when parsing done
+    mock_document_create = MagicMock(side_effect=lambda **kwargs: time.sleep(0.2) or True)
+    with patch.dict(
+        ttp_runner.__salt__,
+        {
+            "salt.cmd": mock_cp_get_file_str,
+            "elasticsearch.document_create": mock_document_create,
+        },
+    ):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client:
+            mock_client.cmd_iter = MagicMock(side_effect=lambda *a, **kw: iter(data_to_parse))
+            res_stream = ttp_runner.run("salt://ttp/test_template_1.txt", stream=True)
+            assert mock_document_create.call_count == 2
+            res = ttp_runner.run("salt://ttp/test_template_1.txt")
+    assert res_stream == res
+    assert res_stream == [
+        [
+            {"system": {"chassis": "vm", "hostname": "host-1"}},
+            {"system": {"chassis": "vm", "hostname": "host-2"}},
+        ]
+    ]
+
+
+def test_ttp_run_multi_process_parsing():
+    ttp_template = """
+<group name="system">
+ Static hostname: {{ hostname }}
+         Chassis: {{ chassis }}
+</group>
+    """
+    data_to_parse = [
+        {
+            "minion_{}".format(i): {
+                "ret": " Static hostname: host-{}\n         Chassis: vm".format(i)
+            }
+        }
+        for i in range(5)
+    ]
+    mock_cp_get_file_str = MagicMock(return_value=ttp_template)
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": mock_cp_get_file_str}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client:
+            mock_client.cmd_iter = MagicMock(side_effect=lambda *a, **kw: iter(data_to_parse))
+            res_workers = ttp_runner.run(
+                "minion_*", "cmd.run", "hostnamectl", template="salt://ttp/test.txt", workers=2
+            )
+            res = ttp_runner.run(
+                "minion_*", "cmd.run", "hostnamectl", template="salt://ttp/test.txt"
+            )
+    assert res_workers == res
+    assert len(res_workers[0]) == 5
+    assert res_workers[0][4] == {"system": {"chassis": "vm", "hostname": "host-4"}}
+
+
+@pytest.mark.parametrize("batch_size", [2, "40%"])
+def test_ttp_run_batch_size(batch_size):
+    ttp_template = """
+<input name="sys_host">
+tgt = "minion_*"
+fun = "cmd.run"
+arg = ['hostnamectl']
+</input>
+<group name="system" input="sys_host">
+ Static hostname: {{ hostname }}
+</group>
+    """
+    minions = ["minion_{}".format(i) for i in range(5)]
+    published = []
+
+    def cmd_iter(**kwargs):
+        published.append(kwargs["tgt"])
+        assert kwargs["tgt_type"] == "list"
+        for minion in kwargs["tgt"]:
+            yield {minion: {"ret": " Static hostname: {}".format(minion)}}
+
+    mock_ckminions = MagicMock()
+    mock_ckminions.return_value.check_minions.return_value = {"minions": minions, "missing": []}
+    mock_cp_get_file_str = MagicMock(return_value=ttp_template)
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": mock_cp_get_file_str}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client, patch(
+            "salt.utils.minions.CkMinions", mock_ckminions
+        ), patch.object(ttp_runner.time, "sleep") as mock_sleep:
+            mock_client.cmd_iter = cmd_iter
+            res = ttp_runner.run(
+                "salt://ttp/test_template_1.txt", batch_size=batch_size, batch_wait=3
+            )
+    mock_ckminions.return_value.check_minions.assert_called_once_with("minion_*", "glob")
+    assert published == [["minion_0", "minion_1"], ["minion_2", "minion_3"], ["minion_4"]]
+    assert mock_sleep.call_count == 2
+    mock_sleep.assert_called_with(3.0)
+    assert res == [[{"system": {"hostname": minion}} for minion in minions]]
+
+
+def test_ttp_run_dedup_inputs():
+    ttp_template = """
+<input name="config">
+tgt = "minion_*"
+fun = "cmd.run"
+arg = ['show run']
+timeout = 30
+</input>
+<input name="running">
+tgt = "minion_*"
+fun = "cmd.run"
+arg = ['show run']
+kwarg = {}
+</input>
+<input name="other_targets">
+tgt = "minion_1"
+fun = "cmd.run"
+arg = ['show run']
+</input>
+<group name="interfaces" input="config">
+interface {{ interface }}
+</group>
+<group name="hostname" input="running">
+hostname {{ hostname }}
+</group>
+    """
+    returns = {"minion_1": {"ret": "hostname RT-1\ninterface Gi1\n"}}
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": MagicMock(return_value=ttp_template)}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client:
+            mock_client.cmd_iter_no_block = MagicMock(side_effect=lambda **kwargs: iter([returns]))
+            res = ttp_runner.run(
+                "minion_*", "cmd.run", "show run", template="salt://ttp/test_template_1.txt"
+            )
+    # inline command and identical inputs published as a single job per target
+    published = [call.kwargs for call in mock_client.cmd_iter_no_block.call_args_list]
+    assert [job["tgt"] for job in published] == ["minion_*", "minion_1"]
+    assert published[0]["timeout"] == 100
+    # each input still gets the shared output, groups without input match nothing
+    assert res == [
+        [{"interfaces": {"interface": "Gi1"}}, {"hostname": {"hostname": "RT-1"}}, {}, {}]
+    ]
+
+
+def test_ttp_run_nested_templates_inputs():
+    ttp_template = """
+<template name="interfaces">
+<input name="config">
+tgt = "minion_*"
+fun = "cmd.run"
+arg = ['show run']
+</input>
+<group name="interfaces" input="config">
+interface {{ interface }}
+</group>
+</template>
+
+<template name="system">
+<input name="config">
+tgt = "minion_*"
+fun = "cmd.run"
+arg = ['show run']
+</input>
+<group name="hostname" input="config">
+hostname {{ hostname }}
+</group>
+</template>
+    """
+    returns = {"minion_1": {"ret": "hostname RT-1\ninterface Gi1\n"}}
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": MagicMock(return_value=ttp_template)}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client:
+            mock_client.cmd_iter = MagicMock(side_effect=lambda **kwargs: iter([returns]))
+            res = ttp_runner.run(template="salt://ttp/test_template_1.txt")
+    # inputs of nested templates run even though top template has no inputs
+    mock_client.cmd_iter.assert_called_once()
+    assert res == [
+        [{"interfaces": {"interface": "Gi1"}}],
+        [{"hostname": {"hostname": "RT-1"}}],
+    ]
+
+
+def test_ttp_run_async_delivery():
+    ttp_template = """
+<group name="system">
+hostname {{ hostname }}
+</group>
+<output>
+returner = "elasticsearch"
+index = "hosts"
+async_delivery = True
+</output>
+    """
+    mock_document_create = MagicMock(return_value=True)
+    with patch.dict(
+        ttp_runner.__salt__,
+        {
+            "salt.cmd": MagicMock(return_value=ttp_template),
+            "elasticsearch.document_create": mock_document_create,
+        },
+    ):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client:
+            mock_client.cmd_iter.return_value = iter([{"minion_1": {"ret": "hostname RT-1"}}])
+            ttp_runner.run("minion_1", "cmd.run", "hostname", template="salt://ttp/test.txt")
+        stats = ttp_runner.delivery_stats()
+    # runner process exits once run returns, run waits for queued deliveries
+    assert stats["queued"] == 1
+    assert stats["delivered"] == 1
+    assert stats["pending"] == 0
+    mock_document_create.assert_called_once()
+
+
+def test_ttp_run_deadline():
+    ttp_template = """
+<macro>
+def check(data):
+    if data["hostname"] == "minion_1":
+        raise ValueError("unexpected output")
+    return data
+</macro>
+<group name="system" macro="check">
+ Static hostname: {{ hostname }}
+</group>
+    """
+    minions = ["minion_{}".format(i) for i in range(5)]
+    published = []
+
+    def cmd_iter(**kwargs):
+        published.append(kwargs)
+        for minion in minions[:3]:
+            yield {minion: {"ret": " Static hostname: {}".format(minion)}}
+        # minion_3 return received after the deadline still parsed,
+        # minion_4 is not waited for
+        time.sleep(0.5)
+        yield {"minion_3": {"ret": " Static hostname: minion_3"}}
+        yield {"minion_4": {"ret": " Static hostname: minion_4"}}
+
+    mock_ckminions = MagicMock()
+    mock_ckminions.return_value.check_minions.return_value = {"minions": minions, "missing": []}
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": MagicMock(return_value=ttp_template)}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client, patch(
+            "salt.utils.minions.CkMinions", mock_ckminions
+        ):
+            mock_client.cmd_iter = cmd_iter
+            res = ttp_runner.run(
+                "minion_*", "cmd.run", "hostnamectl", template="salt://ttp/test.txt", deadline=0.2
+            )
+    # commands timeout capped by the deadline
+    assert published[0]["timeout"] == 1
+    assert res["results"] == [
+        [
+            {"system": {"hostname": "minion_0"}},
+            {"system": {"hostname": "minion_2"}},
+            {"system": {"hostname": "minion_3"}},
+        ]
+    ]
+    assert list(res["failed"]) == ["minion_1"]
+    assert "unexpected output" in res["failed"]["minion_1"]
+    assert res["slow"] == ["minion_4"]
+
+
+TWO_INPUTS_TEMPLATE = """
+<macro>
+def check(data):
+    if data["version"] == "bad":
+        raise ValueError("unexpected version")
+    return data
+</macro>
+<input name="hostname">
+tgt = "minion_*"
+fun = "cmd.run"
+arg = ['hostnamectl']
+</input>
+<input name="version">
+tgt = "minion_*"
+fun = "cmd.run"
+arg = ['show version']
+</input>
+<group name="system" input="hostname">
+ Static hostname: {{ hostname }}
+</group>
+<group name="software" input="version" macro="check">
+Version {{ version }}
+</group>
+"""
+
+
+def _two_inputs_returns(returns):
+    def cmd_iter_no_block(**kwargs):
+        yield from returns[kwargs["arg"][0]]
+
+    return cmd_iter_no_block
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_ttp_run_deadline_failed_minion_results_discarded(workers):
+    returns = {
+        "hostnamectl": [
+            {"minion_0": {"ret": " Static hostname: minion_0"}},
+            {"minion_1": {"ret": " Static hostname: minion_1"}},
+        ],
+        "show version": [
+            {"minion_0": {"ret": "Version 1"}},
+            {"minion_1": {"ret": "Version bad"}},
+        ],
+    }
+    mock_ckminions = MagicMock()
+    mock_ckminions.return_value.check_minions.return_value = {
+        "minions": ["minion_0", "minion_1"],
+        "missing": [],
+    }
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": MagicMock(return_value=TWO_INPUTS_TEMPLATE)}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client, patch(
+            "salt.utils.minions.CkMinions", mock_ckminions
+        ):
+            mock_client.cmd_iter_no_block = _two_inputs_returns(returns)
+            res = ttp_runner.run(template="salt://ttp/test.txt", deadline=30, workers=workers)
+    # minion_1 hostname parsed before its version failed to parse is discarded
+    assert res["results"] == [
+        [{"system": {"hostname": "minion_0"}}, {"software": {"version": "1"}}]
+    ]
+    assert list(res["failed"]) == ["minion_1"]
+    assert "unexpected version" in res["failed"]["minion_1"]
+    assert res["slow"] == []
+
+
+def test_ttp_run_deadline_slow_per_job():
+    returns = {
+        "hostnamectl": [
+            {"minion_0": {"ret": " Static hostname: minion_0"}},
+            {"minion_1": {"ret": " Static hostname: minion_1"}},
+        ],
+        # minion_1 did not return for the second job
+        "show version": [{"minion_0": {"ret": "Version 1"}}],
+    }
+    mock_ckminions = MagicMock()
+    mock_ckminions.return_value.check_minions.return_value = {
+        "minions": ["minion_0", "minion_1"],
+        "missing": [],
+    }
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": MagicMock(return_value=TWO_INPUTS_TEMPLATE)}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client, patch(
+            "salt.utils.minions.CkMinions", mock_ckminions
+        ):
+            mock_client.cmd_iter_no_block = _two_inputs_returns(returns)
+            res = ttp_runner.run(template="salt://ttp/test.txt", deadline=30)
+    assert res["failed"] == {}
+    assert res["slow"] == ["minion_1"]
+
+
+def test_ttp_run_deadline_batches():
+    ttp_template = """
+<group name="system">
+ Static hostname: {{ hostname }}
+</group>
+    """
+    minions = ["minion_{}".format(i) for i in range(4)]
+
+    def cmd_iter(**kwargs):
+        for minion in kwargs["tgt"]:
+            yield {minion: {"ret": " Static hostname: {}".format(minion)}}
+
+    mock_ckminions = MagicMock()
+    mock_ckminions.return_value.check_minions.side_effect = lambda tgt, tgt_type: {
+        "minions": minions if tgt == "minion_*" else tgt,
+        "missing": [],
+    }
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": MagicMock(return_value=ttp_template)}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client, patch(
+            "salt.utils.minions.CkMinions", mock_ckminions
+        ):
+            mock_client.cmd_iter = MagicMock(side_effect=cmd_iter)
+            # second batch starts after the deadline
+            res = ttp_runner.run(
+                "minion_*",
+                "cmd.run",
+                "hostnamectl",
+                template="salt://ttp/test.txt",
+                deadline=0.5,
+                batch_size=2,
+                batch_wait=1,
+            )
+    assert mock_client.cmd_iter.call_count == 1
+    assert res == {
+        "results": [[{"system": {"hostname": "minion_0"}}, {"system": {"hostname": "minion_1"}}]],
+        "failed": {},
+        "slow": ["minion_2", "minion_3"],
+    }
+
+
+def _mine_net_cli_return(minion_name):
+    return {
+        minion_name: {
+            "ret": {minion_name: {"out": {"show run | inc hostname": "hostname " + minion_name}}}
+        }
+    }
+
+
+@pytest.mark.parametrize(
+    "cached_pillars,expected_publish",
+    [
+        # all minions pillars cached on master - no publish
+        (
+            {
+                "minion_1": {"proxy": {"proxytype": "napalm"}},
+                "minion_2": {"proxy": {"proxytype": "napalm"}},
+            },
+            None,
+        ),
+        # minion_2 pillar not cached - single list targeted publish
+        (
+            {"minion_1": {"proxy": {"proxytype": "napalm"}}, "minion_2": {}},
+            (["minion_2"], "list"),
+        ),
+    ],
+)
+def test_ttp_run_mine_get_proxytype_resolved_in_bulk(cached_pillars, expected_publish):
+    ttp_template = """
+<group name="system">
+hostname {{ hostname }}
+</group>
+    """
+    data_to_parse = [_mine_net_cli_return("minion_1"), _mine_net_cli_return("minion_2")]
+    mock_cp_get_file_str = MagicMock(return_value=ttp_template)
+    mock_pillar_util = MagicMock()
+    mock_pillar_util.return_value.get_minion_pillar.return_value = cached_pillars
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": mock_cp_get_file_str}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client, patch(
+            "salt.utils.master.MasterPillarUtil", mock_pillar_util
+        ):
+            mock_client.cmd_iter = MagicMock(return_value=iter(data_to_parse))
+            mock_client.cmd = MagicMock(
+                return_value={"minion_2": {"proxy": {"proxytype": "napalm"}}}
+            )
+            res = ttp_runner.run(
+                "minion_*", "mine.get", "minion_*", "net.cli", template="salt://ttp/test.txt"
+            )
+    assert mock_pillar_util.call_args[0] == ("minion_*", "glob")
+    if expected_publish:
+        mock_client.cmd.assert_called_once_with(
+            expected_publish[0], "pillar.item", arg=["proxy"], tgt_type=expected_publish[1]
+        )
+    else:
+        mock_client.cmd.assert_not_called()
+    assert res == [[{"system": {"hostname": "minion_1"}}, {"system": {"hostname": "minion_2"}}]]
+
+
+def test_ttp_run_mine_get_proxytype_cached():
+    ttp_template = """
+<group name="system">
+hostname {{ hostname }}
+</group>
+    """
+    mock_pillar_util = MagicMock()
+    # neither minion has pillar cached on master
+    mock_pillar_util.return_value.get_minion_pillar.return_value = {"minion_1": {}, "minion_2": {}}
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": MagicMock(return_value=ttp_template)}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client, patch(
+            "salt.utils.master.MasterPillarUtil", mock_pillar_util
+        ):
+            # minion_2 does not return its pillar
+            mock_client.cmd = MagicMock(
+                return_value={"minion_1": {"proxy": {"proxytype": "napalm"}}}
+            )
+            for _ in range(2):
+                mock_client.cmd_iter = MagicMock(
+                    return_value=iter([_mine_net_cli_return("minion_1")])
+                )
+                res = ttp_runner.run(
+                    "minion_*", "mine.get", "minion_*", "net.cli", template="salt://ttp/test.txt"
+                )
+    # second run uses cached proxy types, including minion_2 cached as having none
+    assert ttp_runner._PROXYTYPES.get({}, mock_client, "minion_2") == ""
+    mock_client.cmd.assert_called_once_with(
+        ["minion_1", "minion_2"], "pillar.item", arg=["proxy"], tgt_type="list"
+    )
+    assert res == [[{"system": {"hostname": "minion_1"}}]]
+
+
+def test_ttp_run_mine_cache_source():
+    ttp_template = """
+<input name="config">
+source = "mine_cache"
+tgt = "minion_*"
+fun = "net.cli"
+</input>
+<group name="system">
+hostname {{ hostname }}
+</group>
+    """
+    mine_data = {
+        "minion_1": {"net.cli": {"out": {"show run | inc hostname": "hostname minion_1"}}},
+        # mine entry stored with ACL
+        "minion_2": {
+            "net.cli": {
+                "__data__": {"out": {"show run | inc hostname": "hostname minion_2"}},
+                "__saltmine_acl__": 1,
+            }
+        },
+        # minion without mine data for this function
+        "minion_3": {"grains.items": {}},
+    }
+    mock_cp_get_file_str = MagicMock(return_value=ttp_template)
+    mock_pillar_util = MagicMock()
+    mock_pillar_util.return_value.get_cached_mine_data.return_value = mine_data
+    mock_pillar_util.return_value.get_minion_pillar.return_value = {
+        minion_name: {"proxy": {"proxytype": "napalm"}} for minion_name in mine_data
+    }
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": mock_cp_get_file_str}):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client, patch(
+            "salt.utils.master.MasterPillarUtil", mock_pillar_util
+        ):
+            res = ttp_runner.run(template="salt://ttp/test.txt")
+    assert mock_pillar_util.call_args[0] == ("minion_*", "glob")
+    mock_client.cmd_iter.assert_not_called()
+    mock_client.cmd_iter_no_block.assert_not_called()
+    mock_client.cmd.assert_not_called()
+    assert res == [[{"system": {"hostname": "minion_1"}}, {"system": {"hostname": "minion_2"}}]]
+
+
+def test_ttp_run_jid():
+    ttp_template = """
+<group name="system">
+hostname {{ hostname }}
+</group>
+    """
+    jid = "20210101123456789012"
+    returns = {
+        minion_name: {
+            "return": {"out": {"show run | inc hostname": "hostname " + minion_name}},
+            "retcode": 0,
+        }
+        for minion_name in ["minion_1", "minion_2"]
+    }
+    mock_mminion = MagicMock()
+    mock_mminion.return_value.returners = {
+        "local_cache.get_load": MagicMock(
+            return_value={"fun": "net.cli", "tgt": "minion_*", "tgt_type": "glob"}
+        ),
+        "local_cache.get_jid": MagicMock(return_value=returns),
+    }
+    mock_cp_get_file_str = MagicMock(return_value=ttp_template)
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": mock_cp_get_file_str}), patch.dict(
+        ttp_runner.__opts__, {"master_job_cache": "local_cache"}
+    ):
+        with patch.object(ttp_runner, "client", MagicMock()) as mock_client, patch(
+            "salt.minion.MasterMinion", mock_mminion
+        ):
+            res = ttp_runner.run_jid(jid, template="salt://ttp/test.txt")
+    mock_mminion.return_value.returners["local_cache.get_jid"].assert_called_once_with(jid)
+    mock_client.cmd_iter.assert_not_called()
+    assert res == [[{"system": {"hostname": "minion_1"}}, {"system": {"hostname": "minion_2"}}]]
+
+
+def test_ttp_run_jid_not_found():
+    mock_mminion = MagicMock()
+    mock_mminion.return_value.returners = {"local_cache.get_load": MagicMock(return_value={})}
+    mock_cp_get_file_str = MagicMock(return_value="hostname {{ hostname }}")
+    with patch.dict(ttp_runner.__salt__, {"salt.cmd": mock_cp_get_file_str}), patch.dict(
+        ttp_runner.__opts__, {"master_job_cache": "local_cache"}
+    ):
+        with patch("salt.minion.MasterMinion", mock_mminion):
+            with pytest.raises(CommandExecutionError):
+                ttp_runner.run_jid("20210101123456789012", template="salt://ttp/test.txt")
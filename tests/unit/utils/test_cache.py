@@ -0,0 +1,82 @@
+"""
+    :codeauthor: Denis Mulyalin <d.mulyalin@gmail.com>
+"""
+from unittest.mock import patch
+
+import pytest
+import salt.config
+from saltext.ttp.utils import cache
+
+
+@pytest.fixture
+def opts(tmp_path):
+    opts = salt.config.master_config(None)
+    opts["cachedir"] = str(tmp_path)
+    return opts
+
+
+def test_make_results_key():
+    prefix = cache.make_results_prefix("hostname {{ hostname }}", {"a": 1})
+    key = cache.make_results_key(prefix, 0, "Default_Input", "hostname RT-1")
+    assert key == cache.make_results_key(prefix, 0, "Default_Input", "hostname RT-1")
+    assert key != cache.make_results_key(prefix, 0, "Default_Input", "hostname RT-2")
+    assert key != cache.make_results_key(prefix, 1, "Default_Input", "hostname RT-1")
+    assert prefix != cache.make_results_prefix("hostname {{ hostname }}", {"a": 2})
+
+
+def test_results_cache_hits_and_misses(opts):
+    results_cache = cache.ResultsCache(opts)
+    assert results_cache.fetch("key_1") is None
+    results_cache.store("key_1", [{"hostname": "RT-1"}])
+    assert results_cache.fetch("key_1") == [{"hostname": "RT-1"}]
+    results_cache.commit()
+    # counters persisted across cache objects
+    stats = cache.ResultsCache(opts).stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["size"] == 1
+
+
+def test_results_cache_ttl(opts):
+    results_cache = cache.ResultsCache(opts, ttl=10)
+    with patch("time.time", return_value=1000):
+        results_cache.store("key_1", [{"hostname": "RT-1"}])
+    with patch("time.time", return_value=1011):
+        assert results_cache.fetch("key_1") is None
+
+
+def test_results_cache_lru_eviction(opts):
+    results_cache = cache.ResultsCache(opts, maxsize=2)
+    updated = {}
+    for index, key in enumerate(["key_1", "key_2", "key_3"]):
+        results_cache.store(key, index)
+        updated[key] = index
+    # key_1 used recently, key_2 least recently used
+    updated["key_1"] = 3
+    with patch.object(results_cache._cache, "updated", side_effect=lambda bank, key: updated[key]):
+        results_cache.commit()
+    assert sorted(results_cache._cache.list(cache.RESULTS_BANK)) == ["key_1", "key_3"]
+    results_cache.flush()
+    assert results_cache.stats()["size"] == 0
+
+
+def test_make_output_key():
+    key = cache.make_output_key("net.cli", ["show run"], {"a": 1, "b": 2})
+    assert key == cache.make_output_key("net.cli", ("show run",), {"b": 2, "a": 1})
+    assert key != cache.make_output_key("net.cli", ["show version"], {"a": 1, "b": 2})
+    assert key != cache.make_output_key("cmd.run", ["show run"], {"a": 1, "b": 2})
+    assert cache.make_output_key("net.cli") == cache.make_output_key("net.cli", [], {})
+
+
+def test_outputs_cache_ttl(opts):
+    outputs_cache = cache.OutputsCache(opts)
+    assert outputs_cache.fetch("key_1", 60) is None
+    with patch("time.time", return_value=1000):
+        outputs_cache.store("key_1", "hostname RT-1")
+    with patch("time.time", return_value=1030):
+        assert outputs_cache.fetch("key_1", 60) == "hostname RT-1"
+        # TTL given by caller, shorter TTL treats the same output as stale
+        assert outputs_cache.fetch("key_1", 10) is None
+    assert outputs_cache.stats() == {"size": 1, "hits": 1, "misses": 2}
+    outputs_cache.flush()
+    assert outputs_cache.stats()["size"] == 0
@@ -0,0 +1,80 @@
+"""
+    :codeauthor: Denis Mulyalin <d.mulyalin@gmail.com>
+"""
+import threading
+from unittest.mock import patch
+
+import pytest
+from saltext.ttp.utils import delivery
+
+
+def test_delivery_queue_delivers_in_worker_thread():
+    contextvars = pytest.importorskip("contextvars")
+    var = contextvars.ContextVar("var", default="unset")
+    delivered = []
+    delivery_queue = delivery.DeliveryQueue()
+
+    def deliver(data, **kwargs):
+        delivered.append((data, kwargs, threading.current_thread().name, var.get()))
+        return {"indexed": 2, "failed": 1}
+
+    var.set("set")
+    delivery_queue.put(deliver, [{"a": 1}], index="test")
+    delivery_queue.put(deliver, [{"a": 2}], index="test")
+    assert delivery_queue.flush(timeout=10) is True
+    # delivered in worker thread within context delivery queued from
+    assert delivered == [
+        ([{"a": 1}], {"index": "test"}, "ttp-delivery", "set"),
+        ([{"a": 2}], {"index": "test"}, "ttp-delivery", "set"),
+    ]
+    stats = delivery_queue.stats()
+    assert stats["queued"] == stats["delivered"] == 2
+    assert stats["pending"] == 0
+    assert stats["totals"] == {"indexed": 4, "failed": 2}
+
+
+def test_delivery_queue_without_contextvars():
+    delivered = []
+    delivery_queue = delivery.DeliveryQueue()
+
+    def deliver(data):
+        delivered.append((data, threading.current_thread().name))
+
+    with patch.object(delivery, "HAS_CONTEXTVARS", False):
+        delivery_queue.put(deliver, [{"a": 1}])
+    assert delivery_queue.flush(timeout=10) is True
+    assert delivered == [([{"a": 1}], "ttp-delivery")]
+    assert delivery_queue.stats()["delivered"] == 1
+
+
+def test_delivery_queue_failed_delivery():
+    delivery_queue = delivery.DeliveryQueue()
+
+    def deliver(data):
+        raise RuntimeError("connection refused")
+
+    delivery_queue.put(deliver, [])
+    assert delivery_queue.flush(timeout=10) is True
+    assert delivery_queue.stats()["failed"] == 1
+
+
+def test_delivery_queue_backpressure():
+    release = threading.Event()
+    delivered = []
+    delivery_queue = delivery.DeliveryQueue(maxsize=1, put_timeout=0.1)
+
+    def deliver(data):
+        if data == "blocked":
+            release.wait(10)
+        delivered.append(data)
+
+    delivery_queue.put(deliver, "blocked")
+    # worker busy with first delivery and queue full, third delivery done inline
+    delivery_queue.put(deliver, "queued")
+    delivery_queue.put(deliver, "inline")
+    assert delivered == ["inline"]
+    assert delivery_queue.flush(timeout=0.1) is False
+    release.set()
+    assert delivery_queue.flush(timeout=10) is True
+    assert delivered == ["inline", "blocked", "queued"]
+    assert delivery_queue.stats()["inline"] == 1
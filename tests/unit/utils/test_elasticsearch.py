@@ -0,0 +1,129 @@
+"""
+    :codeauthor: Denis Mulyalin <d.mulyalin@gmail.com>
+"""
+from unittest.mock import patch
+
+import pytest
+import salt.config
+from saltext.ttp.utils import elasticsearch
+
+
+@pytest.fixture
+def opts():
+    return salt.config.minion_config(None)
+
+
+def test_iter_documents():
+    data = [[{"a": 1}, {"a": 2}, "text"], {"b": 1}]
+    assert list(elasticsearch.iter_documents(data)) == [{"a": 1}, {"a": 2}, {"b": 1}]
+    assert list(elasticsearch.iter_documents({"c": 1})) == [{"c": 1}]
+
+
+@pytest.mark.parametrize(
+    "config,expected",
+    [
+        ({}, "http://127.0.0.1:9200"),
+        ({"hosts": ["10.0.0.1:9200", "10.0.0.2:9200"]}, "http://10.0.0.1:9200"),
+        ({"hosts": ["10.0.0.1:9200"], "use_ssl": True}, "https://10.0.0.1:9200"),
+        ({"url": "https://es.lab:9200/"}, "https://es.lab:9200"),
+    ],
+)
+def test_get_url(config, expected):
+    assert elasticsearch.get_url(config) == expected
+
+
+def test_bulk_indexer_batch_size(elasticsearch_stub, opts):
+    indexer = elasticsearch.BulkIndexer(elasticsearch_stub.url, "arp", batch_size=2, opts=opts)
+    for index in range(5):
+        indexer.add({"ip": "10.0.0.{}".format(index)})
+    assert indexer.close() == {"indexed": 5, "failed": 0, "requests": 3}
+    assert [len(request["docs"]) for request in elasticsearch_stub.requests] == [2, 2, 1]
+    assert elasticsearch_stub.requests[0]["path"] == "/_bulk"
+    assert elasticsearch_stub.requests[0]["actions"][0] == {"index": {"_index": "arp"}}
+
+
+def test_bulk_indexer_max_bytes(elasticsearch_stub, opts):
+    indexer = elasticsearch.BulkIndexer(
+        elasticsearch_stub.url, "arp", doc_type="default", max_bytes=150, opts=opts
+    )
+    for index in range(4):
+        indexer.add({"ip": "10.0.0.{}".format(index)})
+    indexer.close()
+    # each document with its action line is about 70 bytes
+    assert [len(request["docs"]) for request in elasticsearch_stub.requests] == [2, 2]
+    assert elasticsearch_stub.requests[0]["actions"][0] == {
+        "index": {"_index": "arp", "_type": "default"}
+    }
+
+
+def test_bulk_indexer_item_failures(elasticsearch_stub, opts):
+    indexer = elasticsearch.BulkIndexer(elasticsearch_stub.url, "arp", opts=opts)
+    indexer.add({"ip": "10.0.0.1"})
+    indexer.add({"ip": "10.0.0.2", "fail": True})
+    assert indexer.close() == {"indexed": 1, "failed": 1, "requests": 1}
+    assert indexer.failed == [
+        ({"ip": "10.0.0.2", "fail": True}, {"type": "mapper_parsing_exception"})
+    ]
+    # document rejected by mapping is not worth retrying
+    assert indexer.retriable == []
+
+
+def test_bulk_indexer_request_failure_retried(elasticsearch_stub, opts):
+    elasticsearch_stub.status = 503
+    indexer = elasticsearch.BulkIndexer(elasticsearch_stub.url, "arp", retries=2, opts=opts)
+    indexer.add({"ip": "10.0.0.1"})
+    indexer.add({"ip": "10.0.0.2"})
+    with patch("time.sleep") as mock_sleep:
+        assert indexer.close() == {"indexed": 0, "failed": 2, "requests": 3}
+    assert [call[0][0] for call in mock_sleep.call_args_list] == [1.0, 2.0]
+    assert [error for _, error in indexer.failed] == ["HTTP status 503", "HTTP status 503"]
+    assert indexer.retriable == [{"ip": "10.0.0.1"}, {"ip": "10.0.0.2"}]
+
+
+def test_bulk_indexer_client_error_not_retried(elasticsearch_stub, opts):
+    elasticsearch_stub.status = 400
+    indexer = elasticsearch.BulkIndexer(elasticsearch_stub.url, "arp", opts=opts)
+    indexer.add({"ip": "10.0.0.1"})
+    with patch("time.sleep") as mock_sleep:
+        assert indexer.close() == {"indexed": 0, "failed": 1, "requests": 1}
+    mock_sleep.assert_not_called()
+    assert indexer.retriable == []
+
+
+def test_bulk_indexer_unavailable_not_retried(elasticsearch_stub, opts):
+    elasticsearch_stub.status = 503
+    indexer = elasticsearch.BulkIndexer(
+        elasticsearch_stub.url, "arp", batch_size=1, retries=2, opts=opts
+    )
+    with patch("time.sleep") as mock_sleep:
+        for index in range(3):
+            indexer.add({"ip": "10.0.0.{}".format(index)})
+        assert indexer.close() == {"indexed": 0, "failed": 3, "requests": 3}
+    # only the first batch retried, next batches failed without posting them
+    assert [call[0][0] for call in mock_sleep.call_args_list] == [1.0, 2.0]
+    assert indexer.unavailable == "HTTP status 503"
+    assert len(indexer.retriable) == 3
+
+
+def test_replay_records(elasticsearch_stub, opts):
+    records = [
+        {"index": "arp", "doc_type": "default", "document": {"ip": "10.0.0.1"}},
+        {"index": "arp", "doc_type": "default", "document": {"ip": "10.0.0.2", "fail": True}},
+    ]
+    failed = elasticsearch.replay_records(records, {"url": elasticsearch_stub.url}, opts=opts)
+    # legacy document type dropped, rejected document returned with its error
+    assert elasticsearch_stub.requests[0]["actions"] == [{"index": {"_index": "arp"}}] * 2
+    assert failed == [dict(records[1], error={"type": "mapper_parsing_exception"})]
+
+
+def test_replay_records_unavailable(elasticsearch_stub, opts):
+    elasticsearch_stub.status = 503
+    records = [
+        {"index": "arp", "document": {"ip": "10.0.0.1"}},
+        {"index": "mac", "document": {"mac": "00:00:00:00:00:01"}},
+    ]
+    with patch("time.sleep"):
+        failed = elasticsearch.replay_records(records, {"url": elasticsearch_stub.url}, opts=opts)
+    assert failed == records
+    # second index not posted once Elasticsearch found unavailable
+    assert len(elasticsearch_stub.requests) == 4
@@ -0,0 +1,92 @@
+"""
+    :codeauthor: Denis Mulyalin <d.mulyalin@gmail.com>
+"""
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+from saltext.ttp.utils import jobs
+
+
+@pytest.mark.parametrize("batch_size,expected", [(2, 2), ("2", 2), ("50%", 5), ("1%", 1), (0, 1)])
+def test_get_batch_size(batch_size, expected):
+    assert jobs.get_batch_size(batch_size, 10) == expected
+
+
+def test_get_jobs_merges_same_commands():
+    input_load = {
+        "template_1": {
+            "input_1": {"fun": "net.cli", "tgt": "minion_*", "arg": ["show run"], "timeout": 10},
+            "input_2": {"fun": "net.cli", "tgt": "minion_*", "arg": ["show run"], "timeout": 20},
+            "input_3": {"commands": ["show clock"]},
+        },
+        "template_2": {"input_1": {"fun": "net.cli", "tgt": "minion_1", "arg": ["show run"]}},
+    }
+    ret = jobs.get_jobs({"timeout": 5}, input_load)
+    assert ret == [
+        (
+            {"fun": "net.cli", "tgt": "minion_*", "arg": ["show run"], "timeout": 20},
+            [("template_1", "input_1"), ("template_1", "input_2")],
+        ),
+        (
+            {"fun": "net.cli", "tgt": "minion_1", "arg": ["show run"], "timeout": 5},
+            [("template_2", "input_1")],
+        ),
+    ]
+    # template inputs are not modified
+    assert "timeout" not in input_load["template_2"]["input_1"]
+
+
+def test_get_jobs_inline_command():
+    ret = jobs.get_jobs({"timeout": 5}, {"template_1": {}}, args=["minion_1", "cmd.run", "uptime"])
+    assert ret == [
+        (
+            {
+                "tgt": "minion_1",
+                "fun": "cmd.run",
+                "arg": ["uptime"],
+                "kwarg": {},
+                "tgt_type": "glob",
+                "timeout": 5,
+            },
+            [("template_1", "Default_Input")],
+        )
+    ]
+
+
+def test_batch_jobs():
+    targeted = {"minion_*": ["minion_1", "minion_2", "minion_3"], "minion_1": ["minion_1"]}
+    mock_ckminions = MagicMock()
+    mock_ckminions.return_value.check_minions.side_effect = lambda tgt, tgt_type: {
+        "minions": targeted[tgt]
+    }
+    to_batch = [
+        ({"tgt": "minion_*", "fun": "net.cli"}, [("template_1", "input_1")]),
+        ({"tgt": "minion_1", "fun": "net.arp"}, [("template_1", "input_2")]),
+    ]
+    with patch("salt.utils.minions.CkMinions", mock_ckminions):
+        ret = jobs.batch_jobs({}, to_batch, 2)
+    assert ret == [
+        [
+            (
+                {"tgt": ["minion_1", "minion_2"], "tgt_type": "list", "fun": "net.cli"},
+                to_batch[0][1],
+            ),
+            ({"tgt": ["minion_1"], "tgt_type": "list", "fun": "net.arp"}, to_batch[1][1]),
+        ],
+        [({"tgt": ["minion_3"], "tgt_type": "list", "fun": "net.cli"}, to_batch[0][1])],
+    ]
+
+
+def test_proxytype_cache_expires():
+    proxytypes = jobs.ProxytypeCache()
+    mock_client = MagicMock()
+    mock_client.cmd.return_value = {"minion_1": {"proxy": {"proxytype": "napalm"}}}
+    assert proxytypes.get({}, mock_client, "minion_1") == "napalm"
+    assert proxytypes.get({}, mock_client, "minion_1") == "napalm"
+    assert mock_client.cmd.call_count == 1
+    # expired entries queried again
+    assert proxytypes.get({"ttp_proxytype_cache_ttl": -1}, mock_client, "minion_1") == "napalm"
+    assert mock_client.cmd.call_count == 2
+    proxytypes.clear()
+    assert len(proxytypes) == 0
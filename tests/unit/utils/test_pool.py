@@ -0,0 +1,246 @@
+"""
+    :codeauthor: Denis Mulyalin <d.mulyalin@gmail.com>
+"""
+from unittest.mock import patch
+
+import pytest
+import salt.config
+from saltext.ttp.utils import cache
+from saltext.ttp.utils import pool
+
+try:
+    from ttp import ttp
+except ImportError:  # pragma: no cover
+    pass
+
+pytestmark = pytest.mark.skipif(pool.HAS_TTP is False, reason="TTP module required for this test")
+
+TEMPLATE = """
+<macro>
+def add_vendor(data):
+    data["vendor"] = "cisco"
+    return data
+</macro>
+<group name="system" macro="add_vendor">
+hostname {{ hostname }}
+</group>
+<group name="interfaces">
+interface {{ interface }}
+ description {{ description }}
+</group>
+"""
+
+DATA_TEMPLATE = """
+hostname RT-{0}
+interface Eth1/{0}
+ description core-{0}
+"""
+
+DATA = [DATA_TEMPLATE.format(i) for i in range(10)]
+
+
+def test_pool_parser_results_match_ttp_parse():
+    expected_parser = ttp(template=TEMPLATE)
+    parser = ttp(template=TEMPLATE)
+    pool_parser = pool.PoolParser(parser, TEMPLATE, workers=2)
+    for item in DATA:
+        expected_parser.add_input(data=item)
+        pool_parser.add_input(data=item)
+    expected_parser.parse(one=True)
+    pool_parser.finish()
+    assert parser.result() == expected_parser.result()
+    assert parser.result()[0][3] == {
+        "interfaces": {"description": "core-3", "interface": "Eth1/3"},
+        "system": {"hostname": "RT-3", "vendor": "cisco"},
+    }
+
+
+def test_pool_parser_per_template_results():
+    template = """
+<template results="per_template">
+<group name="hosts*">
+hostname {{ hostname }}
+</group>
+</template>
+    """
+    parser = ttp(template=template)
+    pool_parser = pool.PoolParser(parser, template, workers=2)
+    for item in DATA[:3]:
+        pool_parser.add_input(data=item)
+    pool_parser.finish()
+    assert parser.result() == [
+        {"hosts": [{"hostname": "RT-0"}, {"hostname": "RT-1"}, {"hostname": "RT-2"}]}
+    ]
+
+
+def test_pool_parser_results_cache(tmp_path):
+    opts = salt.config.master_config(None)
+    opts["cachedir"] = str(tmp_path)
+    expected_parser = ttp(template=TEMPLATE)
+    for item in DATA:
+        expected_parser.add_input(data=item)
+    expected_parser.parse(one=True)
+    prefix = cache.make_results_prefix(TEMPLATE)
+    # second run loads half of the results from results cache
+    for data in [DATA[:5], DATA]:
+        parser = ttp(template=TEMPLATE)
+        results_cache = cache.ResultsCache(opts)
+        pool_parser = pool.PoolParser(parser, TEMPLATE, 2, results_cache, prefix)
+        for item in data:
+            pool_parser.add_input(data=item)
+        pool_parser.finish()
+        results_cache.commit()
+    assert parser.result() == expected_parser.result()
+    assert results_cache.stats()["hits"] == 5
+
+
+BACKTRACKING_TEMPLATE = """
+<group name="interfaces">
+interface {{ interface | re("(a+)+c") }}
+</group>
+<group name="system">
+hostname {{ hostname }}
+</group>
+"""
+
+BACKTRACKING_DATA = "interface {}\n".format("a" * 40)
+
+
+def test_pool_parser_failed_sources():
+    template = """
+<macro>
+def check(data):
+    if data["hostname"] == "RT-1":
+        raise ValueError("unexpected hostname")
+    return data
+</macro>
+<group name="system" macro="check">
+hostname {{ hostname }}
+</group>
+    """
+    parser = ttp(template=template)
+    pool_parser = pool.PoolParser(parser, template, workers=2, dedup=True)
+    pool_parser.add_input(data="hostname RT-2", source="minion_1")
+    pool_parser.add_input(data="hostname RT-1", source="minion_1")
+    pool_parser.add_input(data="hostname RT-3", source="minion_2")
+    # identical output of another source fails the same way
+    pool_parser.add_input(data="hostname RT-1", source="minion_3")
+    pool_parser.finish()
+    assert parser.result() == [[{"system": {"hostname": "RT-3"}}]]
+    assert sorted(pool_parser.failed) == ["minion_1", "minion_3"]
+    assert "unexpected hostname" in pool_parser.failed["minion_1"]
+
+
+def test_pool_parser_error_without_source():
+    template = """
+<macro>
+def check(data):
+    raise ValueError("unexpected hostname")
+</macro>
+<group name="system" macro="check">
+hostname {{ hostname }}
+</group>
+    """
+    pool_parser = pool.PoolParser(ttp(template=template), template, workers=2)
+    pool_parser.add_input(data="hostname RT-1")
+    with pytest.raises(ValueError, match="unexpected hostname"):
+        pool_parser.finish()
+
+
+def test_isolated_parser_results_match_ttp_parse():
+    expected_parser = ttp(template=TEMPLATE)
+    parser = ttp(template=TEMPLATE)
+    isolated_parser = pool.IsolatedParser(parser, TEMPLATE, timeout=30)
+    for item in DATA:
+        expected_parser.add_input(data=item)
+        isolated_parser.add_input(data=item)
+    expected_parser.parse(one=True)
+    isolated_parser.finish()
+    assert parser.result() == expected_parser.result()
+    assert isolated_parser.errors == []
+
+
+def test_isolated_parser_per_template_results():
+    template = """
+<template results="per_template">
+<group name="hosts*">
+hostname {{ hostname }}
+</group>
+</template>
+    """
+    parser = ttp(template=template)
+    isolated_parser = pool.IsolatedParser(parser, template, timeout=30)
+    for item in DATA[:3]:
+        isolated_parser.add_input(data=item)
+    isolated_parser.finish()
+    assert parser.result() == [
+        {"hosts": [{"hostname": "RT-0"}, {"hostname": "RT-1"}, {"hostname": "RT-2"}]}
+    ]
+
+
+def test_isolated_parser_deadline():
+    parser = ttp(template=BACKTRACKING_TEMPLATE)
+    isolated_parser = pool.IsolatedParser(parser, BACKTRACKING_TEMPLATE, timeout=0.5)
+    isolated_parser.add_input(data=BACKTRACKING_DATA)
+    with pytest.raises(pool.ParseTimeoutError):
+        isolated_parser.finish()
+    assert isolated_parser._process is None
+
+
+def test_isolated_parser_partial_results():
+    parser = ttp(template=BACKTRACKING_TEMPLATE)
+    isolated_parser = pool.IsolatedParser(parser, BACKTRACKING_TEMPLATE, timeout=0.5, partial=True)
+    for item in ["hostname RT-1\n", BACKTRACKING_DATA, "hostname RT-2\n"]:
+        isolated_parser.add_input(data=item)
+    isolated_parser.finish()
+    # data items not parsed by the deadline skipped
+    assert parser.result() == [[{"system": {"hostname": "RT-1"}}]]
+    assert (
+        isolated_parser.errors
+        == [
+            {
+                "template": "_root_template_",
+                "input": "Default_Input",
+                "error": "parsing did not finish within 0.5s deadline",
+            }
+        ]
+        * 2
+    )
+
+
+def test_isolated_parser_worker_exit():
+    template = """
+<macro>
+def crash(data):
+    if data["hostname"] == "RT-0":
+        import os
+        os._exit(3)
+    return data
+</macro>
+<group name="system" macro="crash">
+hostname {{ hostname }}
+</group>
+    """
+    parser = ttp(template=template)
+    isolated_parser = pool.IsolatedParser(parser, template, partial=True)
+    for item in DATA[:2]:
+        isolated_parser.add_input(data=item)
+    isolated_parser.finish()
+    # new worker process started to parse the rest of data items
+    assert parser.result() == [[{"system": {"hostname": "RT-1"}}]]
+    assert isolated_parser.errors == [
+        {
+            "template": "_root_template_",
+            "input": "Default_Input",
+            "error": "worker process exited with code 3",
+        }
+    ]
+
+
+@pytest.mark.skipif(pool.HAS_RESOURCE is False, reason="resource module required for this test")
+def test_init_worker_memory_limit():
+    with patch.object(pool.resource, "setrlimit") as mock_setrlimit, patch.object(
+        pool, "_WORKER", None
+    ):
+        pool._init_worker(TEMPLATE, {}, memory_limit=512)
+    mock_setrlimit.assert_called_once_with(pool.resource.RLIMIT_AS, (536870912, 536870912))
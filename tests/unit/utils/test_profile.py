@@ -0,0 +1,46 @@
+"""
+    :codeauthor: Denis Mulyalin <d.mulyalin@gmail.com>
+"""
+import pstats
+import re
+
+import pytest
+from saltext.ttp.utils import profile
+
+
+def busy(count):
+    return [re.match(r"(\d+)", str(i)) for i in range(count)]
+
+
+def test_profile_call(tmp_path):
+    path = str(tmp_path / "profiles" / "run.prof")
+    result, summary = profile.profile_call(busy, (100,), {}, path, top=5)
+    assert len(result) == 100
+    assert summary["path"] == path
+    assert summary["calls"] > 100
+    assert len(summary["hotspots"]) == 5
+    assert set(summary["hotspots"][0]) == {"function", "calls", "tottime", "cumtime"}
+    tottimes = [item["tottime"] for item in summary["hotspots"]]
+    assert tottimes == sorted(tottimes, reverse=True)
+    # saved statistics can be loaded with pstats
+    assert pstats.Stats(path).total_calls == summary["calls"]
+
+
+def test_profile_call_saves_stats_on_error(tmp_path):
+    path = str(tmp_path / "run.prof")
+    with pytest.raises(TypeError):
+        profile.profile_call(busy, ("a",), {}, path)
+    assert (tmp_path / "run.prof").exists()
+
+
+def test_prune_profiles(tmp_path):
+    for index in range(5):
+        profile.profile_call(busy, (1,), {}, str(tmp_path / "{}.prof".format(index)), keep=3)
+    assert len(list(tmp_path.glob("*.prof"))) == 3
+    assert (tmp_path / "4.prof").exists()
+
+
+def test_get_profile_path():
+    path = profile.get_profile_path({"cachedir": "/var/cache/salt"}, "salt://ttp/intf.txt")
+    assert path.startswith("/var/cache/salt/ttp/profiles/")
+    assert path.endswith(".prof")
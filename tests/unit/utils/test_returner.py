@@ -0,0 +1,72 @@
+"""
+    :codeauthor: Denis Mulyalin <d.mulyalin@gmail.com>
+"""
+from unittest.mock import MagicMock
+
+import pytest
+import salt.config
+import salt.loader
+from saltext.ttp.utils import returner
+
+
+@pytest.fixture
+def opts(tmp_path):
+    opts = salt.config.master_config(None)
+    opts.update({"id": "master", "cachedir": str(tmp_path)})
+    return opts
+
+
+def test_batch_returner_batches(opts):
+    mock_returner = MagicMock()
+    batch = returner.BatchReturner({"test.returner": mock_returner}, "test", "minion_1", opts, 2)
+    for i in range(5):
+        batch.add({"a": i})
+    assert batch.close() == {"returned": 5, "failed": 0, "batches": 3}
+    returns = [call.args[0] for call in mock_returner.call_args_list]
+    assert [ret["return"] for ret in returns] == [
+        [{"a": 0}, {"a": 1}],
+        [{"a": 2}, {"a": 3}],
+        [{"a": 4}],
+    ]
+    assert all(ret["id"] == "minion_1" and ret["fun"] == "ttp.run" for ret in returns)
+    # each batch returned as a separate job
+    assert len({ret["jid"] for ret in returns}) == 3
+
+
+def test_batch_returner_uses_prep_jid(opts):
+    returners = {"test.returner": MagicMock(), "test.prep_jid": MagicMock(return_value="123")}
+    batch = returner.BatchReturner(returners, "test", "minion_1", opts)
+    batch.add({"a": 1})
+    batch.close()
+    returners["test.prep_jid"].assert_called_once_with(nocache=False)
+    assert returners["test.returner"].call_args.args[0]["jid"] == "123"
+
+
+def test_batch_returner_failure(opts):
+    mock_returner = MagicMock(side_effect=[Exception("connection refused"), None])
+    batch = returner.BatchReturner({"test.returner": mock_returner}, "test", "minion_1", opts, 2)
+    for i in range(3):
+        batch.add({"a": i})
+    assert batch.close() == {"returned": 1, "failed": 2, "batches": 1}
+
+
+def test_batch_returner_not_found(opts):
+    batch = returner.BatchReturner({}, "missing", "minion_1", opts)
+    batch.add({"a": 1})
+    assert batch.close() == {"returned": 0, "failed": 1, "batches": 0}
+
+
+def test_batch_return_local_cache(opts):
+    loader = salt.loader.returners(opts, {})
+    returners = {
+        "local_cache.returner": MagicMock(wraps=loader["local_cache.returner"]),
+        "local_cache.prep_jid": loader["local_cache.prep_jid"],
+    }
+    data = [[{"a": 1}, {"a": 2}, {"a": 3}]]
+    stats = returner.batch_return(data, returners, "master", opts, batch_size=2)
+    assert stats == {"returned": 3, "failed": 0, "batches": 2}
+    jids = [call.args[0]["jid"] for call in returners["local_cache.returner"].call_args_list]
+    assert [loader["local_cache.get_jid"](jid)["master"]["return"] for jid in jids] == [
+        [{"a": 1}, {"a": 2}],
+        [{"a": 3}],
+    ]
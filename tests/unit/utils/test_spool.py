@@ -0,0 +1,61 @@
+"""
+    :codeauthor: Denis Mulyalin <d.mulyalin@gmail.com>
+"""
+from unittest.mock import patch
+
+from saltext.ttp.utils import spool
+
+
+def test_spool_append_and_replay(tmp_path):
+    ttp_spool = spool.Spool(str(tmp_path / "ttp" / "spool.jsonl"))
+    assert ttp_spool.append([{"document": {"a": 1}}, {"document": {"a": 2}}]) == 2
+    assert ttp_spool.size() == 2
+    replayed = []
+
+    def deliver(records):
+        replayed.extend(record["document"] for record in records)
+        # second record failed to deliver again
+        return records[1:]
+
+    assert ttp_spool.replay(deliver) == {"replayed": 1, "failed": 1, "expired": 0}
+    assert replayed == [{"a": 1}, {"a": 2}]
+    assert ttp_spool.size() == 1
+    assert ttp_spool.replay(lambda records: []) == {"replayed": 1, "failed": 0, "expired": 0}
+    assert ttp_spool.size() == 0
+
+
+def test_spool_max_bytes(tmp_path):
+    ttp_spool = spool.Spool(str(tmp_path / "spool.jsonl"), max_bytes=150)
+    # each record is about 55 bytes
+    assert ttp_spool.append([{"document": {"a": i}} for i in range(5)]) == 2
+    assert ttp_spool.size() == 2
+
+
+def test_spool_max_age(tmp_path):
+    ttp_spool = spool.Spool(str(tmp_path / "spool.jsonl"), max_age=10)
+    with patch("time.time", return_value=1000):
+        ttp_spool.append([{"document": {"a": 1}}])
+    ttp_spool.append([{"document": {"a": 2}}])
+    replayed = []
+    stats = ttp_spool.replay(lambda records: replayed.extend(records) or [])
+    assert stats == {"replayed": 1, "failed": 0, "expired": 1}
+    assert [record["document"] for record in replayed] == [{"a": 2}]
+
+
+def test_spool_replay_missing_file(tmp_path):
+    ttp_spool = spool.Spool(str(tmp_path / "spool.jsonl"))
+    assert ttp_spool.replay(lambda records: []) == {"replayed": 0, "failed": 0, "expired": 0}
+
+
+def test_spool_replay_keeps_rejected(tmp_path):
+    ttp_spool = spool.Spool(str(tmp_path / "spool.jsonl"))
+    ttp_spool.append([{"document": {"a": 1}}, {"document": {"a": 2}}])
+    # second record rejected, returned with error and kept in the spool
+    stats = ttp_spool.replay(lambda records: [dict(records[1], error="mapping error")])
+    assert stats == {"replayed": 1, "failed": 1, "expired": 0}
+    assert ttp_spool.size() == 1
+    kept = []
+    ttp_spool.replay(lambda records: kept.extend(records) or records)
+    assert [(record["document"], record["error"]) for record in kept] == [
+        ({"a": 2}, "mapping error")
+    ]
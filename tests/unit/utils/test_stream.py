@@ -0,0 +1,149 @@
+"""
+    :codeauthor: Denis Mulyalin <d.mulyalin@gmail.com>
+"""
+from unittest.mock import patch
+
+import pytest
+from saltext.ttp.utils import stream
+
+try:
+    from ttp import ttp
+except ImportError:  # pragma: no cover
+    pass
+
+pytestmark = pytest.mark.skipif(stream.HAS_TTP is False, reason="TTP module required for this test")
+
+DATA = [
+    """
+hostname RT-1
+interface Eth1/1
+ description core-1
+interface Eth1/2
+ description core-2
+    """,
+    """
+hostname RT-2
+interface Eth1/3
+ description core-3
+    """,
+]
+
+
+@pytest.mark.parametrize(
+    "ttp_template",
+    [
+        # per_input results with named and anonymous groups
+        """
+<group name="system">
+hostname {{ hostname }}
+</group>
+<group name="interfaces">
+interface {{ interface }}
+ description {{ description }}
+</group>
+        """,
+        """
+interface {{ interface }}
+ description {{ description }}
+        """,
+        # per_template results
+        """
+<template results="per_template">
+<group name="interfaces">
+interface {{ interface }}
+ description {{ description }}
+</group>
+</template>
+        """,
+        # named inputs and child templates
+        """
+<template name="intf">
+<input name="in_1"/>
+<group name="interfaces" input="in_1">
+interface {{ interface }}
+ description {{ description }}
+</group>
+</template>
+<template name="sys">
+<group name="system">
+hostname {{ hostname }}
+</group>
+</template>
+        """,
+    ],
+)
+def test_stream_parser_results_match_ttp_parse(ttp_template):
+    expected_parser = ttp(template=ttp_template)
+    parser = ttp(template=ttp_template)
+    stream_parser = stream.StreamParser(parser)
+    for item in DATA:
+        for template_name, inputs in expected_parser.get_input_load().items():
+            for input_name in inputs or {"Default_Input": {}}:
+                expected_parser.add_input(
+                    data=item, template_name=template_name, input_name=input_name
+                )
+                stream_parser.add_input(
+                    data=item, template_name=template_name, input_name=input_name
+                )
+    expected_parser.parse(one=True)
+    stream_parser.finish()
+    assert parser.result() == expected_parser.result()
+    assert parser.result(structure="flat_list") == expected_parser.result(structure="flat_list")
+
+
+def test_stream_parser_does_not_keep_input_data():
+    parser = ttp(template="hostname {{ hostname }}")
+    stream_parser = stream.StreamParser(parser)
+    stream_parser.add_input(data=DATA[0])
+    stream_parser.add_input(data=DATA[1])
+    assert parser._templates[0].inputs["Default_Input"].data == []
+    stream_parser.finish()
+    assert parser.result() == [[{"hostname": "RT-1"}, {"hostname": "RT-2"}]]
+
+
+def test_stream_parser_dedup():
+    ttp_template = """
+<vars>
+hostname = "gethostname"
+</vars>
+<group name="interfaces">
+interface {{ interface }}
+ description {{ description }}
+ {{ hostname | set(hostname) }}
+</group>
+    """
+    output = "interface Eth1/1\n description core-1"
+    data = ["\n{0}#show run\n{1}".format(prompt, output) for prompt in ["RT-1", "RT-2", "RT-3"]]
+    data.append("\nRT-4#show run\ninterface Eth1/2\n description core-2")
+    expected_parser = ttp(template=ttp_template)
+    parser = ttp(template=ttp_template)
+    stream_parser = stream.StreamParser(parser, dedup=True)
+    with patch.object(stream_parser, "parse_datum", wraps=stream_parser.parse_datum) as mock_parse:
+        for index, item in enumerate(data):
+            expected_parser.add_input(data=item)
+            stream_parser.add_input(data=item, prompt="RT-{}".format(index + 1))
+        stream_parser.finish()
+    expected_parser.parse(one=True)
+    # RT-1, RT-2 and RT-3 outputs differ by prompt only
+    assert mock_parse.call_count == 2
+    assert parser.result() == expected_parser.result()
+    assert parser.result()[0][2] == {
+        "interfaces": {"description": "core-1", "hostname": "RT-3", "interface": "Eth1/1"}
+    }
+
+
+def test_stream_parser_discard():
+    ttp_template = """
+<group name="system">
+hostname {{ hostname }}
+</group>
+    """
+    parser = ttp(template=ttp_template)
+    stream_parser = stream.StreamParser(parser, dedup=True)
+    stream_parser.add_input(data="hostname RT-1", source="minion_1")
+    stream_parser.add_input(data="hostname RT-2", source="minion_2")
+    # duplicate of discarded source data item still gets results
+    stream_parser.add_input(data="hostname RT-1", source="minion_3")
+    stream_parser.discard("minion_1")
+    stream_parser.finish()
+    assert parser.result() == [[{"system": {"hostname": "RT-2"}}, {"system": {"hostname": "RT-1"}}]]
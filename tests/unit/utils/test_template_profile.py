@@ -0,0 +1,89 @@
+"""
+    :codeauthor: Denis Mulyalin <d.mulyalin@gmail.com>
+"""
+import pytest
+from saltext.ttp.utils import template_profile
+
+try:
+    from ttp import ttp
+
+    HAS_TTP = True
+except ImportError:  # pragma: no cover
+    HAS_TTP = False
+
+requires_ttp = pytest.mark.skipif(HAS_TTP is False, reason="TTP module required for this test")
+
+TEMPLATE = """
+<group name="interfaces">
+interface {{ interface }}
+ description {{ description | ORPHRASE }}
+ vlan {{ vlan | to_int }}
+ <group name="ipv4">
+ ip address {{ ip }} {{ mask }}
+ </group>
+</group>
+"""
+
+DATA = """
+interface Gi1
+ description uplink to core
+ vlan 10
+ ip address 10.0.0.1 255.255.255.0
+interface Gi2
+ vlan 20
+"""
+
+
+@pytest.mark.parametrize(
+    "pattern,expected",
+    [
+        (r"(\S+\s*)+", True),
+        (r"(a+)+b", True),
+        (r"(.*)*", True),
+        (r"(?:x|(a*b?)+)", True),
+        (r"(\S+ {1})+?\S+", False),
+        (r"(\d+\.)+", False),
+        (r"\S+", False),
+        (r"(", False),
+    ],
+)
+def test_has_nested_quantifiers(pattern, expected):
+    assert template_profile.has_nested_quantifiers(pattern) is expected
+
+
+@requires_ttp
+def test_template_profiler():
+    parser = ttp(data=DATA, template=TEMPLATE)
+    report = template_profile.TemplateProfiler(parser).parse()
+    assert {group["group"] for group in report["groups"]} == {"interfaces", "interfaces.ipv4"}
+    groups = {group["group"]: group for group in report["groups"]}
+    regexes = {regex["variables"][0]: regex for regex in groups["interfaces"]["regexes"]}
+    assert regexes["interface"]["action"] == "start"
+    assert regexes["interface"]["matches"] == 2
+    assert regexes["interface"]["bytes_scanned"] >= len(DATA)
+    assert regexes["vlan"]["functions"]["to_int"]["calls"] == 2
+    assert groups["interfaces.ipv4"]["regexes"][0]["variables"] == ["ip", "mask"]
+    assert groups["interfaces.ipv4"]["matches"] == 1
+    times = [group["time"] for group in report["groups"]]
+    assert times == sorted(times, reverse=True)
+    assert report["warnings"] == []
+    # instrumented parser still produces results
+    assert parser.result()[0][0]["interfaces"][0]["vlan"] == 10
+
+
+@requires_ttp
+def test_template_profiler_warnings():
+    template = """
+<group name="interfaces">
+interface {{ interface | re("([a-zA-Z0-9]+ ?)+") }}
+</group>
+"""
+    parser = ttp(data=DATA, template=template)
+    report = template_profile.TemplateProfiler(parser).parse()
+    assert report["warnings"] == [
+        {
+            "group": "interfaces",
+            "regex": report["groups"][0]["regexes"][0]["regex"],
+            "warning": "nested quantifiers, catastrophic backtracking possible",
+        }
+    ]
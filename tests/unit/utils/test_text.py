@@ -0,0 +1,48 @@
+"""
+    :codeauthor: Denis Mulyalin <d.mulyalin@gmail.com>
+"""
+import pytest
+from saltext.ttp.utils import text
+
+
+def test_join_commands_output():
+    commands = {"show clock": "12:00:00", "show version": 15}
+    assert text.join_commands_output("RT-1", commands) == (
+        "\nRT-1#show clock\n12:00:00\nRT-1#show version\n15"
+    )
+
+
+@pytest.mark.parametrize(
+    "run_results,function_name,proxytype,expected",
+    [
+        ({"out": {"show clock": "12:00"}}, "net.cli", None, ["\nminion_1#show clock\n12:00"]),
+        (
+            {"RT-1": {"show clock": "12:00"}, "RT-2": {"show clock": "13:00"}},
+            "nr.cli",
+            None,
+            ["\nRT-1#show clock\n12:00", "\nRT-2#show clock\n13:00"],
+        ),
+        (
+            {"minion_1": {"out": {"show clock": "12:00"}}},
+            "mine.get",
+            "napalm",
+            ["\nminion_1#show clock\n12:00"],
+        ),
+        (
+            {"minion_1": {"RT-1": {"show clock": "12:00"}}},
+            "mine.get",
+            "nornir",
+            ["\nRT-1#show clock\n12:00"],
+        ),
+        ({"minion_1": "12:00"}, "mine.get", None, ["12:00"]),
+        ("12:00", "cmd.run", None, ["12:00"]),
+        ({"key": "value"}, "grains.items", None, [{"key": "value"}]),
+    ],
+)
+def test_get_text_from_run_result(run_results, function_name, proxytype, expected):
+    assert (
+        text.get_text_from_run_result(
+            run_results, "minion_1", function_name=function_name, proxytype=proxytype
+        )
+        == expected
+    )
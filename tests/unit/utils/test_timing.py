@@ -0,0 +1,76 @@
+"""
+    :codeauthor: Denis Mulyalin <d.mulyalin@gmail.com>
+"""
+import threading
+
+from saltext.ttp.utils import timing
+
+
+def test_timer_disabled_records_nothing():
+    timer = timing.Timer()
+    with timer.stage("parse"):
+        pass
+    timer.record_input("_root_template_", "Default_Input", "cmd.run", 1.0, ["text"])
+    assert list(timer.iterate("commands", [1, 2])) == [1, 2]
+    report = timer.report()
+    assert report["stages"] == {}
+    assert report["inputs"] == []
+
+
+def test_timer_stages_and_inputs():
+    timer = timing.Timer(enabled=True)
+    with timer.stage("parse"):
+        sum(range(10000))
+    with timer.stage("parse"):
+        pass
+    assert list(timer.iterate("commands", iter([1, 2, 3]))) == [1, 2, 3]
+    timer.record_input("_root_template_", "in_1", "net.cli", 0.5, ["abc", "de"])
+    timer.record_input("_root_template_", "in_1", "net.cli", 1.5, ["é"])
+    report = timer.report()
+    assert report["stages"]["parse"]["calls"] == 2
+    assert report["stages"]["parse"]["wall"] > 0
+    # one call per item and one call to find out iterator exhausted
+    assert report["stages"]["commands"]["calls"] == 4
+    assert report["inputs"] == [
+        {
+            "template": "_root_template_",
+            "input": "in_1",
+            "function": "net.cli",
+            "returns": 2,
+            "latency": 1.5,
+            "bytes": 7,
+        }
+    ]
+    assert report["input_bytes"] == 7
+
+
+def test_timed_decorator():
+    @timing.timed("returners")
+    def returner(data):
+        return data
+
+    timer = timing.Timer(enabled=True)
+    # outside of timer stage function call not recorded
+    assert returner(1) == 1
+    with timer.stage("parse"):
+        assert returner(2) == 2
+    assert timer.report()["stages"]["returners"]["calls"] == 1
+
+
+def test_timed_decorator_other_thread():
+    @timing.timed("returners")
+    def returner(data):
+        return data
+
+    timer = timing.Timer(enabled=True)
+    with timer.stage("parse"):
+        # stage running in this thread does not time calls made by other threads
+        thread = threading.Thread(target=returner, args=(1,))
+        thread.start()
+        thread.join()
+        with timer.stage("fetch"):
+            pass
+        assert returner(2) == 2
+    stages = timer.report()["stages"]
+    assert stages["returners"]["calls"] == 1
+    assert stages["fetch"]["calls"] == 1